@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import random
+import sys
+import timeit
+
+from storyruntime.processing.Mutations import Mutations
+
+
+class Arguments:
+
+    """
+    Stands in for the story of a mutation, resolving the arguments of the
+    mutation from the plain values in it.
+    """
+
+    @staticmethod
+    def argument_by_name(mutation, name):
+        return mutation['arguments'].get(name)
+
+
+class MutationsBenchmark:
+
+    """
+    Times each list and map mutation through Mutations#mutate, for values
+    of a few sizes. Run it with `python -m bench.Mutations [size ...]`.
+    """
+
+    sizes = (10, 1000, 100000)
+
+    @staticmethod
+    def ints(size):
+        ints = list(range(size))
+        random.Random(size).shuffle(ints)
+        return ints
+
+    @classmethod
+    def cases(cls, size):
+        """
+        :return: (name, operator, arguments, function returning a fresh
+        value) for every benchmarked mutation
+        """
+        ints = cls.ints(size)
+        floats = [i / 7 for i in ints]
+        strings = [str(i) for i in ints]
+        items = dict(zip(strings, ints))
+        last = size - 1
+        return [
+            ('list.index', 'index', {'of': last}, lambda: ints),
+            ('list.length', 'length', {}, lambda: ints),
+            ('list.append', 'append', {'item': 1}, lambda: list(ints)),
+            ('list.prepend', 'prepend', {'item': 1}, lambda: list(ints)),
+            ('list.random', 'random', {}, lambda: ints),
+            ('list.reverse', 'reverse', {}, lambda: list(ints)),
+            ('list.sort[int]', 'sort', {}, lambda: list(ints)),
+            ('list.sort[float]', 'sort', {}, lambda: list(floats)),
+            ('list.sort[string]', 'sort', {}, lambda: list(strings)),
+            ('list.min', 'min', {}, lambda: ints),
+            ('list.max', 'max', {}, lambda: ints),
+            ('list.sum[int]', 'sum', {}, lambda: ints),
+            ('list.sum[float]', 'sum', {}, lambda: floats),
+            ('list.contains', 'contains', {'item': last}, lambda: ints),
+            ('list.unique', 'unique', {}, lambda: list(ints) * 2),
+            ('list.remove', 'remove', {'item': last}, lambda: list(ints)),
+            ('list.replace', 'replace', {'item': last, 'by': 0},
+             lambda: list(ints)),
+            ('map.length', 'length', {}, lambda: items),
+            ('map.keys', 'keys', {}, lambda: items),
+            ('map.values', 'values', {}, lambda: items),
+            ('map.flatten', 'flatten', {}, lambda: items),
+            ('map.get', 'get', {'key': '0', 'default': 0}, lambda: items),
+            ('map.pop', 'pop', {'key': '0'}, lambda: dict(items)),
+            ('map.contains[key]', 'contains', {'key': '0'}, lambda: items),
+            ('map.contains[value]', 'contains', {'value': last},
+             lambda: items)
+        ]
+
+    @classmethod
+    def time(cls, mutation, value_for, number):
+        """
+        :return: The mean time in seconds of one mutation, excluding the
+        time to create the value for it
+        """
+        total = 0
+        for _ in range(number):
+            value = value_for()
+            start = timeit.default_timer()
+            Mutations.mutate(mutation, value, Arguments, None)
+            total += timeit.default_timer() - start
+        return total / number
+
+    @classmethod
+    def run(cls, sizes=sizes, out=sys.stdout):
+        for size in sizes:
+            number = max(3, min(1000, 100000 // size))
+            for name, operator, arguments, value_for in cls.cases(size):
+                mutation = {'mutation': operator, 'arguments': arguments}
+                seconds = cls.time(mutation, value_for, number)
+                out.write(f'{name:<24}{size:>8}{seconds * 1e6:>14.2f} us\n')
+
+
+if __name__ == '__main__':
+    MutationsBenchmark.run(tuple(int(size) for size in sys.argv[1:]) or
+                           MutationsBenchmark.sizes)
@@ -44,6 +44,10 @@ setup(
         'expiringdict==1.1.4',
         'requests==2.21.0'  # Used for structures like CaseInsensitiveDict.
     ],
+    extras_require={
+        # Keeps connections to services alive (see HttpTransport).
+        'curl': ['pycurl==7.43.0.3']
+    },
     classifiers=[
         'Environment :: Console',
         'Intended Audience :: Developers',
@@ -8,18 +8,26 @@ from collections import namedtuple
 
 from requests.structures import CaseInsensitiveDict
 
-from tornado.httpclient import AsyncHTTPClient
-
 from .AppConfig import AppConfig, Forward
 from .Config import Config
+from .ContainerRegistry import ContainerRegistry
 from .Containers import Containers
 from .Exceptions import StoryscriptError
+from .FunctionCache import FunctionCache
+from .HttpTransport import HttpTransport
 from .Logger import Logger
+from .ResponseCache import ResponseCache
+from .ServiceLimiter import ServiceLimiter
+from .SingleFlight import SingleFlight
 from .Story import Story
+from .Synapse import SubscriptionBatch, SubscriptionRegistry, Synapse
 from .Types import StreamingService
+from .compiler import StoryCompiler
 from .constants.ServiceConstants import ServiceConstants
 from .entities.Release import Release
+from .enums.ExecutionEngine import ExecutionEngine
 from .processing import Stories
+from .processing.CodeGenerator import CodeGenerator
 from .processing.Services import Command, Service, Services
 from .utils import Dict
 from .utils.HttpUtils import HttpUtils
@@ -49,6 +57,25 @@ class App:
 
     release: Release
 
+    compiled_stories: dict = None
+    """
+    The compiled trees of all stories (see StoryCompiler), keyed by
+    story name. Stories are compiled just once, when the app is deployed.
+    """
+
+    programs: dict = None
+    """
+    The code generated for stories (see CodeGenerator), keyed by story name,
+    if this app executes stories with ExecutionEngine.CODEGEN. Stories
+    which aren't found here are executed by the Lexicon.
+    """
+
+    function_cache: FunctionCache = None
+    """
+    Memoizes calls of the pure functions of all stories, if this app
+    enables it (in asyncy.yaml).
+    """
+
     def __init__(self, app_data: AppData):
         self._subscriptions = {}
         self.release = app_data.release
@@ -70,6 +97,24 @@ class App:
 
         self.environment = CaseInsensitiveDict(data=self.environment)
         self.stories = release.stories['stories']
+        self.compiled_stories = StoryCompiler.compile_stories(
+            self.stories, self.config.RESOLVER_MODE)
+        self.programs = {}
+        if self.execution_engine() == ExecutionEngine.CODEGEN:
+            self.programs = CodeGenerator.generate_stories(
+                self.stories, self.compiled_stories, self.app_config)
+        self.function_cache = FunctionCache.for_config(
+            self.config, self.app_config, self.app_id)
+        self.containers = ContainerRegistry()
+        self.hedges = None
+        """Hedges of idempotent actions, keyed by (service, command)."""
+        if self.app_config is not None and self.app_config.is_hedge_http():
+            self.hedges = {}
+        self.flights = SingleFlight(self.app_id)
+        self.response_cache = ResponseCache.for_config(self.config,
+                                                       self.app_id)
+        self.limiter = ServiceLimiter(self.app_id, self.app_config)
+        self.subscription_batch = None
         self.entrypoint = release.stories['entrypoint']
         self.services = app_data.services
         self.always_pull_images = release.always_pull_images
@@ -84,6 +129,16 @@ class App:
         }
         self._tmp_dir_created = False
 
+    def execution_engine(self):
+        engine = None
+        if self.app_config is not None:
+            engine = self.app_config.get_execution_engine()
+
+        if engine is None:
+            engine = self.config.EXECUTION_ENGINE
+
+        return engine
+
     def image_pull_policy(self):
         if self.always_pull_images is True:
             return 'Always'
@@ -203,8 +258,16 @@ class App:
         This enables the story to listen to pub/sub,
         register with the gateway, and queue cron jobs.
         """
-        for story_name in self.entrypoint:
-            await Stories.run(self, self.logger, story_name)
+        # The when lines of all stories subscribe at once, once all
+        # stories ran (see SubscriptionBatch).
+        self.subscription_batch = SubscriptionBatch()
+        try:
+            for story_name in self.entrypoint:
+                await Stories.run(self, self.logger, story_name)
+
+            await self.subscription_batch.flush(self)
+        finally:
+            self.subscription_batch = None
 
     def add_subscription(self, sub_id: str,
                          streaming_service: StreamingService,
@@ -219,75 +282,78 @@ class App:
         self._subscriptions.pop(sub_id)
 
     async def clear_subscriptions_synapse(self):
-        url = f'http://{self.config.ASYNCY_SYNAPSE_HOST}:' \
-              f'{self.config.ASYNCY_SYNAPSE_PORT}/clear_all'
+        return await Synapse.clear_all(self.logger, self.config, self.app_id)
+
+    async def unsubscribe_all(self):
+        subs = list(self._subscriptions.values())
+        # Every subscription is with its own service, so they're all
+        # unsubscribed at once, and one failing doesn't stop the others.
+        results = await asyncio.gather(*[
+            self.unsubscribe(sub) for sub in subs
+        ], return_exceptions=True)
+        for sub, result in zip(subs, results):
+            if isinstance(result, BaseException):
+                self.logger.error(f'Failed to unsubscribe {sub}: {result}')
+
+    async def unsubscribe(self, sub: Subscription):
+        assert isinstance(sub, Subscription)
+        assert isinstance(sub.streaming_service, StreamingService)
+        conf = Dict.find(
+            self.services, f'{sub.streaming_service.name}'
+                           f'.{ServiceConstants.config}'
+                           f'.actions.{sub.streaming_service.command}'
+                           f'.events.{sub.event}.http')
+
+        http_conf = conf.get('unsubscribe')
+        if not http_conf:
+            self.logger.debug(f'No unsubscribe call required for {sub}')
+            return
+
+        url = f'http://{sub.streaming_service.hostname}' \
+              f':{http_conf.get("port", conf.get("port", 80))}' \
+              f'{http_conf["path"]}'
+
+        client = HttpTransport.services(url)
+        self.logger.debug(f'Unsubscribing {sub}...')
+
+        method = http_conf.get('method', 'post')
+
         kwargs = {
-            'method': 'POST',
-            'body': json.dumps({
-                'app_id': self.app_id
-            }),
+            'method': method.upper(),
+            'body': json.dumps(sub.payload['sub_body']),
             'headers': {
                 'Content-Type': 'application/json; charset=utf-8'
             }
         }
-        client = AsyncHTTPClient()
+
         response = await HttpUtils.fetch_with_retry(3, self.logger, url,
                                                     client, kwargs)
         if int(response.code / 100) == 2:
-            self.logger.debug(f'Unsubscribed all with Synapse!')
-            return True
+            self.logger.debug(f'Unsubscribed!')
         else:
-            self.logger.error(f'Failed to unsubscribe with Synapse!')
-            return False
-
-    async def unsubscribe_all(self):
-        for sub_id, sub in self._subscriptions.items():
-            assert isinstance(sub, Subscription)
-            assert isinstance(sub.streaming_service, StreamingService)
-            conf = Dict.find(
-                self.services, f'{sub.streaming_service.name}'
-                               f'.{ServiceConstants.config}'
-                               f'.actions.{sub.streaming_service.command}'
-                               f'.events.{sub.event}.http')
-
-            http_conf = conf.get('unsubscribe')
-            if not http_conf:
-                self.logger.debug(f'No unsubscribe call required for {sub}')
-                continue
-
-            url = f'http://{sub.streaming_service.hostname}' \
-                  f':{http_conf.get("port", conf.get("port", 80))}' \
-                  f'{http_conf["path"]}'
-
-            client = AsyncHTTPClient()
-            self.logger.debug(f'Unsubscribing {sub}...')
-
-            method = http_conf.get('method', 'post')
-
-            kwargs = {
-                'method': method.upper(),
-                'body': json.dumps(sub.payload['sub_body']),
-                'headers': {
-                    'Content-Type': 'application/json; charset=utf-8'
-                }
-            }
-
-            response = await HttpUtils.fetch_with_retry(3, self.logger, url,
-                                                        client, kwargs)
-            if int(response.code / 100) == 2:
-                self.logger.debug(f'Unsubscribed!')
-            else:
-                self.logger.error(f'Failed to unsubscribe {sub}!')
+            self.logger.error(f'Failed to unsubscribe {sub}!')
 
     async def destroy(self):
         """
         Unsubscribe from all existing subscriptions,
         and delete the namespace.
+
+        With the bulk protocol of the Synapse, the subscriptions are
+        unsubscribed in bulk, and the SubscriptionRegistry of the app forgets
+        them.
         """
-        try:
-            await self.clear_subscriptions_synapse()
-        except BaseException as e:
-            self.logger.error(f'Error clearing synapse subscriptions: {e}')
+        if self.config.SYNAPSE_BULK_SUBSCRIBE:
+            try:
+                await SubscriptionRegistry.unsubscribe(
+                    self, list(self._subscriptions))
+            except BaseException as e:
+                self.logger.error(
+                    f'Error unsubscribing synapse subscriptions: {e}')
+        else:
+            try:
+                await self.clear_subscriptions_synapse()
+            except BaseException as e:
+                self.logger.error(f'Error clearing synapse subscriptions: {e}')
         try:
             await self.unsubscribe_all()
         except BaseException as e:
@@ -295,4 +361,7 @@ class App:
                 f'Failed to unsubscribe synapse subscriptions: {e}'
             )
 
+        HttpTransport.drop(self.app_id, self.containers.hostnames.values())
+        self.containers.clear()
+        self.response_cache.clear()
         self.cleanup_tmp_dir()
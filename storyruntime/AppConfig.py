@@ -2,19 +2,58 @@
 import typing
 from collections import namedtuple
 
+from .Config import Config
+from .enums.ExecutionEngine import ExecutionEngine
 from .utils.Dict import Dict
 
 Forward = namedtuple('Forward',
                      ['service', 'service_forward_name', 'http_path'])
 
+Limit = namedtuple('Limit', ['concurrency', 'queue', 'timeout', 'adaptive'])
+"""
+How calls to a service are limited: how many may be in flight at once,
+how many may wait for their turn, for how many seconds, and whether the
+concurrency adapts to the latencies of the calls (see ServiceLimit).
+"""
+
 KEY_EXPOSE = 'expose'
 """This is deprecated. It was the previous key for forwards."""
 
 KEY_FORWARDS = 'forwards'
 
+KEY_ENGINE = 'runtime.engine'
+
+KEY_FOR_CONCURRENCY = 'runtime.for.concurrency'
+
+KEY_FOR_LOOPS = 'runtime.for.loops'
+
+KEY_EXECUTE_CONCURRENT = 'runtime.execute.concurrent'
+
+KEY_EXECUTE_UNSAFE = 'runtime.execute.unsafe'
+
+KEY_MEMOIZE_FUNCTIONS = 'runtime.functions.memoize'
+
+KEY_HEDGE_HTTP = 'runtime.http.hedge'
+
+KEY_COALESCE_HTTP = 'runtime.http.coalesce'
+
+KEY_CACHE_HTTP = 'runtime.http.cache'
+
+KEY_SERVICE_LIMITS = 'runtime.http.limits'
+
 
 class AppConfig:
     _expose: typing.List[Forward] = None
+    _engine: ExecutionEngine = None
+    _for_concurrency: int = 1
+    _for_loops: typing.Dict[typing.Tuple[str, str], int] = None
+    _execute_concurrent: bool = False
+    _execute_unsafe: typing.FrozenSet[str] = frozenset()
+    _memoize_functions: bool = False
+    _hedge_http: bool = False
+    _coalesce_http: typing.FrozenSet[str] = frozenset()
+    _cache_http: typing.Dict[typing.Tuple[str, str], float] = None
+    _service_limits: typing.Dict[str, Limit] = None
 
     def __init__(self, raw: dict):
         self._expose = []
@@ -28,5 +67,169 @@ class AppConfig:
             assert e.http_path is not None
             self._expose.append(e)
 
+        engine = Dict.find(raw, KEY_ENGINE)
+        if engine is not None:
+            assert str(engine).upper() in ExecutionEngine.__members__, \
+                f'Unknown engine: {engine}'
+            self._engine = ExecutionEngine[str(engine).upper()]
+
+        self._for_concurrency = self.parse_concurrency(
+            Dict.find(raw, KEY_FOR_CONCURRENCY, 1))
+        self._for_loops = {}
+        for loop in Dict.find(raw, KEY_FOR_LOOPS, []):
+            story = loop.get('story')
+            line = loop.get('line')
+            assert story is not None
+            assert line is not None
+            self._for_loops[(story, str(line))] = self.parse_concurrency(
+                loop.get('concurrency', 1))
+
+        concurrent = Dict.find(raw, KEY_EXECUTE_CONCURRENT, False)
+        assert isinstance(concurrent, bool), \
+            f'Invalid value for {KEY_EXECUTE_CONCURRENT}: {concurrent}'
+        self._execute_concurrent = concurrent
+
+        unsafe = Dict.find(raw, KEY_EXECUTE_UNSAFE, [])
+        assert isinstance(unsafe, list), \
+            f'Invalid value for {KEY_EXECUTE_UNSAFE}: {unsafe}'
+        self._execute_unsafe = frozenset(str(service) for service in unsafe)
+
+        memoize = Dict.find(raw, KEY_MEMOIZE_FUNCTIONS, False)
+        assert isinstance(memoize, bool), \
+            f'Invalid value for {KEY_MEMOIZE_FUNCTIONS}: {memoize}'
+        self._memoize_functions = memoize
+
+        hedge = Dict.find(raw, KEY_HEDGE_HTTP, False)
+        assert isinstance(hedge, bool), \
+            f'Invalid value for {KEY_HEDGE_HTTP}: {hedge}'
+        self._hedge_http = hedge
+
+        coalesce = Dict.find(raw, KEY_COALESCE_HTTP, [])
+        assert isinstance(coalesce, list), \
+            f'Invalid value for {KEY_COALESCE_HTTP}: {coalesce}'
+        self._coalesce_http = frozenset(str(service) for service in coalesce)
+
+        self._cache_http = {}
+        for cache in Dict.find(raw, KEY_CACHE_HTTP, []):
+            service = cache.get('service')
+            ttl = cache.get('ttl')
+            assert service is not None
+            assert isinstance(ttl, (int, float)) and \
+                not isinstance(ttl, bool) and ttl > 0, \
+                f'Invalid ttl for {KEY_CACHE_HTTP}: {ttl}'
+            self._cache_http[(service, cache.get('command'))] = ttl
+
+        self._service_limits = {}
+        for limit in Dict.find(raw, KEY_SERVICE_LIMITS, []):
+            service = limit.get('service')
+            assert service is not None
+            timeout = limit.get('timeout', Config.SERVICE_QUEUE_TIMEOUT)
+            assert isinstance(timeout, (int, float)) and \
+                not isinstance(timeout, bool) and timeout > 0, \
+                f'Invalid timeout for {KEY_SERVICE_LIMITS}: {timeout}'
+            queue = limit.get('queue', Config.SERVICE_QUEUE_SIZE)
+            assert isinstance(queue, int) and \
+                not isinstance(queue, bool) and queue >= 0, \
+                f'Invalid queue for {KEY_SERVICE_LIMITS}: {queue}'
+            adaptive = limit.get('adaptive', False)
+            assert isinstance(adaptive, bool), \
+                f'Invalid value for adaptive: {adaptive}'
+            self._service_limits[service] = Limit(
+                concurrency=self.parse_concurrency(
+                    limit.get('concurrency')),
+                queue=queue, timeout=timeout, adaptive=adaptive)
+
+    @staticmethod
+    def parse_concurrency(concurrency) -> int:
+        assert isinstance(concurrency, int) and concurrency > 0, \
+            f'Invalid concurrency: {concurrency}'
+        return concurrency
+
     def get_expose_config(self):
         return self._expose
+
+    def get_execution_engine(self):
+        """
+        :return: The ExecutionEngine configured for this app (in
+        asyncy.yaml), or None if the app doesn't configure one
+        """
+        return self._engine
+
+    def get_for_concurrency(self, story_name, line_number) -> int:
+        """
+        :return: How many iterations of the for loop at line_number in the
+        story story_name may execute concurrently. This is 1 (all
+        iterations execute sequentially), unless configured otherwise in
+        asyncy.yaml, for all loops of the app (runtime.for.concurrency),
+        or for this loop (runtime.for.loops).
+        """
+        return self._for_loops.get((story_name, line_number),
+                                   self._for_concurrency)
+
+    def is_execute_concurrent(self) -> bool:
+        """
+        :return: True if independent consecutive service calls may execute
+        concurrently (runtime.execute.concurrent in asyncy.yaml, off by
+        default; see StoryCompiler#_index_dataflow). Calls of different
+        services are independent unless they share variables, or one of
+        them is a call of the file, http or log service: services which
+        share state otherwise (such as a database) must be listed in
+        runtime.execute.unsafe
+        """
+        return self._execute_concurrent
+
+    def is_execute_unsafe(self, service, command) -> bool:
+        """
+        :return: True if calls to command of service must always execute in
+        the order of the story, as configured in asyncy.yaml
+        (runtime.execute.unsafe lists either services, or commands as
+        "service.command")
+        """
+        return service in self._execute_unsafe or \
+            f'{service}.{command}' in self._execute_unsafe
+
+    def is_memoize_functions(self) -> bool:
+        """
+        :return: True if calls of pure functions are memoized
+        (runtime.functions.memoize in asyncy.yaml, off by default; see
+        FunctionCache)
+        """
+        return self._memoize_functions
+
+    def is_hedge_http(self) -> bool:
+        """
+        :return: True if slow HTTP calls of idempotent service actions are
+        hedged (runtime.http.hedge in asyncy.yaml, off by default; see
+        Hedge)
+        """
+        return self._hedge_http
+
+    def is_coalesce_http(self, service, command) -> bool:
+        """
+        :return: True if identical concurrent calls to command of service
+        share a single request, as configured in asyncy.yaml
+        (runtime.http.coalesce lists either services, or commands as
+        "service.command"; see SingleFlight)
+        """
+        return service in self._coalesce_http or \
+            f'{service}.{command}' in self._coalesce_http
+
+    def get_cache_ttl(self, service, command):
+        """
+        :return: For how many seconds the outputs of command of service
+        may be cached, as configured in asyncy.yaml (runtime.http.cache
+        lists a ttl for either a service, or a command of it), or None
+        (see ResponseCache)
+        """
+        ttl = self._cache_http.get((service, command))
+        if ttl is None:
+            ttl = self._cache_http.get((service, None))
+
+        return ttl
+
+    def get_service_limit(self, service) -> typing.Optional[Limit]:
+        """
+        :return: How calls to service are limited, as configured in
+        asyncy.yaml (runtime.http.limits), or None if they aren't
+        """
+        return self._service_limits.get(service)
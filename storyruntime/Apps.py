@@ -15,6 +15,7 @@ from .Exceptions import StoryscriptError, TooManyActiveApps, TooManyServices, \
 from .GraphQLAPI import GraphQLAPI
 from .Logger import Logger
 from .ServiceUsage import ServiceUsage
+from .Synapse import SubscriptionRegistry
 from .constants.Events import APP_DEPLOYED, APP_DEPLOY_FAILED, \
     APP_DEPLOY_INITIATED, APP_INSTANCE_DESTROYED, \
     APP_INSTANCE_DESTROY_ERROR, APP_RELOAD_FAILED
@@ -71,6 +72,12 @@ class Apps:
             return
 
         if release.deleted:
+            if config.SYNAPSE_BULK_SUBSCRIBE:
+                # The app may not have been destroyed by this engine
+                # (such as if another one crashed), so nothing may have
+                # unsubscribed it.
+                await SubscriptionRegistry.drop(logger, config, app_id)
+
             await Database.update_release_state(logger, config, app_id,
                                                 release.version,
                                                 ReleaseState.NO_DEPLOY)
@@ -193,6 +200,9 @@ class Apps:
             asyncio.create_task(
                 ServiceUsage.start_metrics_recorder(config, glogger)
             )
+        if config.SYNAPSE_BULK_SUBSCRIBE:
+            await Database.create_subscriptions_table(config)
+
         await cls.reload_apps(config, glogger)
 
     @classmethod
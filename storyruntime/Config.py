@@ -3,6 +3,9 @@ import os
 import socket
 
 from storyruntime.enums.AppEnvironment import AppEnvironment
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
+from storyruntime.enums.LineRecording import LineRecording
+from storyruntime.enums.ResolverMode import ResolverMode
 
 
 class Config:
@@ -29,6 +32,144 @@ class Config:
     APP_ENVIRONMENT = AppEnvironment[
         os.getenv('APP_ENVIRONMENT', 'PRODUCTION')]
 
+    RESOLVER_MODE = ResolverMode[os.getenv('RESOLVER_MODE', 'INTERPRETER')]
+    """
+    How values in stories are resolved. See StoryCompiler#compile.
+    """
+
+    EXECUTION_ENGINE = ExecutionEngine[
+        os.getenv('EXECUTION_ENGINE', 'LEXICON')]
+    """
+    How stories are executed, unless an app configures this itself.
+    See CodeGenerator.
+    """
+
+    LINE_RESULTS = LineRecording[os.getenv('LINE_RESULTS', 'LAST')]
+    """
+    Which executions of lines are recorded. See LineResults.
+    """
+
+    LINE_RESULTS_SIZE = int(os.getenv('LINE_RESULTS_SIZE', '64'))
+    """
+    How many executions of lines are kept (LineRecording.LAST and
+    LineRecording.SAMPLED).
+    """
+
+    LINE_RESULTS_SAMPLE_RATE = int(os.getenv('LINE_RESULTS_SAMPLE_RATE',
+                                             '100'))
+    """
+    One in this many executions of lines is recorded (LineRecording.SAMPLED).
+    """
+
+    LINE_RESULTS_OUTPUTS = os.getenv('LINE_RESULTS_OUTPUTS', 'false') == 'true'
+    """
+    Whether the outputs of lines are recorded too (for debugging).
+    """
+
+    LOGGER_SAMPLE_RATE = int(os.getenv('LOGGER_SAMPLE_RATE', '100'))
+    """
+    One in this many messages of chatter is logged (see
+    Logger#debug_sampled).
+    """
+
+    TIME_SLICE_LEXICON = float(os.getenv('TIME_SLICE_LEXICON', '0.005'))
+    """
+    For how many seconds a story executed by the Lexicon may keep the event
+    loop busy, before it yields to other stories. See Scheduler.
+    """
+
+    TIME_SLICE_CODEGEN = float(os.getenv('TIME_SLICE_CODEGEN', '0.005'))
+    """
+    For how many seconds a story executed by its generated code may keep
+    the event loop busy, before it yields to other stories. See Scheduler.
+    """
+
+    MAX_FRAMES_IN_STACK = int(os.getenv('MAX_FRAMES_IN_STACK', '128'))
+    """
+    How deeply the lines of a story may nest (such as function calls
+    within function calls). The Lexicon keeps the frames of a story on
+    the heap (see Frame), so this bounds the memory a story may use for
+    them, not the stack of the interpreter.
+
+    This counts frames, not bytes: the values a frame holds (such as the
+    arguments of a function call) aren't accounted for, so the memory of
+    a stack is only bounded as far as the values of its frames are.
+    """
+
+    FUNCTION_CACHE_SIZE = int(os.getenv('FUNCTION_CACHE_SIZE', '100000'))
+    """
+    How many values the FunctionCache of an app may hold, if the app
+    memoizes calls of its pure functions.
+    """
+
+    HTTP_CLIENT = os.getenv('HTTP_CLIENT', 'curl')
+    """
+    The AsyncHTTPClient implementation of the pools of HttpTransport:
+    'curl', 'simple', or the import path of an implementation.
+    """
+
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '64'))
+    """
+    How many requests to one service (or other destination of stories)
+    may be in flight at once. See HttpTransport.
+    """
+
+    HTTP_CONTROL_MAX_CONNECTIONS = int(
+        os.getenv('HTTP_CONTROL_MAX_CONNECTIONS', '16'))
+    """
+    How many requests to one destination of the control plane (Kubernetes
+    and the Synapse) may be in flight at once. See HttpTransport.
+    """
+
+    HTTP_MAX_POOLS = int(os.getenv('HTTP_MAX_POOLS', '256'))
+    """
+    How many pools HttpTransport keeps open. Beyond that, the least
+    recently used pools without requests in flight are closed.
+    """
+
+    HTTP_RETRY_BUDGET_RATIO = float(
+        os.getenv('HTTP_RETRY_BUDGET_RATIO', '0.2'))
+    HTTP_RETRY_BUDGET_MIN = int(os.getenv('HTTP_RETRY_BUDGET_MIN', '10'))
+    """
+    Within 10 seconds, retries to one destination may make up this ratio
+    of the requests to it, plus this many. See RetryBudget.
+    """
+
+    HTTP_BREAKER_ERROR_RATE = float(
+        os.getenv('HTTP_BREAKER_ERROR_RATE', '0.5'))
+    HTTP_BREAKER_COOLDOWN = float(os.getenv('HTTP_BREAKER_COOLDOWN', '5'))
+    """
+    Once this ratio of the recent requests to a destination failed, its
+    requests fail fast for this many seconds. See CircuitBreaker.
+    """
+
+    HTTP_HEDGE_MAX_RATE = float(os.getenv('HTTP_HEDGE_MAX_RATE', '0.05'))
+    """
+    At most this ratio of the calls of an action is hedged. See Hedge.
+    """
+
+    HTTP_CACHE_SIZE = int(os.getenv('HTTP_CACHE_SIZE', '16777216'))
+    """
+    How many bytes of service outputs the ResponseCache of an app may hold.
+    """
+
+    SERVICE_QUEUE_SIZE = int(os.getenv('SERVICE_QUEUE_SIZE', '100'))
+    SERVICE_QUEUE_TIMEOUT = float(os.getenv('SERVICE_QUEUE_TIMEOUT', '10'))
+    """
+    How many calls to a service whose concurrency is limited may wait for
+    their turn, and for how many seconds, unless configured otherwise in
+    asyncy.yaml. See ServiceLimit.
+    """
+
+    SYNAPSE_BULK_SUBSCRIBE = os.getenv(
+        'SYNAPSE_BULK_SUBSCRIBE', 'false') == 'true'
+    """
+    Whether the Synapse speaks the bulk protocol (POST /subscribe_bulk and
+    /unsubscribe_bulk). The subscriptions of apps are registered in the
+    app_subscriptions table of Postgres then, which is created at startup.
+    See Synapse and SubscriptionRegistry.
+    """
+
     ENGINE_PORT = None
 
     def __init__(self):
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+
+class ContainerRegistry:
+    """
+    The containers which an app has started (see Containers#start), so
+    that executing a service whose container is up already doesn't ask
+    Postgres for container configs and Kubernetes for the deployment
+    again, on every call.
+
+    App#start_services fills the registry as the app is deployed. It's
+    cleared along with the namespace of the app (see Containers#clean_app)
+    and when the app is destroyed, since the containers are gone then.
+    """
+
+    def __init__(self):
+        self.names = {}
+        """Container names, keyed by (story name, line number, service)."""
+
+        self.hostnames = {}
+        """Hostnames of the started containers, keyed by container name."""
+
+    def name_for(self, story_name, line, service):
+        return self.names.get((story_name, line.get('ln'), service))
+
+    def set_name(self, story_name, line, service, container_name):
+        self.names[(story_name, line.get('ln'), service)] = container_name
+
+    def hostname_for(self, container_name):
+        """
+        :return: The hostname of container_name, or None if it hasn't
+        been started
+        """
+        return self.hostnames.get(container_name)
+
+    def started(self, container_name, hostname):
+        self.hostnames[container_name] = hostname
+
+    def clear(self):
+        self.names.clear()
+        self.hostnames.clear()
@@ -102,6 +102,8 @@ class Containers:
 
     @classmethod
     async def clean_app(cls, app):
+        app.containers.clear()
+
         await Kubernetes.clean_namespace(app)
 
     @classmethod
@@ -126,8 +128,11 @@ class Containers:
 
     @classmethod
     async def get_hostname(cls, story, line, service_alias):
-        container = cls.get_container_name(story.app, story.name, line,
-                                           service_alias)
+        container = cls.container_name_for(story, line, service_alias)
+        hostname = story.app.containers.hostname_for(container)
+        if hostname is not None:
+            return hostname
+
         return Kubernetes.get_hostname(story.app, container)
 
     @classmethod
@@ -163,18 +168,37 @@ class Containers:
         If a container already exists, then it will be reused.
         """
         service = line[LineConstants.service]
-        story.logger.info(f'Starting container {service}')
-        container_name = cls.get_container_name(story.app, story.name,
-                                                line, service)
-        await cls.create_and_start(story.app, line, service, container_name)
-        hostname = await cls.get_hostname(story, line, service)
-
-        ss = StreamingService(name=service, command=line['command'],
-                              container_name=container_name,
-                              hostname=hostname)
-
-        story.logger.info(f'Started container {container_name}')
-        return ss
+        container_name = cls.container_name_for(story, line, service)
+        registry = story.app.containers
+        hostname = registry.hostname_for(container_name)
+        if hostname is None:
+            story.logger.info(f'Starting container {service}')
+            await cls.create_and_start(story.app, line, service,
+                                       container_name)
+            hostname = await cls.get_hostname(story, line, service)
+            registry.started(container_name, hostname)
+
+            story.logger.info(f'Started container {container_name}')
+
+        return StreamingService(name=service, command=line['command'],
+                                container_name=container_name,
+                                hostname=hostname)
+
+    @classmethod
+    def container_name_for(cls, story, line, service):
+        """
+        Returns the name of the container of service for line (see
+        Containers#get_container_name), remembered by the registry of
+        the app.
+        """
+        registry = story.app.containers
+        container_name = registry.name_for(story.name, line, service)
+        if container_name is None:
+            container_name = cls.get_container_name(story.app, story.name,
+                                                    line, service)
+            registry.set_name(story.name, line, service, container_name)
+
+        return container_name
 
     @classmethod
     def format_command(cls, story, line, container_name, command):
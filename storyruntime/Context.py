@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import copy
+from collections import ChainMap
+
+
+class Context(ChainMap):
+    """
+    The context of a story (or of a function call within a story), as a
+    chain of scopes. The first scope is the one which is written to: for a
+    story, this is the context the story was prepared with, and for
+    a function call, it's the frame holding the arguments of the call.
+    The remaining scopes are shared between all contexts of an app (such
+    as the one holding "app", see App#app_context).
+
+    Lookups fall through the scopes. A value which is found in a shared
+    scope is copied into the first scope the first time it's looked up,
+    since the story may modify it (which must neither leak into other
+    stories, nor into other function calls). Values which are never looked
+    up are never copied.
+    """
+
+    private = 1
+    """
+    The number of leading scopes which aren't shared (and are therefore
+    looked up without copying).
+    """
+
+    def __getitem__(self, key):
+        maps = self.maps
+        try:
+            return maps[0][key]
+        except KeyError:
+            pass
+
+        for index in range(1, len(maps)):
+            scope = maps[index]
+            if key in scope:
+                if index < self.private:
+                    return scope[key]
+
+                value = copy.copy(scope[key])
+                maps[0][key] = value
+                return value
+
+        return self.__missing__(key)
+
+
+class ChildContext(Context):
+    """
+    A context layered over another one (its parent), such as the context
+    of a single iteration of a concurrent for loop.
+
+    Lookups fall through to the parent. A value of the parent is deeply
+    copied into the first scope of this context the first time it's looked
+    up, since it may be modified in place (such as by a mutation, or by
+    Dict#set), which mustn't leak into the parent before
+    ChildContext#merge applies the changes of this context to it.
+    """
+
+    def __init__(self, parent: Context):
+        super().__init__({}, *parent.maps)
+        self.parent = parent
+        self.written = set()
+        self.copied = {}
+        """Maps keys to the values of the parent which were copied."""
+
+    def __getitem__(self, key):
+        scope = self.maps[0]
+        try:
+            return scope[key]
+        except KeyError:
+            pass
+
+        value = self.parent[key]
+        if key in self.written:
+            # It was deleted from this context, which merges as a deletion.
+            return copy.deepcopy(value)
+
+        self.copied[key] = value
+        scope[key] = copy.deepcopy(value)
+        return scope[key]
+
+    def __setitem__(self, key, value):
+        self.written.add(key)
+        self.maps[0][key] = value
+
+    def __delitem__(self, key):
+        self.written.add(key)
+        del self.maps[0][key]
+
+    def setdefault(self, key, default=None):
+        scope = self.maps[0]
+        if key not in scope:
+            try:
+                scope[key] = copy.deepcopy(self.parent[key])
+            except KeyError:
+                scope[key] = default
+
+        self.written.add(key)
+        return scope[key]
+
+    def merge(self, exclude=()):
+        """
+        Applies the writes of this context (except those to keys in
+        exclude) to its parent, as well as the values of the parent which
+        were modified in place.
+        """
+        scope = self.maps[0]
+        for key in self.written:
+            if key in exclude:
+                continue
+
+            if key in scope:
+                self.parent[key] = scope[key]
+            elif key in self.parent.maps[0]:
+                del self.parent[key]
+
+        for key, value in self.copied.items():
+            if key in self.written or key in exclude:
+                continue
+
+            if scope[key] != value:
+                self.parent[key] = scope[key]
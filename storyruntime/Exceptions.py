@@ -60,6 +60,13 @@ class TypeValueRuntimeError(StoryscriptRuntimeError):
             f'{type_expected} with `{value}`')
 
 
+class ResolverMismatchError(StoryscriptRuntimeError):
+    def __init__(self, item, expected, actual):
+        super().__init__(
+            message=f'The compiled expression {item} resolved to {actual}, '
+            f'but the Resolver resolved it to {expected}')
+
+
 class InvalidKeywordUsage(StoryscriptError):
     def __init__(self, story, line, keyword):
         super().__init__(message=f'Invalid usage of keyword "{keyword}".',
@@ -168,3 +175,13 @@ class EnvironmentVariableNotFound(StoryscriptError):
             f'Please set it by running '
             f'"$ story config set {service}.{variable}=<value>" '
             f'in your Storyscript app directory', story, line)
+
+
+class ServiceOverloadedError(StoryscriptError):
+    def __init__(self, service, reason, story=None, line=None):
+        self.service = service
+        self.reason = reason
+        super().__init__(
+            f'Too many calls to the service "{service}" are waiting '
+            f'({reason}). Hint: Raise its concurrency limit with '
+            f'runtime.http.limits in asyncy.yaml', story, line)
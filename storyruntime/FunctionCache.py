@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import copy
+from collections import OrderedDict
+
+from . import Metrics
+
+
+class FunctionCache:
+    """
+    Memoizes calls of the pure functions of an app's stories (see
+    StoryCompiler#_index_purity), so that calling such a function again
+    with the same arguments returns the value it returned before, instead
+    of executing the function again.
+
+    Calls are keyed by the story, the function, and the values of the
+    arguments of the call (which are passed by value, see
+    Story#context_for_function_call). Calls with arguments which aren't
+    plain values (such as a regular expression) aren't memoized.
+
+    The cache holds up to a number of values: every str, int, float, bool,
+    None, list and map of the key and the return value of a call counts
+    as one. The least recently used calls are evicted first.
+    """
+
+    def __init__(self, app_id, capacity: int):
+        self.app_id = app_id
+        self.capacity = capacity
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def for_config(cls, config, app_config, app_id):
+        """
+        :return: A FunctionCache, with the capacity configured by config,
+        if app_config enables memoization (None otherwise)
+        """
+        if app_config is None or not app_config.is_memoize_functions():
+            return None
+
+        return cls(app_id, config.FUNCTION_CACHE_SIZE)
+
+    @classmethod
+    def lookup(cls, story, function_line, context):
+        """
+        Looks up the call of function_line with the arguments in context.
+
+        :return: (key, hit, value). The key is None if the call isn't
+        memoized at all. Otherwise, the caller puts the value which the
+        function returns under key (see FunctionCache#put), unless
+        the call is a hit.
+        """
+        cache = story.app.function_cache
+        if cache is None or not getattr(function_line, 'pure', False):
+            return None, False, None
+
+        try:
+            arguments, size = cls.freeze(context)
+        except TypeError:
+            return None, False, None
+
+        key = (story.name, function_line['ln'], arguments)
+        hit, value = cache.get(key)
+        return (key, size), hit, value
+
+    @classmethod
+    def freeze(cls, value):
+        """
+        :return: (A hashable equivalent of value, the number of values
+        in it). Equal values which differ in their type (such as 1, 1.0
+        and True) don't freeze to equal equivalents.
+
+        :raises TypeError: If value isn't a plain value
+        """
+        kind = type(value)
+        if kind in (str, int, float, bool) or value is None:
+            return (kind, value), 1
+
+        if kind is list:
+            items = []
+            size = 1
+            for item in value:
+                item, item_size = cls.freeze(item)
+                items.append(item)
+                size += item_size
+
+            return (list, tuple(items)), size
+
+        if kind is dict:
+            items = []
+            size = 1
+            for k, v in value.items():
+                k, key_size = cls.freeze(k)
+                v, value_size = cls.freeze(v)
+                items.append((k, v))
+                size += key_size + value_size
+
+            return (dict, tuple(items)), size
+
+        raise TypeError(f'Cannot memoize {kind}')
+
+    def get(self, key):
+        """
+        :return: (hit, a copy of the value which the call returned)
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            Metrics.function_cache_misses.labels(app_id=self.app_id).inc()
+            return False, None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        Metrics.function_cache_hits.labels(app_id=self.app_id).inc()
+        return True, copy.deepcopy(entry[0])
+
+    def put(self, key, value):
+        """
+        Stores a copy of value, returned by the call key (as returned by
+        FunctionCache#lookup), evicting the least recently used calls which
+        don't fit anymore.
+        """
+        key, size = key
+        try:
+            size += self.freeze(value)[1]
+        except TypeError:
+            # Only plain values are copied safely.
+            return
+
+        if size > self.capacity:
+            return
+
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= previous[1]
+
+        self.entries[key] = (copy.deepcopy(value), size)
+        self.size += size
+        while self.size > self.capacity:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
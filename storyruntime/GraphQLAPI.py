@@ -4,14 +4,23 @@ import json
 
 import certifi
 
-from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.httpclient import HTTPError
 
 from .Exceptions import ServiceNotFound
+from .HttpTransport import HttpTransport
 from .utils.HttpUtils import HttpUtils
 
 
 class GraphQLAPI:
 
+    url = 'https://api.asyncy.com/graphql'
+
+    max_attempts = 10
+    """
+    How many times a query is sent (each time with the retries of
+    HttpUtils#fetch_with_retry), before deploying the app fails.
+    """
+
     @classmethod
     async def get_by_alias(cls, logger, alias, tag):
         query = """
@@ -28,7 +37,7 @@ class GraphQLAPI:
         }
         """
 
-        client = AsyncHTTPClient()
+        client = HttpTransport.control(cls.url)
         kwargs = {
             'headers': {'Content-Type': 'application/json'},
             'method': 'POST',
@@ -42,7 +51,7 @@ class GraphQLAPI:
             'ca_certs': certifi.where()
         }
 
-        res = await cls._fetch_res_with_infinite_retry(logger, client, kwargs)
+        res = await cls._fetch_res_with_retry(logger, client, kwargs)
 
         graph_result = json.loads(res.body)
 
@@ -79,7 +88,7 @@ class GraphQLAPI:
         }
         """
 
-        client = AsyncHTTPClient()
+        client = HttpTransport.control(cls.url)
 
         kwargs = {
             'headers': {'Content-Type': 'application/json'},
@@ -95,7 +104,7 @@ class GraphQLAPI:
             'ca_certs': certifi.where()
         }
 
-        res = await cls._fetch_res_with_infinite_retry(logger, client, kwargs)
+        res = await cls._fetch_res_with_retry(logger, client, kwargs)
 
         graph_result = json.loads(res.body)
         if len(graph_result['data']['allOwners']['nodes']) == 0 \
@@ -114,23 +123,24 @@ class GraphQLAPI:
         )
 
     @classmethod
-    async def _fetch_res_with_infinite_retry(cls, logger,
-                                             client, kwargs):
-        res = None
-        while res is None:
+    async def _fetch_res_with_retry(cls, logger, client, kwargs):
+        attempts = 0
+        while True:
+            attempts = attempts + 1
             try:
+                # Queries don't change anything, so they're safe to repeat.
                 res = await HttpUtils.fetch_with_retry(
-                    10, logger, 'https://api.asyncy.com/graphql', client,
-                    kwargs)
+                    10, logger, cls.url, client, kwargs, idempotent=True)
+                if res.code == 200:
+                    return res
+
+                error = HTTPError(res.code, message=str(res.error),
+                                  response=res)
             except HTTPError as e:
-                await asyncio.sleep(0.5)
-                logger.debug(f'Retrying GraphQL endpoint; err={str(e)}')
-                continue
+                error = e
 
-            if res.code != 200:
-                await asyncio.sleep(0.5)
-                logger.debug(f'Retrying GraphQL endpoint; status: {res.code}; '
-                             f'error: {res.error}')
-                res = None
+            if attempts >= cls.max_attempts:
+                raise error
 
-        return res
+            logger.debug(f'Retrying GraphQL endpoint; err={str(error)}')
+            await asyncio.sleep(HttpUtils.backoff(attempts))
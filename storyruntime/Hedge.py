@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+
+from . import Metrics
+
+
+class Hedge:
+    """
+    Hedges the calls of one idempotent action of a service (see
+    HttpUtils#fetch_hedged): once a call takes longer than the 95th
+    percentile of the latencies of the recent calls, a backup request is
+    sent, and whichever responds well first wins. This way, a single slow
+    container doesn't show up in the latency of stories.
+
+    At most max_rate of the recent calls are hedged, so that a service
+    which is slow altogether doesn't get twice the requests.
+    """
+
+    window = 200
+    """How many recent calls the latencies and the rate are tracked for."""
+
+    min_samples = 20
+    """How many latencies there are at least before calls are hedged."""
+
+    def __init__(self, app_id, service, max_rate: float):
+        self.app_id = app_id
+        self.service = service
+        self.max_rate = max_rate
+        self.latencies = deque(maxlen=self.window)
+        self.calls = deque(maxlen=self.window)
+        self.hedged = 0
+        self._delay = None
+        self._stale = 0
+
+    @classmethod
+    def for_action(cls, app, service, command):
+        """
+        :return: The Hedge of command of service, if app hedges calls
+        (None otherwise)
+        """
+        hedges = app.hedges
+        if hedges is None:
+            return None
+
+        hedge = hedges.get((service, command))
+        if hedge is None:
+            hedge = cls(app.app_id, service,
+                        app.config.HTTP_HEDGE_MAX_RATE)
+            hedges[(service, command)] = hedge
+
+        return hedge
+
+    def delay(self):
+        """
+        :return: The seconds after which a call is hedged, or None if
+        there aren't enough latencies to tell yet
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+
+        # Sorting on every call would cost more than the percentile moves.
+        if self._delay is None or self._stale >= 10:
+            latencies = sorted(self.latencies)
+            self._delay = latencies[int(0.95 * (len(latencies) - 1))]
+            self._stale = 0
+
+        return self._delay
+
+    def record(self, seconds):
+        """
+        Records the latency of a request which responded.
+        """
+        self.latencies.append(seconds)
+        self._stale += 1
+
+    def called(self, hedged: bool):
+        if len(self.calls) == self.calls.maxlen and self.calls[0]:
+            self.hedged -= 1
+
+        self.calls.append(hedged)
+        if hedged:
+            self.hedged += 1
+            Metrics.http_hedges.labels(app_id=self.app_id,
+                                       service=self.service).inc()
+
+    def allow(self) -> bool:
+        """
+        :return: True if hedging one more call stays within max_rate
+        """
+        return self.hedged + 1 <= self.max_rate * max(len(self.calls), 1)
+
+    def won(self):
+        Metrics.http_hedge_wins.labels(app_id=self.app_id,
+                                       service=self.service).inc()
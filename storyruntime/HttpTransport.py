@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+import weakref
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+from tornado.httpclient import HTTPError
+from tornado.ioloop import IOLoop
+from tornado.util import import_object
+
+from . import Metrics
+from .Config import Config
+
+
+class CircuitOpenError(HTTPError):
+    """
+    Raised instead of calling a destination whose circuit is open.
+    """
+
+    def __init__(self, destination):
+        super().__init__(503, message=f'Circuit open for {destination}')
+        self.destination = destination
+
+
+class CircuitBreaker:
+    """
+    Tracks the outcomes of the recent requests to one destination, and
+    opens once too many of them failed (see HttpUtils#fetch_with_retry):
+    requests then fail fast, instead of piling up on a destination which
+    is down. After a cooldown, the breaker is half open, and lets a single
+    request through: it closes again if that request succeeds, and opens
+    again otherwise.
+
+    How many breakers are in every state is exported as
+    Metrics#http_circuits.
+    """
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    state_names = {
+        CLOSED: 'closed',
+        OPEN: 'open',
+        HALF_OPEN: 'half_open'
+    }
+
+    window = 100
+    """How many recent outcomes the error rate is computed from."""
+
+    min_requests = 20
+    """How many outcomes there are at least before the breaker opens."""
+
+    def __init__(self, kind, destination, error_rate: float,
+                 cooldown: float):
+        self.kind = kind
+        self.destination = destination
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=self.window)
+        self.failures = 0
+        self.state = None
+        self.opened_at = 0
+        self.set_state(self.CLOSED)
+
+    def allow(self) -> bool:
+        """
+        :return: True if a request may be sent to the destination
+        """
+        if self.state == self.CLOSED:
+            return True
+
+        now = time.monotonic()
+        if now - self.opened_at < self.cooldown:
+            return False
+
+        # Let a single request probe the destination. Should that probe
+        # get lost (such as when its story is cancelled), the next one is
+        # let through once another cooldown passed.
+        self.opened_at = now
+        self.set_state(self.HALF_OPEN)
+        return True
+
+    def record(self, ok: bool):
+        if self.state == self.HALF_OPEN:
+            if ok:
+                self.outcomes.clear()
+                self.failures = 0
+                self.set_state(self.CLOSED)
+            else:
+                self.open()
+            return
+
+        if len(self.outcomes) == self.outcomes.maxlen and \
+                not self.outcomes[0]:
+            self.failures -= 1
+
+        self.outcomes.append(ok)
+        if not ok:
+            self.failures += 1
+
+        if self.state == self.CLOSED and \
+                len(self.outcomes) >= self.min_requests and \
+                self.failures >= self.error_rate * len(self.outcomes):
+            self.open()
+
+    def open(self):
+        self.opened_at = time.monotonic()
+        self.set_state(self.OPEN)
+
+    def set_state(self, state):
+        if state == self.state:
+            return
+
+        if self.state is not None:
+            Metrics.http_circuits.labels(
+                pool=self.kind, state=self.state_names[self.state]).dec()
+
+        self.state = state
+        if state is not None:
+            Metrics.http_circuits.labels(
+                pool=self.kind, state=self.state_names[state]).inc()
+
+    def discard(self):
+        """
+        Stops counting the breaker, once its pool is closed.
+        """
+        self.set_state(None)
+
+
+class RetryBudget:
+    """
+    Bounds the retries to one destination: within any period of ttl
+    seconds, retries may make up to ratio of the requests, plus a few
+    (minimum) to let rarely used destinations retry at all. When a
+    destination fails, the retries of everything calling it don't
+    multiply the load on it.
+    """
+
+    ttl = 10
+
+    def __init__(self, ratio: float, minimum: int):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.requests = deque()
+        self.retries = deque()
+
+    def expire(self, events, now):
+        while len(events) > 0 and now - events[0] > self.ttl:
+            events.popleft()
+
+    def deposit(self):
+        """
+        Records a request (including the first attempt of every call).
+        """
+        now = time.monotonic()
+        self.expire(self.requests, now)
+        self.requests.append(now)
+
+    def withdraw(self) -> bool:
+        """
+        :return: True if a retry fits the budget (and records it)
+        """
+        now = time.monotonic()
+        self.expire(self.requests, now)
+        self.expire(self.retries, now)
+        if len(self.retries) >= \
+                self.minimum + self.ratio * len(self.requests):
+            return False
+
+        self.retries.append(now)
+        return True
+
+
+class HttpPool:
+    """
+    The connections to one destination (scheme, host and port) for one
+    kind of traffic, and possibly one app (see HttpTransport). At most
+    max_connections requests are in flight at once; requests beyond that
+    wait for their turn, and the time they waited is recorded (see
+    Metrics#http_queue_wait_seconds).
+
+    Every pool has a CircuitBreaker and a RetryBudget of its own for its
+    destination, which HttpUtils#fetch_with_retry honours.
+
+    HttpPool#fetch works just like AsyncHTTPClient#fetch, so a pool is
+    passed to HttpUtils#fetch_with_retry in place of a client.
+    """
+
+    def __init__(self, kind, destination, client, max_connections: int,
+                 app_id=None):
+        self.kind = kind
+        self.destination = destination
+        self.app_id = app_id
+        self.client = client
+        self.max_connections = max_connections
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.in_flight = 0
+        """How many requests are in flight or waiting for their turn."""
+        self.breaker = CircuitBreaker(kind, destination,
+                                      Config.HTTP_BREAKER_ERROR_RATE,
+                                      Config.HTTP_BREAKER_COOLDOWN)
+        self.budget = RetryBudget(Config.HTTP_RETRY_BUDGET_RATIO,
+                                  Config.HTTP_RETRY_BUDGET_MIN)
+
+    async def fetch(self, request, **kwargs):
+        start = time.monotonic()
+        self.in_flight += 1
+        try:
+            async with self.semaphore:
+                Metrics.http_queue_wait_seconds.labels(pool=self.kind) \
+                    .observe(time.monotonic() - start)
+                return await self.client.fetch(request, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    def close(self):
+        self.breaker.discard()
+        self.client.close()
+
+
+class HttpTransport:
+    """
+    Pools of HTTP connections, one per destination and kind of traffic.
+
+    Tornado's AsyncHTTPClient() is shared by everything on an IOLoop, and
+    queues all requests behind its 10 slots. Instead, calls to services
+    go through HttpTransport#services, and calls to the control plane
+    (Kubernetes and the Synapse) through HttpTransport#control, so that
+    neither a busy service nor a busy app delays the others.
+
+    Services run in the containers of one app, but destinations outside
+    of the cluster (such as the url of an http fetch) are called by any
+    app. Calls to those get a pool for every app, so that one app which
+    calls a destination too often (or wrongly) doesn't open its circuit,
+    nor exhaust its retry budget, for all the other apps.
+
+    Each pool has its own client, of the class configured by
+    Config.HTTP_CLIENT: 'curl' (which keeps connections alive, and falls
+    back to 'simple' if pycurl isn't installed), 'simple', or the import
+    path of any other AsyncHTTPClient implementation.
+
+    Destinations come and go with the containers of apps, so at most
+    Config.HTTP_MAX_POOLS pools are kept, and the least recently used
+    ones are closed beyond that (see HttpTransport#evict).
+    """
+
+    SERVICES = 'services'
+    CONTROL = 'control'
+
+    pools = weakref.WeakKeyDictionary()
+    """Pools keyed by (kind, destination, app_id), for every IOLoop, from
+    the least recently used to the most recently used."""
+
+    client_classes = {
+        'curl': 'tornado.curl_httpclient.CurlAsyncHTTPClient',
+        'simple': 'tornado.simple_httpclient.SimpleAsyncHTTPClient'
+    }
+
+    @classmethod
+    def services(cls, url, app_id=None) -> HttpPool:
+        """
+        :return: The pool for calls to services (and other destinations
+        of stories) at url
+        :param app_id: The app calling url, if url is outside of the
+        cluster (None for the containers of apps)
+        """
+        return cls.pool(cls.SERVICES, url, app_id)
+
+    @classmethod
+    def control(cls, url) -> HttpPool:
+        """
+        :return: The pool for calls to the control plane at url
+        """
+        return cls.pool(cls.CONTROL, url)
+
+    @classmethod
+    def pool(cls, kind, url, app_id=None) -> HttpPool:
+        io_loop = IOLoop.current()
+        pools = cls.pools.get(io_loop)
+        if pools is None:
+            pools = OrderedDict()
+            cls.pools[io_loop] = pools
+
+        parts = urlsplit(url)
+        destination = f'{parts.scheme}://{parts.netloc}'
+        key = (kind, destination, app_id)
+        pool = pools.get(key)
+        if pool is None:
+            max_connections = cls.max_connections(kind)
+            client = cls.client_class()(force_instance=True,
+                                        max_clients=max_connections)
+            pool = HttpPool(kind, destination, client, max_connections,
+                            app_id)
+            pools[key] = pool
+            cls.evict(pools)
+        else:
+            pools.move_to_end(key)
+
+        return pool
+
+    @classmethod
+    def drop(cls, app_id, hostnames):
+        """
+        Closes the pools of app_id, and those to the containers at
+        hostnames, once the app is destroyed. Pools with requests in
+        flight are left to HttpTransport#evict.
+        """
+        pools = cls.pools.get(IOLoop.current())
+        if pools is None:
+            return
+
+        hostnames = set(hostnames)
+        for key, pool in list(pools.items()):
+            if pool.in_flight > 0:
+                continue
+
+            if pool.app_id == app_id or \
+                    urlsplit(pool.destination).hostname in hostnames:
+                del pools[key]
+                pool.close()
+
+    @classmethod
+    def evict(cls, pools):
+        """
+        Closes the least recently used pools beyond Config.HTTP_MAX_POOLS.
+        Pools with requests in flight are kept, so that closing their
+        client doesn't fail those requests.
+        """
+        excess = len(pools) - Config.HTTP_MAX_POOLS
+        for key, pool in list(pools.items()):
+            if excess <= 0:
+                break
+
+            if pool.in_flight == 0:
+                del pools[key]
+                pool.close()
+                excess -= 1
+
+    @classmethod
+    def max_connections(cls, kind) -> int:
+        if kind == cls.CONTROL:
+            return Config.HTTP_CONTROL_MAX_CONNECTIONS
+
+        return Config.HTTP_MAX_CONNECTIONS
+
+    @classmethod
+    def client_class(cls):
+        name = Config.HTTP_CLIENT
+        try:
+            return import_object(cls.client_classes.get(name, name))
+        except ImportError:
+            if name != 'curl':
+                raise
+
+            # pycurl is optional.
+            return import_object(cls.client_classes['simple'])
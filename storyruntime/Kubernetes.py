@@ -8,11 +8,12 @@ import typing
 import urllib.parse
 from asyncio import TimeoutError
 
-from tornado.httpclient import AsyncHTTPClient, HTTPResponse
+from tornado.httpclient import HTTPResponse
 
 from . import AppConfig
 from .AppConfig import Forward
 from .Exceptions import K8sError
+from .HttpTransport import HttpTransport
 from .constants.ServiceConstants import ServiceConstants
 from .db.Database import Database
 from .entities.ContainerConfig import ContainerConfig, ContainerConfigs
@@ -162,10 +163,12 @@ class Kubernetes:
             if method == 'get':  # Default value.
                 kwargs['method'] = 'POST'
 
-        client = AsyncHTTPClient()
+        url = f'https://{config.CLUSTER_HOST}{path}'
+        # Resources are named by their path or their payload, so repeating
+        # a request which creates one doesn't create it twice.
         return await HttpUtils.fetch_with_retry(
-            3, logger, f'https://{config.CLUSTER_HOST}{path}',
-            client, kwargs)
+            3, logger, url, HttpTransport.control(url), kwargs,
+            idempotent=True)
 
     @classmethod
     async def remove_volume(cls, app, name):
@@ -486,6 +489,32 @@ class Kubernetes:
                         f'Failed to pull image {container_status["image"]}'
                     )
 
+    @classmethod
+    async def get_container_id(cls, app, container_name):
+        """
+        :return: The ID of the running container of container_name, which
+        changes whenever the container restarts or its pod is recreated,
+        or None if it isn't running (on exactly one pod)
+        """
+        prefix = cls._get_api_path_prefix('pods')
+        qs = urllib.parse.urlencode({
+            'labelSelector': f'app={container_name}'
+        })
+        res = await cls.make_k8s_call(app.config, app.logger,
+                                      f'{prefix}/{app.app_id}/pods?{qs}')
+        cls.raise_if_not_2xx(res)
+        body = json.loads(res.body)
+        container_ids = []
+        for pod in body['items']:
+            for container_status in pod['status'].get('containerStatuses', []):
+                if Dict.find(container_status, 'state.running') is not None:
+                    container_ids.append(container_status.get('containerID'))
+
+        if len(container_ids) != 1:
+            return None
+
+        return container_ids[0]
+
     @classmethod
     def get_liveness_probe(cls, app, service: str):
         """
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+from array import array
+from collections.abc import Mapping
+
+from .Config import Config
+from .enums.LineRecording import LineRecording
+
+
+class LineResults(Mapping):
+    """
+    Records when lines of a story started and ended (and optionally, what
+    they output), as configured by LineRecording:
+    - OFF: nothing is recorded
+    - LAST: the last `size` executions of lines, in a ring buffer
+    - SAMPLED: one in every `sample_rate` executions of lines, of which
+      the last `size` are kept
+    - FULL: the last execution of every line
+
+    Timings are kept in arrays of floats. Outputs are only kept if
+    `outputs` is True (for debugging), since they may be arbitrarily large
+    (such as the response of a service).
+
+    This maps line numbers to their most recent recorded execution, as
+    {'start': ..., 'end': ..., 'output': ...} ('end' is missing if the line
+    hasn't ended, or doesn't end, and 'output' is missing unless outputs
+    are kept).
+    """
+
+    def __init__(self, mode=LineRecording.LAST, size=64, sample_rate=100,
+                 outputs=False):
+        assert size > 0
+        assert sample_rate > 0
+        self.mode = mode
+        self.size = size
+        self.sample_rate = sample_rate
+        self._lines = []
+        self._starts = array('d')
+        self._ends = array('d')
+        self._outputs = [] if outputs else None
+        self._slots = {}
+        """
+        Maps line numbers to the slot of their most recent recorded
+        execution, in the order of those executions (in the order of their
+        first one, with LineRecording.FULL).
+        """
+        self._pending = {}
+        """Maps line numbers to the execution which hasn't ended yet."""
+        self._executions = 0
+        self._recorded = 0
+
+    @classmethod
+    def for_config(cls, config):
+        """
+        :return: LineResults, as configured by config (falling back to the
+        defaults of Config for anything config doesn't specify)
+        """
+        mode = getattr(config, 'LINE_RESULTS', None)
+        if not isinstance(mode, LineRecording):
+            mode = Config.LINE_RESULTS
+
+        size = getattr(config, 'LINE_RESULTS_SIZE', None)
+        if not isinstance(size, int):
+            size = Config.LINE_RESULTS_SIZE
+
+        sample_rate = getattr(config, 'LINE_RESULTS_SAMPLE_RATE', None)
+        if not isinstance(sample_rate, int):
+            sample_rate = Config.LINE_RESULTS_SAMPLE_RATE
+
+        outputs = getattr(config, 'LINE_RESULTS_OUTPUTS', None)
+        if not isinstance(outputs, bool):
+            outputs = Config.LINE_RESULTS_OUTPUTS
+
+        return cls(mode, size, sample_rate, outputs)
+
+    def start(self, line_number):
+        mode = self.mode
+        if mode == LineRecording.OFF:
+            return
+
+        if mode == LineRecording.SAMPLED:
+            self._executions += 1
+            if (self._executions - 1) % self.sample_rate != 0:
+                # An earlier execution of this line won't end anymore.
+                self._pending.pop(line_number, None)
+                return
+
+        if mode == LineRecording.FULL:
+            execution = self._slots.get(line_number)
+            if execution is None:
+                execution = len(self._lines)
+                self._slots[line_number] = execution
+        else:
+            execution = self._recorded
+            slot = self._slot(execution)
+            if slot < len(self._lines):
+                overwritten = self._lines[slot]
+                if self._slots.get(overwritten) == slot:
+                    del self._slots[overwritten]
+
+            self._slots.pop(line_number, None)
+            self._slots[line_number] = slot
+
+        self._recorded += 1
+        slot = self._slot(execution)
+        if slot == len(self._lines):
+            self._lines.append(line_number)
+            self._starts.append(time.time())
+            self._ends.append(math.nan)
+            if self._outputs is not None:
+                self._outputs.append(None)
+        else:
+            self._lines[slot] = line_number
+            self._starts[slot] = time.time()
+            self._ends[slot] = math.nan
+            if self._outputs is not None:
+                self._outputs[slot] = None
+
+        self._pending[line_number] = execution
+
+    def end(self, line_number, output=None):
+        execution = self._pending.pop(line_number, None)
+        if execution is None:
+            return
+
+        if self.mode != LineRecording.FULL and \
+                self._recorded - execution > self.size:
+            # Overwritten by executions which started later.
+            return
+
+        slot = self._slot(execution)
+        self._ends[slot] = time.time()
+        if self._outputs is not None:
+            self._outputs[slot] = output
+
+    def executions(self):
+        """
+        :return: The recorded executions, oldest first, as tuples of
+        (line number, start, end, output). end is None if the line hasn't
+        ended, and output is None unless outputs are kept.
+        """
+        for slot in self._ordered_slots():
+            end = self._ends[slot]
+            output = None
+            if self._outputs is not None:
+                output = self._outputs[slot]
+
+            yield (self._lines[slot], self._starts[slot],
+                   None if math.isnan(end) else end, output)
+
+    def _slot(self, execution):
+        if self.mode == LineRecording.FULL:
+            return execution
+
+        return execution % self.size
+
+    def _ordered_slots(self):
+        if self.mode == LineRecording.FULL:
+            return range(len(self._lines))
+
+        first = max(0, self._recorded - self.size)
+        return (self._slot(e) for e in range(first, self._recorded))
+
+    def __getitem__(self, line_number):
+        slot = self._slots[line_number]
+        result = {'start': self._starts[slot]}
+        if not math.isnan(self._ends[slot]):
+            result['end'] = self._ends[slot]
+
+        if self._outputs is not None:
+            result['output'] = self._outputs[slot]
+
+        return result
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
@@ -3,10 +3,12 @@ import json
 import os
 import traceback
 from distutils.util import strtobool
-from logging import Formatter, LoggerAdapter, StreamHandler, getLevelName
+from logging import DEBUG, Formatter, INFO, LoggerAdapter, StreamHandler, \
+    WARNING, getLevelName
 
 from frustum import Frustum
 
+from .Config import Config
 from .Exceptions import StoryscriptError
 
 log_json = strtobool(os.getenv('LOG_FORMAT_JSON', 'False'))
@@ -84,6 +86,10 @@ class Logger:
 
     def __init__(self, config):
         self.frustum = Frustum(config.LOGGER_NAME, config.LOGGER_LEVEL)
+        self.sample_rate = config.LOGGER_SAMPLE_RATE
+        if not isinstance(self.sample_rate, int) or self.sample_rate < 1:
+            self.sample_rate = Config.LOGGER_SAMPLE_RATE
+        self.sampled = 0
 
     def adapter(self, app_id, version):
         return Adapter(self.frustum.logger,
@@ -109,14 +115,47 @@ class Logger:
     def log(self, event, *args):
         self.frustum.log(event, *args)
 
-    def info(self, message):
-        getattr(self.frustum.logger, 'info')(message)
+    def enabled(self, level) -> bool:
+        return self.frustum.logger.isEnabledFor(level)
 
-    def debug(self, message):
-        getattr(self.frustum.logger, 'debug')(message)
+    @staticmethod
+    def format(message, args):
+        """
+        Formats args into message (see str.format). This is deferred
+        until a message is actually logged, so that args may be expensive
+        to format (such as Truncated, see StringUtils).
+        """
+        if not args:
+            return message
+
+        return message.format(*args)
+
+    def info(self, message, *args):
+        if self.enabled(INFO):
+            getattr(self.frustum.logger, 'info')(self.format(message, args))
+
+    def debug(self, message, *args):
+        if self.enabled(DEBUG):
+            getattr(self.frustum.logger, 'debug')(self.format(message, args))
+
+    def debug_sampled(self, message, *args):
+        """
+        Logs one in every sample_rate messages at DEBUG. This is meant for
+        chatter, such as the resolution of every value in a story, which
+        would otherwise dominate the log of an app (and the time spent
+        formatting it).
+        """
+        if not self.enabled(DEBUG):
+            return
+
+        self.sampled += 1
+        if (self.sampled - 1) % self.sample_rate == 0:
+            self.debug(message, *args)
 
     def error(self, message, exc=None):
         getattr(self.frustum.logger, 'error')(message, exc_info=exc)
 
-    def warn(self, message):
-        getattr(self.frustum.logger, 'warning')(message)
+    def warn(self, message, *args):
+        if self.enabled(WARNING):
+            getattr(self.frustum.logger, 'warning')(
+                self.format(message, args))
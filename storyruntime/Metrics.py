@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from prometheus_client import Summary
+from prometheus_client import Counter, Gauge, Summary
 
 
 story_request = Summary(
@@ -37,3 +37,101 @@ container_start_seconds_total = Summary(
     'Time spent executing commands in containers',
     ['app_id', 'story_name', 'service']
 )
+
+scheduler_yields = Counter(
+    'asyncy_engine_scheduler_yields',
+    'Number of times stories yielded to other stories',
+    ['app_id']
+)
+
+scheduler_overruns = Counter(
+    'asyncy_engine_scheduler_overruns',
+    'Number of times stories executed for more than twice their time slice',
+    ['app_id']
+)
+
+function_cache_hits = Counter(
+    'asyncy_engine_function_cache_hits',
+    'Number of function calls which returned a memoized value',
+    ['app_id']
+)
+
+function_cache_misses = Counter(
+    'asyncy_engine_function_cache_misses',
+    'Number of memoizable function calls which executed the function',
+    ['app_id']
+)
+
+http_queue_wait_seconds = Summary(
+    'asyncy_engine_http_queue_wait_seconds',
+    'Time HTTP requests waited for a connection of their pool',
+    ['pool']
+)
+
+http_circuits = Gauge(
+    'asyncy_engine_http_circuits',
+    'Number of circuit breakers of destinations in a state '
+    '(closed, open or half_open)',
+    ['pool', 'state']
+)
+
+http_hedges = Counter(
+    'asyncy_engine_http_hedges',
+    'Number of service calls which sent a backup request',
+    ['app_id', 'service']
+)
+
+http_hedge_wins = Counter(
+    'asyncy_engine_http_hedge_wins',
+    'Number of service calls whose backup request responded first',
+    ['app_id', 'service']
+)
+
+http_coalesced = Counter(
+    'asyncy_engine_http_coalesced',
+    'Number of service calls which waited for an identical call in flight',
+    ['app_id', 'service']
+)
+
+response_cache_hits = Counter(
+    'asyncy_engine_response_cache_hits',
+    'Number of service calls which returned a cached output',
+    ['app_id']
+)
+
+response_cache_misses = Counter(
+    'asyncy_engine_response_cache_misses',
+    'Number of calls of cacheable service commands which missed the cache',
+    ['app_id']
+)
+
+response_cache_evictions = Counter(
+    'asyncy_engine_response_cache_evictions',
+    'Number of cached service outputs evicted to make room for others',
+    ['app_id']
+)
+
+service_queue_depth = Gauge(
+    'asyncy_engine_service_queue_depth',
+    'Number of calls waiting for their turn to call a service',
+    ['app_id', 'service']
+)
+
+service_queue_wait_seconds = Summary(
+    'asyncy_engine_service_queue_wait_seconds',
+    'Seconds calls waited for their turn to call a service',
+    ['app_id', 'service']
+)
+
+service_concurrency_limit = Gauge(
+    'asyncy_engine_service_concurrency_limit',
+    'Number of calls to a service which may be in flight at once '
+    '(for adaptive limits)',
+    ['app_id', 'service']
+)
+
+service_rejections = Counter(
+    'asyncy_engine_service_rejections',
+    'Number of calls to a service rejected since too many were waiting',
+    ['app_id', 'service']
+)
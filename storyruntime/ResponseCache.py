@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import copy
+import time
+from collections import OrderedDict
+
+from . import Metrics
+
+
+class ResponseCache:
+    """
+    Caches the outputs of calls of cacheable service commands (such as
+    lookups of static data), so that calling such a command again with
+    the same request returns the output it returned before, without
+    going over the network nor validating the output again (see
+    Services#execute_http).
+
+    Commands are cacheable if their OMG declares for how many seconds
+    their outputs may be cached (http.cacheTtl), or if the app does in
+    asyncy.yaml (runtime.http.cache; see AppConfig#get_cache_ttl), which
+    takes precedence.
+
+    Calls are keyed like SingleFlight#key_for. The cache holds up to a
+    number of bytes: the body of the response of every call counts, along
+    with its url and the body of its request. The least recently used
+    calls are evicted first. The cache belongs to the app of a release,
+    so deploying another release starts over with an empty cache.
+    """
+
+    def __init__(self, app_id, capacity: int):
+        self.app_id = app_id
+        self.capacity = capacity
+        self.size = 0
+        self.entries = OrderedDict()
+
+    @classmethod
+    def for_config(cls, config, app_id):
+        """
+        :return: A ResponseCache, with the capacity configured by config
+        """
+        return cls(app_id, config.HTTP_CACHE_SIZE)
+
+    @staticmethod
+    def ttl_for(app, plan, service, command):
+        """
+        :return: For how many seconds the outputs of command of service
+        may be cached (None if they may not)
+        """
+        app_config = app.app_config
+        if app_config is not None:
+            ttl = app_config.get_cache_ttl(service, command)
+            if ttl is not None:
+                return ttl
+
+        return plan.cache_ttl
+
+    def get(self, key):
+        """
+        :return: (hit, a copy of the output of the call)
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] <= time.monotonic():
+            self.remove(key)
+            entry = None
+
+        if entry is None:
+            Metrics.response_cache_misses.labels(app_id=self.app_id).inc()
+            return False, None
+
+        self.entries.move_to_end(key)
+        Metrics.response_cache_hits.labels(app_id=self.app_id).inc()
+        return True, copy.deepcopy(entry[0])
+
+    def put(self, key, output, body_size: int, ttl):
+        """
+        Stores a copy of output, returned by the call key, for ttl
+        seconds, evicting the least recently used calls which don't fit
+        anymore.
+        """
+        size = body_size + len(key[3]) + len(key[4] or '')
+        if size > self.capacity:
+            return
+
+        self.remove(key)
+        self.entries[key] = (copy.deepcopy(output), size,
+                             time.monotonic() + ttl)
+        self.size += size
+        while self.size > self.capacity:
+            _, (_, evicted, _) = self.entries.popitem(last=False)
+            self.size -= evicted
+            Metrics.response_cache_evictions.labels(
+                app_id=self.app_id).inc()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from . import Metrics
+from .Config import Config
+from .enums.ExecutionEngine import ExecutionEngine
+
+
+class Scheduler:
+    """
+    Shares the event loop between stories, cooperatively. A story may
+    execute for up to a time slice (in seconds) at a time, after which
+    it yields to the event loop, so that a story which keeps the CPU busy
+    (such as a long loop) doesn't starve all other stories.
+
+    Loops check Scheduler#due after every iteration, and call
+    Scheduler#yield_ if the slice is used up. Time the story spends waiting
+    for a service doesn't count, since the event loop was free meanwhile
+    (see Scheduler#resume).
+
+    The time slice can be configured per ExecutionEngine, since the same
+    slice covers more lines of a story when its code is generated.
+    """
+
+    OVERRUN_FACTOR = 2
+    """
+    A story which executes for this many time slices before it yields
+    overran its slice (such as with a single, expensive line).
+    """
+
+    def __init__(self, app_id, time_slices: dict,
+                 engine=ExecutionEngine.LEXICON):
+        self.app_id = app_id
+        self.time_slices = time_slices
+        self.time_slice = time_slices[engine]
+        self.slice_start = time.perf_counter()
+        self.yields = 0
+        self.overruns = 0
+
+    @classmethod
+    def for_config(cls, config, app_id):
+        """
+        :return: A Scheduler, with the time slices configured by config
+        (falling back to the defaults of Config)
+        """
+        time_slices = {}
+        for engine in ExecutionEngine:
+            key = f'TIME_SLICE_{engine.name}'
+            time_slice = getattr(config, key, None)
+            if not isinstance(time_slice, (int, float)) or \
+                    isinstance(time_slice, bool):
+                time_slice = getattr(Config, key)
+
+            time_slices[engine] = time_slice
+
+        return cls(app_id, time_slices)
+
+    def use(self, engine: ExecutionEngine):
+        """
+        Applies the time slice of engine, which executes the story.
+        """
+        self.time_slice = self.time_slices[engine]
+
+    def due(self) -> bool:
+        """
+        :return: True if the story has used up its time slice
+        """
+        return time.perf_counter() - self.slice_start >= self.time_slice
+
+    def resume(self):
+        """
+        Starts a new time slice, once the story continues after it has
+        awaited I/O.
+        """
+        self.slice_start = time.perf_counter()
+
+    async def yield_(self):
+        """
+        Lets the event loop run other coroutines, and starts a new
+        time slice once the story continues.
+        """
+        elapsed = time.perf_counter() - self.slice_start
+        self.yields += 1
+        Metrics.scheduler_yields.labels(app_id=self.app_id).inc()
+        if elapsed >= self.time_slice * self.OVERRUN_FACTOR:
+            self.overruns += 1
+            Metrics.scheduler_overruns.labels(app_id=self.app_id).inc()
+
+        await asyncio.sleep(0)
+        self.resume()
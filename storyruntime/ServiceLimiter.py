@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from collections import deque
+
+from . import Metrics
+from .AppConfig import Limit
+from .Exceptions import ServiceOverloadedError
+
+
+class ServiceLimit:
+    """
+    Limits how many calls to one service of an app are in flight at once.
+    Calls beyond the limit wait in a queue, for their turn or until their
+    deadline (Limit#timeout) passes; once the queue is full, calls are
+    rejected straight away (see ServiceOverloadedError), so that a spike
+    doesn't pile up timeouts and retries on the container of the service.
+
+    An adaptive limit starts at the configured concurrency, and adapts to
+    the latencies of the calls (AIMD): it shrinks by a factor once a call
+    fails or takes much longer than the calls did without load, and grows
+    by one per limit of calls which didn't (up to the configured
+    concurrency again).
+
+    The depth of the queue, the time calls wait in it, and the limit are
+    exported as metrics (see Metrics#service_queue_depth).
+    """
+
+    latency_tolerance = 2
+    """How many times the baseline latency a call may take."""
+
+    decrease = 0.9
+
+    def __init__(self, app_id, service, limit: Limit):
+        self.app_id = app_id
+        self.service = service
+        self.max_concurrency = limit.concurrency
+        self.concurrency = float(limit.concurrency)
+        self.queue = limit.queue
+        self.timeout = limit.timeout
+        self.adaptive = limit.adaptive
+        self.in_flight = 0
+        self.waiters = deque()
+        self.baseline = None
+        """The latency of the calls without load (see ServiceLimit#adapt)."""
+
+    def capacity(self) -> int:
+        return max(1, int(self.concurrency))
+
+    async def run(self, fetch):
+        """
+        Awaits fetch() once the service has capacity for another call.
+
+        :raises ServiceOverloadedError: If the call can't wait for its
+        turn
+        """
+        await self.acquire()
+        start = time.monotonic()
+        ok = False
+        try:
+            res = await fetch()
+            ok = res.code < 500
+            return res
+        finally:
+            self.release(time.monotonic() - start, ok)
+
+    async def acquire(self):
+        start = time.monotonic()
+        if self.in_flight < self.capacity() and len(self.waiters) == 0:
+            self.in_flight += 1
+            self.observe_wait(0)
+            return
+
+        if len(self.waiters) >= self.queue:
+            self.reject('queue full')
+
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        self.set_depth()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The turn came just as the wait ended, so pass it on.
+                self.release_turn()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+            if isinstance(e, asyncio.TimeoutError):
+                self.reject('deadline exceeded')
+            raise
+        finally:
+            self.set_depth()
+            self.observe_wait(time.monotonic() - start)
+
+    def release(self, latency, ok: bool):
+        if self.adaptive:
+            self.adapt(latency, ok)
+        self.release_turn()
+
+    def release_turn(self):
+        self.in_flight -= 1
+        while len(self.waiters) > 0 and self.in_flight < self.capacity():
+            waiter = self.waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def adapt(self, latency, ok: bool):
+        if ok:
+            # Tracks the fastest recent latencies, drifting up slowly, so
+            # that a service which got slower for good doesn't stay limited.
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                self.baseline = min(latency, self.baseline * 1.01)
+
+        if not ok or (self.baseline is not None and
+                      latency > self.latency_tolerance * self.baseline):
+            self.concurrency = max(1.0, self.concurrency * self.decrease)
+        else:
+            self.concurrency = min(self.max_concurrency,
+                                   self.concurrency + 1 / self.concurrency)
+
+        Metrics.service_concurrency_limit.labels(
+            app_id=self.app_id, service=self.service).set(self.capacity())
+
+    def reject(self, reason):
+        Metrics.service_rejections.labels(
+            app_id=self.app_id, service=self.service).inc()
+        raise ServiceOverloadedError(self.service, reason)
+
+    def set_depth(self):
+        Metrics.service_queue_depth.labels(
+            app_id=self.app_id, service=self.service).set(len(self.waiters))
+
+    def observe_wait(self, seconds):
+        Metrics.service_queue_wait_seconds.labels(
+            app_id=self.app_id, service=self.service).observe(seconds)
+
+
+class ServiceLimiter:
+    """
+    The ServiceLimit of every service of an app whose calls are limited,
+    as configured in asyncy.yaml (see AppConfig#get_service_limit).
+    """
+
+    def __init__(self, app_id, app_config):
+        self.app_id = app_id
+        self.app_config = app_config
+        self.limits = {}
+
+    def limit_for(self, service):
+        """
+        :return: The ServiceLimit of service, or None if its calls aren't
+        limited
+        """
+        if service not in self.limits:
+            limit = None
+            if self.app_config is not None:
+                limit = self.app_config.get_service_limit(service)
+            if limit is not None:
+                limit = ServiceLimit(self.app_id, service, limit)
+            self.limits[service] = limit
+
+        return self.limits[service]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from . import Metrics
+
+
+class SingleFlight:
+    """
+    The service calls of an app which are in flight, keyed by the service,
+    the command and the request (see Services#execute_http). A call which
+    is identical to one in flight doesn't send a request of its own, but
+    waits for the response to that one instead, so that a burst of events
+    running the same story doesn't flood a small service container with
+    the same request.
+
+    Only calls of commands which opted in are coalesced, either in the OMG
+    of their service (http.coalesce), or in asyncy.yaml
+    (runtime.http.coalesce; see AppConfig#is_coalesce_http).
+    """
+
+    def __init__(self, app_id):
+        self.app_id = app_id
+        self.flights = {}
+
+    @staticmethod
+    def key_for(service, command, url, kwargs):
+        """
+        :return: The key of a request (or None if it can't be coalesced,
+        such as when it streams a multipart body)
+        """
+        if 'body_producer' in kwargs:
+            return None
+
+        headers = tuple(sorted(kwargs.get('headers', {}).items()))
+        return (service, command, kwargs.get('method'), url,
+                kwargs.get('body'), headers)
+
+    async def call(self, key, service, fetch):
+        """
+        Awaits fetch(), unless a call with the same key is in flight: the
+        result of that call is returned then (or its error raised).
+        """
+        flight = self.flights.get(key)
+        if flight is not None:
+            Metrics.http_coalesced.labels(app_id=self.app_id,
+                                          service=service).inc()
+            # Shielded, so that a waiter which is cancelled doesn't cancel
+            # the call for everyone else.
+            return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(fetch())
+        self.flights[key] = flight
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
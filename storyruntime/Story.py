@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
+import copy
 import pathlib
-import time
 import uuid
 from contextlib import contextmanager
 from json import dumps
 
+from .Context import Context
 from .Exceptions import StackOverflowException
+from .LineResults import LineResults
+from .Scheduler import Scheduler
+from .compiler import CompiledTree, Line, Node, StoryCompiler
 from .utils import Dict
 from .utils.Resolver import Resolver
-from .utils.StringUtils import StringUtils
+from .utils.StringUtils import StringUtils, Truncated
 
 MAX_BYTES_LOGGING = 160
 
@@ -17,37 +21,58 @@ class Story:
     MAX_FRAMES_IN_STACK = 128
     """There really is no math to get this number, just a random number.
     Increase if it turns out to be too low.
-    The original default (128) is pretty high for Storyscript."""
+    The original default (128) is pretty high for Storyscript.
+    This is the default of Config#MAX_FRAMES_IN_STACK, which applies."""
 
     def __init__(self, app, story_name, logger):
         self.app = app
         self.name = story_name
         self.logger = logger
-        self.tree = app.stories[story_name]['tree']
+        self.tree = StoryCompiler.tree_for(app, story_name)
         self.entrypoint = app.stories[story_name]['entrypoint']
-        self.results = {}
+        self.results = LineResults.for_config(app.config)
+        self.scheduler = Scheduler.for_config(app.config, app.app_id)
         self.environment = None
         self.context = None
         self.containers = None
         self.repository = None
         self.version = None
         self._stack = []
+        self.max_frames = app.config.MAX_FRAMES_IN_STACK
+        self._shared_scope = None
         self.execution_id = str(uuid.uuid4())
 
     @contextmanager
     def new_frame(self, line_number: str):
         # No need for a try/finally block, since we don't want to unwind
         # the stack when an exception occurs.
-        if len(self._stack) >= Story.MAX_FRAMES_IN_STACK:
-            raise StackOverflowException(Story.MAX_FRAMES_IN_STACK)
+        self.push_frame(line_number)
+        yield
+        self.pop_frame()
+
+    def push_frame(self, line_number: str):
+        if len(self._stack) >= self.max_frames:
+            raise StackOverflowException(self.max_frames)
 
         self._stack.append(line_number)
-        yield
+
+    def pop_frame(self):
         self._stack.pop()
 
     def get_stack(self) -> []:
         return self._stack
 
+    def fork(self, context):
+        """
+        :return: A copy of this story, which executes with context, and
+        with a stack of its own (which starts out as a copy of the stack of
+        this story). This allows blocks to be executed concurrently.
+        """
+        story = copy.copy(self)
+        story.context = context
+        story._stack = list(self._stack)
+        return story
+
     def line(self, line_number):
         if line_number is None:
             return None
@@ -68,6 +93,9 @@ class Story:
                  indirectly), False otherwise
         """
 
+        if isinstance(line, Line):
+            return parent_line_number in line.ancestors
+
         # Fast test - this line is an immediate child of the parent.
         if parent_line_number == line.get('parent', None):
             return True
@@ -88,6 +116,10 @@ class Story:
         Given a parent_line, it skips through the block and returns the next
         line after this block.
         """
+        if isinstance(parent_line, Line):
+            # Precomputed by the StoryCompiler.
+            return parent_line.block_exit
+
         next_line = parent_line
 
         while next_line.get('next') is not None:
@@ -129,15 +161,27 @@ class Story:
         """
         return StringUtils.truncate(result, MAX_BYTES_LOGGING)
 
+    def evaluate(self, arg):
+        """
+        Returns the value of arg in the current context. Uses the compiled
+        expression for arg if there's one (see StoryCompiler#compile).
+        """
+        if isinstance(self.tree, CompiledTree):
+            fn = self.tree.expression_for(arg)
+            if fn is not None:
+                return fn(self.context)
+
+        return Resolver.resolve(arg, self.context)
+
     def resolve(self, arg, encode=False):
         """
         Resolves line argument to their real value
         """
-        result = Resolver.resolve(arg, self.context)
+        result = self.evaluate(arg)
 
-        self.logger.info(f'Resolved "{arg}" to '
-                         f'"{self.get_str_for_logging(result)}" '
-                         f'with type {type(result)}')
+        self.logger.debug_sampled('Resolved "{}" to "{}" with type {}', arg,
+                                  Truncated(result, MAX_BYTES_LOGGING),
+                                  type(result))
 
         # encode and escape then format for shell
         if encode:
@@ -178,11 +222,9 @@ class Story:
         return results
 
     def start_line(self, line_number):
-        self.results[line_number] = {'start': time.time()}
+        self.results.start(line_number)
 
     def end_line(self, line_number, output=None, assign=None):
-        start = self.results[line_number]['start']
-
         # Please see https://github.com/asyncy/platform-engine/issues/148
         # for the rationale on removing auto conversion. Code commented and
         # NOT removed so that this note here makes sense.
@@ -193,8 +235,7 @@ class Story:
         #     except JSONDecodeError:
         #         output = output
 
-        dictionary = {'output': output, 'end': time.time(), 'start': start}
-        self.results[line_number] = dictionary
+        self.results.end(line_number, output)
 
         # assign a variable to the output
         if assign:
@@ -217,7 +258,14 @@ class Story:
         return self.line(line_number)
 
     def argument_by_name(self, line, argument_name, encode=False):
-        args = line.get('args', line.get('arguments', line.get('arg')))
+        if isinstance(line, Node):
+            # Arguments of compiled lines are already keyed by their name.
+            if argument_name not in line.arguments:
+                return None
+
+            return self.resolve(line.arguments[argument_name], encode=encode)
+
+        args = StoryCompiler.arguments_of(line)
         if args is None:
             return None
 
@@ -249,17 +297,28 @@ class Story:
         for arg in args:
             if arg['$OBJECT'] == 'argument' or arg['$OBJECT'] == 'arg':
                 arg_name = arg['name']
-                actual = self.argument_by_name(line, arg_name)
-                Dict.set(new_context, [arg_name], actual)
+                new_context[arg_name] = self.argument_by_name(line, arg_name)
 
         return new_context
 
     def set_context(self, context):
+        """
+        Switches Story#context to context. Unless context is a Context
+        already (such as one which is restored after a function call),
+        it becomes the scope which is written to, on top of the scope
+        shared by all contexts of this story (see Context).
+        """
+        if isinstance(context, Context):
+            self.context = context
+            return
+
         if context is None:
             context = {}
-        self.context = context
-        # Optimise this later.
-        self.context['app'] = self.app.app_context.copy()
+
+        if self._shared_scope is None:
+            self._shared_scope = {'app': self.app.app_context}
+
+        self.context = Context(context, self._shared_scope)
 
     def prepare(self, context=None):
         self.set_context(context)
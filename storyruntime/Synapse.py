@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import hashlib
+import json
+from collections import namedtuple
+
+from .Exceptions import StoryscriptError
+from .HttpTransport import HttpTransport
+from .Kubernetes import Kubernetes
+from .db.Database import Database
+from .utils.HttpUtils import HttpUtils
+
+PendingSubscription = namedtuple('PendingSubscription', [
+    'story', 'line', 'streaming_service', 'event', 'body'
+])
+"""
+A subscription of a when line, which is sent to the Synapse along with
+the other subscriptions of its batch (see SubscriptionBatch).
+"""
+
+
+class Synapse:
+    """
+    Subscribes to the events of streaming services via the Synapse, which
+    keeps the subscriptions of all apps (see Services#when).
+
+    If Config.SYNAPSE_BULK_SUBSCRIBE is set, the Synapse speaks the bulk
+    protocol: a batch of subscriptions is sent in a single request (POST
+    /subscribe_bulk, with the app_id and the bodies of the subscriptions),
+    subscriptions are unsubscribed in a single request too (POST
+    /unsubscribe_bulk, with the app_id and the sub_ids), and the
+    subscriptions of an app are registered (see SubscriptionRegistry).
+    Otherwise, every subscription of a batch is sent on its own (POST
+    /subscribe), concurrently, and all of them are cleared when the app is
+    destroyed (POST /clear_all).
+    """
+
+    @staticmethod
+    def dumps(payload, sort_keys=False) -> str:
+        # Imported here, since Services subscribes via the Synapse.
+        from .processing.Services import HttpDataEncoder
+        return json.dumps(payload, cls=HttpDataEncoder, sort_keys=sort_keys)
+
+    @staticmethod
+    def url_for(config, path):
+        return f'http://{config.ASYNCY_SYNAPSE_HOST}:' \
+            f'{config.ASYNCY_SYNAPSE_PORT}/{path}'
+
+    @classmethod
+    async def subscribe(cls, logger, config, body: dict):
+        """
+        Sends the subscription body (see Services#when).
+
+        :return: The response of the Synapse
+        """
+        # Why request_timeout is set to 120 seconds:
+        # Since this is the Synapse, Synapse does multiple internal retries,
+        # so we must set this to a really high value.
+        kwargs = {
+            'method': body['sub_method'],
+            'body': cls.dumps(body),
+            'headers': {
+                'Content-Type': 'application/json; charset=utf-8'
+            },
+            'request_timeout': 120
+        }
+
+        url = cls.url_for(config, 'subscribe')
+        client = HttpTransport.control(url)
+
+        # Okay to retry subscribing, since every attempt carries the same
+        # sub_id (backing off, in case the Synapse is busy).
+        return await HttpUtils.fetch_with_retry(10, logger, url, client,
+                                                kwargs, idempotent=True)
+
+    @classmethod
+    async def subscribe_all(cls, logger, config, app_id, bodies: list):
+        """
+        Sends all the subscriptions bodies.
+
+        :return: For every body, whether it was subscribed
+        """
+        if len(bodies) == 0:
+            return []
+
+        if not config.SYNAPSE_BULK_SUBSCRIBE:
+            # Every body is subscribed, even if others fail to.
+            responses = await asyncio.gather(*[
+                cls.subscribe(logger, config, body) for body in bodies
+            ], return_exceptions=True)
+
+            oks = []
+            for body, res in zip(bodies, responses):
+                if isinstance(res, BaseException):
+                    logger.error(f'Failed to subscribe {body["sub_id"]} '
+                                 f'via Synapse: {res}')
+                    oks.append(False)
+                else:
+                    oks.append(int(res.code / 100) == 2)
+
+            return oks
+
+        kwargs = {
+            'method': 'POST',
+            'body': cls.dumps({
+                'app_id': app_id,
+                'subscriptions': bodies
+            }),
+            'headers': {
+                'Content-Type': 'application/json; charset=utf-8'
+            },
+            'request_timeout': 120
+        }
+
+        url = cls.url_for(config, 'subscribe_bulk')
+        client = HttpTransport.control(url)
+        res = await HttpUtils.fetch_with_retry(10, logger, url, client,
+                                               kwargs, idempotent=True)
+        return [int(res.code / 100) == 2] * len(bodies)
+
+    @classmethod
+    async def unsubscribe_all(cls, logger, config, app_id, sub_ids: list):
+        """
+        Unsubscribes the subscriptions sub_ids of app_id, with the bulk
+        protocol.
+
+        :return: True if they were unsubscribed
+        """
+        if len(sub_ids) == 0:
+            return True
+
+        kwargs = {
+            'method': 'POST',
+            'body': cls.dumps({
+                'app_id': app_id,
+                'sub_ids': sub_ids
+            }),
+            'headers': {
+                'Content-Type': 'application/json; charset=utf-8'
+            },
+            'request_timeout': 120
+        }
+
+        url = cls.url_for(config, 'unsubscribe_bulk')
+        client = HttpTransport.control(url)
+        res = await HttpUtils.fetch_with_retry(10, logger, url, client,
+                                               kwargs, idempotent=True)
+        if int(res.code / 100) == 2:
+            logger.debug(f'Unsubscribed {len(sub_ids)} via Synapse!')
+            return True
+
+        logger.error(f'Failed to unsubscribe {len(sub_ids)} via Synapse!')
+        return False
+
+    @classmethod
+    async def clear_all(cls, logger, config, app_id):
+        """
+        Unsubscribes all the subscriptions of app_id.
+
+        :return: True if they were unsubscribed
+        """
+        kwargs = {
+            'method': 'POST',
+            'body': cls.dumps({
+                'app_id': app_id
+            }),
+            'headers': {
+                'Content-Type': 'application/json; charset=utf-8'
+            }
+        }
+
+        url = cls.url_for(config, 'clear_all')
+        client = HttpTransport.control(url)
+        res = await HttpUtils.fetch_with_retry(3, logger, url, client,
+                                               kwargs, idempotent=True)
+        if int(res.code / 100) == 2:
+            logger.debug(f'Unsubscribed all with Synapse!')
+            return True
+
+        logger.error(f'Failed to unsubscribe with Synapse!')
+        return False
+
+
+class SubscriptionRegistry:
+    """
+    The subscriptions of the when lines of an app's stories, as the
+    Synapse keeps them with the bulk protocol (see Synapse). The registry
+    is persisted in Postgres (see Database#get_subscriptions), so that it
+    outlives the engine, and it's forgotten when the app is destroyed.
+
+    When the app is deployed, subscriptions are matched with the registered
+    ones by their identity (see SubscriptionRegistry#fingerprint). Those
+    which are gone are unsubscribed in bulk, and only those whose container
+    provably survived (the same container is still running, and the body
+    is the same but for its id) aren't subscribed again. Since the
+    namespace of an app is cleaned whenever it's deployed (see
+    Containers#clean_app), this is the case for containers which are
+    reused only.
+    """
+
+    @staticmethod
+    def fingerprint(sub: PendingSubscription) -> str:
+        """
+        :return: The identity of sub: its service, event, arguments, story
+        and block (which are the same across the releases of an app)
+        """
+        identity = {
+            'service': sub.streaming_service.name,
+            'event': sub.event,
+            'data': sub.body['sub_body']['data'],
+            'story': sub.story.name,
+            'block': sub.line['ln']
+        }
+        return hashlib.sha1(
+            Synapse.dumps(identity, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    @staticmethod
+    def without_ids(body: dict) -> str:
+        body = dict(body, sub_id=None,
+                    sub_body=dict(body['sub_body'], id=None))
+        return Synapse.dumps(body, sort_keys=True)
+
+    @staticmethod
+    async def container_ids(app, pending: list) -> dict:
+        """
+        :return: The IDs of the running containers of the pending
+        subscriptions which the app started (see
+        Kubernetes#get_container_id), keyed by container name
+        """
+        names = set(
+            sub.streaming_service.container_name for sub in pending
+            if app.containers.hostname_for(
+                sub.streaming_service.container_name) is not None)
+        names = list(names)
+        container_ids = await asyncio.gather(*[
+            Kubernetes.get_container_id(app, name) for name in names
+        ])
+        return dict(zip(names, container_ids))
+
+    @classmethod
+    def survived(cls, sub: PendingSubscription, registered: dict,
+                 container_ids: dict) -> bool:
+        container_id = container_ids.get(sub.streaming_service.container_name)
+        return container_id is not None and \
+            container_id == registered['container_id'] and \
+            cls.without_ids(registered['body']) == cls.without_ids(sub.body)
+
+    @classmethod
+    async def diff(cls, app, pending: list, container_ids: dict):
+        """
+        Unsubscribes the registered subscriptions of app which don't
+        survive the deployment.
+
+        :return: (The pending subscriptions which need to be subscribed,
+        the registered ones with the bodies they were subscribed with)
+        """
+        registered = await Database.get_subscriptions(app.config,
+                                                      app.app_id)
+        if len(registered) == 0:
+            # The Synapse may keep subscriptions which were never
+            # registered (such as before the app was deployed with the
+            # bulk protocol), so it starts over.
+            await Synapse.clear_all(app.logger, app.config, app.app_id)
+
+        new = []
+        kept = []
+        stale = []
+        for sub in pending:
+            entry = registered.pop(cls.fingerprint(sub), None)
+            if entry is not None and \
+                    cls.survived(sub, entry, container_ids):
+                kept.append(sub._replace(body=entry['body']))
+                continue
+
+            new.append(sub)
+            if entry is not None:
+                stale.append(entry)
+
+        stale.extend(registered.values())
+        await Synapse.unsubscribe_all(
+            app.logger, app.config, app.app_id,
+            [entry['body']['sub_id'] for entry in stale])
+        return new, kept
+
+    @classmethod
+    async def save(cls, app, subscribed: list, container_ids: dict):
+        """
+        Registers the subscriptions subscribed (and only those).
+        """
+        await Database.set_subscriptions(app.config, app.app_id, {
+            cls.fingerprint(sub): {
+                'body': sub.body,
+                'container_id': container_ids.get(
+                    sub.streaming_service.container_name)
+            } for sub in subscribed
+        })
+
+    @classmethod
+    async def unsubscribe(cls, app, sub_ids: list):
+        """
+        Unsubscribes the subscriptions sub_ids (all of app's) in bulk, and
+        forgets them, since the containers of app are removed along with it.
+        """
+        await Synapse.unsubscribe_all(app.logger, app.config, app.app_id,
+                                      sub_ids)
+        await Database.set_subscriptions(app.config, app.app_id, {})
+
+    @classmethod
+    async def drop(cls, logger, config, app_id):
+        """
+        Unsubscribes all the subscriptions of app_id, which isn't
+        deployed anymore, and forgets them.
+        """
+        await Synapse.clear_all(logger, config, app_id)
+        await Database.set_subscriptions(config, app_id, {})
+
+
+class SubscriptionBatch:
+    """
+    The subscriptions of the when lines which run while an app runs its
+    stories (see App#run_stories): instead of subscribing one after the
+    other, as the stories run, they're sent to the Synapse all at once
+    (see Synapse#subscribe_all) once all stories ran.
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def add(self, story, line, streaming_service, event, body: dict):
+        self.pending.append(PendingSubscription(
+            story=story, line=line, streaming_service=streaming_service,
+            event=event, body=body))
+
+    async def flush(self, app):
+        """
+        Subscribes all the pending subscriptions, and adds them to app.
+        With the bulk protocol, only those which aren't registered yet are
+        subscribed (see SubscriptionRegistry).
+
+        :raises StoryscriptError: If any of them failed to subscribe
+        """
+        pending = self.pending
+        self.pending = []
+        bulk = app.config.SYNAPSE_BULK_SUBSCRIBE
+        kept = []
+        new = pending
+        if bulk:
+            container_ids = await SubscriptionRegistry.container_ids(
+                app, pending)
+            new, kept = await SubscriptionRegistry.diff(app, pending,
+                                                        container_ids)
+
+        oks = await Synapse.subscribe_all(
+            app.logger, app.config, app.app_id,
+            [sub.body for sub in new])
+
+        subscribed = list(kept)
+        failed = None
+        for sub, ok in zip(new, oks):
+            if ok:
+                subscribed.append(sub)
+            elif failed is None:
+                failed = sub
+
+        for sub in subscribed:
+            app.add_subscription(sub.body['sub_id'], sub.streaming_service,
+                                 sub.event, sub.body)
+
+        if bulk:
+            await SubscriptionRegistry.save(app, subscribed, container_ids)
+
+        if failed is not None:
+            s = failed.streaming_service
+            raise StoryscriptError(
+                message=f'Failed to subscribe to {s.name} from '
+                f'{s.command} in {s.container_name}!',
+                story=failed.story, line=failed.line)
+
+        app.logger.debug(f'Subscribed {len(new)} via Synapse '
+                         f'({len(kept)} were subscribed already)!')
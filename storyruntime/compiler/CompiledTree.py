@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+class Node(dict):
+    """
+    A node of a compiled story (such as a line, or a mutation).
+
+    A node is the exact same mapping which was emitted by the Storyscript
+    compiler, so everything which reads node['args'] (and friends) continues
+    to work. Additionally, it carries the following, precomputed once per
+    release:
+    - arguments: the values of all named arguments, keyed by their name
+    """
+    __slots__ = ('arguments',)
+
+
+class Line(Node):
+    """
+    A line of a compiled story. In addition to what a Node carries,
+    a Line has:
+    - index: the position of this line in CompiledTree#lines
+    - next_index: the index of the line referenced by 'next'
+    - parent_index: the index of the line referenced by 'parent'
+    - enter_index: the index of the line referenced by 'enter'
+    - handler: the name of the Lexicon method which executes this line
+    - sync_handler: the name of the synchronous Lexicon method which
+      executes this line, if it doesn't perform I/O (None otherwise)
+    - ancestors: the line numbers of all the parents of this line
+      (direct and indirect)
+    - enclosing: the line number of the nearest parent for every method
+      found up the hierarchy of this line (eg {'for': '3', 'function': '1'})
+    - block_exit: the line after the block this line starts, as returned
+      by Story#next_block (None if there's no such line)
+    - independent: the line numbers of the run of consecutive execute lines
+      starting with this line, which don't depend on each other (None
+      unless there are at least two, see StoryCompiler#_index_dataflow)
+    - pure: for a function line, True if the function only computes its
+      return value from its arguments (see StoryCompiler#_index_purity),
+      None for all other lines
+    - service_plan: for an execute or a when line, the service call of
+      the line as resolved by Services (see Services#plan_for and
+      Services#subscription_plan_for), once it has been resolved
+
+    All indices are None when the line has no such reference.
+    """
+    __slots__ = ('index', 'next_index', 'parent_index', 'enter_index',
+                 'handler', 'sync_handler', 'ancestors', 'enclosing',
+                 'block_exit', 'independent', 'pure', 'service_plan')
+
+
+class CompiledTree(dict):
+    """
+    The compiled tree of a story. This maps line numbers to their Line,
+    just like the raw tree does. Lines are additionally stored in
+    CompiledTree#lines, where they're addressable by their index.
+
+    Values which the Resolver would resolve at runtime may be compiled too
+    (see ExpressionCompiler). These are kept in CompiledTree#expressions,
+    keyed by the id of the value in the tree, along with the value itself.
+    """
+    __slots__ = ('lines', 'expressions')
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.expressions = {}
+
+    def expression_for(self, item):
+        """
+        :return: The compiled function for item, or None if item
+        wasn't compiled
+        """
+        compiled = self.expressions.get(id(item))
+        if compiled is None or compiled[0] is not item:
+            return None
+
+        return compiled[1]
+
+    def line_at(self, index):
+        if index is None:
+            return None
+
+        return self.lines[index]
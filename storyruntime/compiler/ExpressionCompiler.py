@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+import math
+import re
+
+from ..Exceptions import ResolverMismatchError, StoryscriptError, \
+    StoryscriptRuntimeError
+from ..utils.Resolver import Resolver
+from ..utils.StringUtils import StringUtils
+from ..utils.TypeResolver import TypeResolver
+from ..utils.TypeUtils import TypeUtils
+
+RE_PATTERN = type(re.compile('a'))
+
+MAX_BYTES_MISMATCH = 160
+
+IMMUTABLE_TYPES = (str, int, float, bool, bytes, RE_PATTERN, type(None))
+"""
+Only values of these types are folded into constants. Lists and maps are
+always built fresh, since stories may mutate them.
+"""
+
+
+def constant(value):
+    def resolve_constant(data):
+        return value
+
+    resolve_constant.constant = value
+    return resolve_constant
+
+
+def is_constant(fn):
+    return hasattr(fn, 'constant')
+
+
+class ExpressionCompiler:
+    """
+    Compiles the values found in a story tree (the items which the Resolver
+    resolves) into closures, which take the context (data) to resolve
+    against. All dispatching on $OBJECT and on operators happens just once,
+    at compile time. Additionally:
+    - literal subtrees are folded into constants
+    - regular expressions are compiled just once
+    - types for type casts are resolved just once
+
+    A compiled item behaves exactly like Resolver#resolve does for it.
+    """
+
+    @classmethod
+    def compile(cls, item):
+        """
+        :return: A function, which takes the context, and returns the
+        value of item (as Resolver#resolve(item, context) does)
+        """
+        return cls.resolve(item)
+
+    @classmethod
+    def differential(cls, item, fn=None):
+        """
+        Compiles item, and returns a function which resolves item using
+        both, the Resolver and the compiled function, and raises
+        ResolverMismatchError if they disagree.
+        """
+        if fn is None:
+            fn = cls.compile(item)
+
+        def resolve_differential(data):
+            try:
+                expected = Resolver.resolve(item, data)
+            except BaseException as e:
+                try:
+                    fn(data)
+                except BaseException as actual_exc:
+                    if type(actual_exc) is type(e):
+                        raise e
+                    cls._raise_mismatch(item, e, actual_exc)
+                cls._raise_mismatch(item, e, 'no error')
+
+            try:
+                actual = fn(data)
+            except BaseException as actual_exc:
+                cls._raise_mismatch(item, expected, actual_exc)
+
+            if not cls.same(expected, actual):
+                cls._raise_mismatch(item, expected, actual)
+
+            return expected
+
+        return resolve_differential
+
+    @staticmethod
+    def _raise_mismatch(item, expected, actual):
+        raise ResolverMismatchError(
+            item=StringUtils.truncate(item, MAX_BYTES_MISMATCH),
+            expected=StringUtils.truncate(repr(expected),
+                                          MAX_BYTES_MISMATCH),
+            actual=StringUtils.truncate(repr(actual), MAX_BYTES_MISMATCH))
+
+    @classmethod
+    def same(cls, a, b):
+        """
+        Stricter than ==, since 1 == 1.0 == True.
+        """
+        if type(a) is not type(b):
+            return False
+
+        if isinstance(a, list):
+            return len(a) == len(b) and \
+                all(cls.same(x, y) for x, y in zip(a, b))
+        elif isinstance(a, dict):
+            return a.keys() == b.keys() and \
+                all(cls.same(v, b[k]) for k, v in a.items())
+        elif isinstance(a, float) and math.isnan(a):
+            return math.isnan(b)
+
+        return a == b
+
+    @classmethod
+    def fold(cls, fn, children):
+        """
+        Evaluates fn right away if all of its children are constants,
+        and the result is immutable. If evaluating fails, the failure is
+        left for runtime, so that it's raised with the story context.
+        """
+        if not all(is_constant(child) for child in children):
+            return fn
+
+        try:
+            value = fn({})
+        except Exception:
+            return fn
+
+        if type(value) not in IMMUTABLE_TYPES:
+            return fn
+
+        return constant(value)
+
+    @classmethod
+    def resolve(cls, item):
+        """
+        See Resolver#resolve.
+        """
+        if type(item) is dict:
+            return cls.object(item)
+        elif type(item) is list:
+            return cls.list(item)
+
+        try:
+            return constant(TypeUtils.safe_type(item))
+        except StoryscriptError:
+            def resolve_unsafe(data):
+                return Resolver.resolve(item, data)
+
+            return resolve_unsafe
+
+    @classmethod
+    def list(cls, items):
+        """
+        See Resolver#list.
+        """
+        fns = [cls.resolve(item) for item in items]
+
+        def resolve_list(data):
+            return ' '.join([fn(data) for fn in fns])
+
+        return cls.fold(resolve_list, fns)
+
+    @classmethod
+    def object(cls, item):
+        """
+        See Resolver#object.
+        """
+        if not isinstance(item, dict):
+            return constant(item)
+
+        object_type = item.get('$OBJECT')
+        if object_type == 'string':
+            return cls.string(item['string'], item.get('values'))
+        elif object_type == 'dot':
+            return constant(item['dot'])
+        elif object_type == 'int':
+            return constant(item['int'])
+        elif object_type == 'boolean':
+            return constant(item['boolean'])
+        elif object_type == 'float':
+            return constant(item['float'])
+        elif object_type == 'path':
+            return cls.path(item['paths'])
+        elif object_type == 'regexp':
+            return cls.regexp(item['regexp'])
+        elif object_type == 'value':
+            return constant(item['value'])
+        elif object_type == 'dict':
+            return cls.dict(item['items'])
+        elif object_type == 'list':
+            return cls.list_object(item['items'])
+        elif object_type == 'expression' or object_type == 'assertion':
+            return cls.expression(item)
+        elif object_type == 'type_cast' or object_type == 'type':
+            return cls.type_cast(item)
+
+        return cls.dictionary(item)
+
+    @classmethod
+    def string(cls, string, values):
+        if not values:
+            return constant(string)
+
+        fns = [cls.resolve(value) for value in values]
+
+        def resolve_string(data):
+            return string.format(*[fn(data) for fn in fns])
+
+        return cls.fold(resolve_string, fns)
+
+    @classmethod
+    def regexp(cls, regexp):
+        try:
+            return constant(re.compile(regexp))
+        except re.error:
+            # Raised at runtime, just like the Resolver would.
+            def resolve_regexp(data):
+                return re.compile(regexp)
+
+            return resolve_regexp
+
+    @classmethod
+    def dictionary(cls, dictionary):
+        fns = {key: cls.resolve(value) for key, value in dictionary.items()}
+
+        def resolve_dictionary(data):
+            return {key: fn(data) for key, fn in fns.items()}
+
+        return resolve_dictionary
+
+    @classmethod
+    def dict(cls, items):
+        fns = [(cls.object(k), cls.object(v)) for k, v in items]
+
+        def resolve_dict(data):
+            result = {}
+            for k, v in fns:
+                k = k(data)
+                if k in (list, tuple, dict):
+                    continue
+
+                result[k] = v(data)
+            return result
+
+        return resolve_dict
+
+    @classmethod
+    def list_object(cls, items):
+        fns = [cls.resolve(item) for item in items]
+
+        def resolve_list_object(data):
+            return [fn(data) for fn in fns]
+
+        return resolve_list_object
+
+    @classmethod
+    def type_cast(cls, item):
+        value = cls.object(item['value'])
+        try:
+            plan = TypeResolver.plan_for(item['type'])
+        except BaseException:
+            # Invalid types are raised at runtime, like the Resolver does.
+            def resolve_invalid_type_cast(data):
+                return Resolver.type_cast(item, data)
+
+            return resolve_invalid_type_cast
+
+        def resolve_type_cast(data):
+            return TypeResolver.apply(plan, value(data))
+
+        return cls.fold(resolve_type_cast, [value])
+
+    @classmethod
+    def path(cls, paths):
+        """
+        See Resolver#path.
+        """
+        first = paths[0]
+        steps = []
+        for path in paths[1:]:
+            if not isinstance(path, dict):
+                # Not something the Storyscript compiler emits, and the
+                # Resolver rejects these in a peculiar way. Let it.
+                def resolve_path_fallback(data):
+                    return Resolver.path(paths, data)
+
+                return resolve_path_fallback
+
+            if path.get('$OBJECT') == 'range':
+                steps.append((True, cls.range(path['range'])))
+            else:
+                steps.append((False, cls.object(path)))
+
+        def resolve_path(data):
+            resolved = None
+            try:
+                item = data[first]
+                for is_range, step in steps:
+                    if is_range:
+                        item = step(item, data)
+                        continue
+
+                    resolved = step(data)
+                    # Allow a namedtuple to use keys or index
+                    # to retrieve data.
+                    if TypeUtils.isnamedtuple(item) and \
+                            isinstance(resolved, str):
+                        item = getattr(item, resolved)
+                    else:
+                        item = item[resolved]
+                return item
+            except IndexError:
+                raise StoryscriptRuntimeError(
+                    message=f'List index out of bounds: {resolved}')
+            except (KeyError, AttributeError):
+                raise StoryscriptRuntimeError(
+                    message=f'Map does not contain the key "{resolved}". '
+                    f'Use map.get(key: <key> default: <default value>) to '
+                    f'prevent an exception from being thrown. Additionally, '
+                    f'you may also use map.contains(key: <key>) to check if '
+                    f'a key exists in a map.')
+            except TypeError:
+                return None
+
+        return resolve_path
+
+    @classmethod
+    def range(cls, path):
+        """
+        See Resolver#range.
+        """
+        start = cls.object(path['start']) if 'start' in path else None
+        end = cls.object(path['end']) if 'end' in path else None
+
+        def resolve_range(item, data):
+            start_index = 0
+            end_index = len(item)
+            if start is not None:
+                start_index = start(data)
+            if end is not None:
+                end_index = end(data)
+            return item[start_index:end_index]
+
+        return resolve_range
+
+    @classmethod
+    def expression(cls, item):
+        """
+        See Resolver#expression.
+        """
+        a = item.get('assertion', item.get('expression'))
+        fns = [cls.resolve(value) for value in item['values']]
+        left = fns[0]
+
+        if a == 'or' or a == 'and':
+            # These short circuit on identity, as the Resolver does.
+            stop = a == 'or'
+
+            def resolve_boolean(data):
+                if left(data) is stop:
+                    return stop
+
+                for fn in fns[1:]:
+                    if fn(data) is stop:
+                        return stop
+
+                return not stop
+
+            return cls.fold(resolve_boolean, fns)
+        elif a == 'not':
+            def resolve_not(data):
+                return not left(data)
+
+            return cls.fold(resolve_not, fns)
+        elif a == 'sum':
+            def resolve_sum(data):
+                result = left(data)
+
+                assert type(result) in (int, float, str)
+                for fn in fns[1:]:
+                    r = fn(data)
+
+                    if type(r) in (int, float) and \
+                            type(result) in (int, float):
+                        result += r
+                    else:
+                        result = f'{str(result)}{str(r)}'
+
+                return result
+
+            return cls.fold(resolve_sum, fns)
+
+        operation = cls.binary_operations.get(a)
+        if operation is None:
+            def resolve_unsupported(data):
+                left(data)
+                assert False, f'Unsupported operation: {a}'
+
+            return resolve_unsupported
+
+        operator, allowed_types = operation
+        right = fns[1]
+
+        if allowed_types is None:
+            def resolve_comparison(data):
+                return operator(left(data), right(data))
+
+            return cls.fold(resolve_comparison, fns)
+
+        def resolve_arithmetic(data):
+            left_value = left(data)
+            right_value = right(data)
+            assert type(left_value) in allowed_types
+            assert type(right_value) in allowed_types
+            return operator(left_value, right_value)
+
+        return cls.fold(resolve_arithmetic, fns)
+
+    binary_operations = {
+        'equals': (lambda a, b: a == b, None),
+        'equal': (lambda a, b: a == b, None),
+        'not_equal': (lambda a, b: a != b, None),
+        'greater': (lambda a, b: a > b, None),
+        'greater_equal': (lambda a, b: a >= b, None),
+        'less': (lambda a, b: a < b, None),
+        'less_equal': (lambda a, b: a <= b, None),
+        'subtraction': (lambda a, b: a - b, (int, float)),
+        'multiplication': (lambda a, b: a * b, (int, float, str)),
+        'modulus': (lambda a, b: a % b, (int, float)),
+        'division': (lambda a, b: a / b, (int, float, str)),
+        'exponential': (lambda a, b: a ** b, (int, float))
+    }
+    """
+    Operators taking two operands, with the types each operand must have
+    (None if any type goes).
+    """
@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+from .CompiledTree import CompiledTree, Line, Node
+from .ExpressionCompiler import ExpressionCompiler
+from ..enums.ResolverMode import ResolverMode
+
+
+class StoryCompiler:
+    """
+    Compiles the tree of a story (as emitted by the Storyscript compiler)
+    into a CompiledTree. This is done once per release, so that all
+    information which doesn't depend on the context of a story run
+    doesn't have to be looked up for every line, every time it executes.
+    """
+
+    handlers = {
+        'if': 'if_condition',
+        'elif': 'if_condition',
+        'else': 'if_condition',
+        'for': 'for_loop',
+        'execute': 'execute',
+        'set': 'set',
+        'expression': 'set',
+        'mutation': 'set',
+        'call': 'call',
+        'function': 'function',
+        'when': 'when',
+        'return': 'ret',
+        'break': 'break_',
+        'continue': 'continue_',
+        'while': 'while_',
+        'try': 'try_catch',
+        'throw': 'throw'
+    }
+    """
+    Maps the method of a line to the name of the Lexicon method which
+    executes it.
+    """
+
+    sync_handlers = {
+        'if': 'if_condition_sync',
+        'elif': 'if_condition_sync',
+        'else': 'if_condition_sync',
+        'set': 'set_sync',
+        'expression': 'set_sync',
+        'mutation': 'set_sync',
+        'function': 'function_sync',
+        'return': 'ret_sync',
+        'break': 'break_sync',
+        'continue': 'continue_sync',
+        'throw': 'throw'
+    }
+    """
+    Maps the method of a line which never performs I/O (it neither calls
+    a service, nor executes a block of lines) to the name of the
+    synchronous Lexicon method which executes it.
+    """
+
+    barrier_services = frozenset(('file', 'http', 'log'))
+    """
+    Internal services with side effects which other services may observe
+    (such as a file which a service reads through the app, once it's
+    written). Calls of them are never reordered with other service calls
+    (see StoryCompiler#_index_dataflow).
+    """
+
+    external_state = '$external'
+    """
+    Stands for the state shared by services, which every service call
+    reads, and which calls of barrier_services write.
+    """
+
+    pure_methods = frozenset((
+        'if', 'elif', 'else', 'for', 'while', 'set', 'expression',
+        'mutation', 'call', 'return', 'break', 'continue', 'throw'
+    ))
+    """
+    The methods of lines which a pure function may consist of.
+    """
+
+    impure_mutations = frozenset((
+        'append', 'prepend', 'reverse', 'sort', 'unique', 'remove',
+        'replace', 'pop', 'random'
+    ))
+    """
+    Mutations which modify a value in place (which, for a list or a map
+    passed to a function, is the value of the caller), or whose result is
+    random. The type of a value isn't known ahead of time, so this
+    includes mutations which are pure for some types (such as replace
+    for a string).
+    """
+
+    @staticmethod
+    def arguments_of(node: dict):
+        return node.get('args', node.get('arguments', node.get('arg')))
+
+    @classmethod
+    def arguments_by_name(cls, node: dict) -> dict:
+        """
+        Returns the values of all named arguments in node, keyed by their
+        name. If an argument is specified more than once, the first one
+        wins (which is how Story#argument_by_name has always resolved them).
+        """
+        arguments = {}
+        for arg in cls.arguments_of(node) or []:
+            if isinstance(arg, dict) and \
+                    (arg.get('$OBJECT') == 'argument' or
+                     arg.get('$OBJECT') == 'arg'):
+                arguments.setdefault(arg['name'],
+                                     arg.get('argument', arg.get('arg')))
+
+        return arguments
+
+    @classmethod
+    def compile_node(cls, node):
+        """
+        Compiles mutations found in the arguments of a line. Everything else
+        is left untouched, since argument values are handed to the Resolver
+        as is.
+        """
+        if isinstance(node, dict) and node.get('$OBJECT') == 'mutation':
+            node = Node(node)
+            node.arguments = cls.arguments_by_name(node)
+
+        return node
+
+    @classmethod
+    def compile(cls, tree: dict,
+                resolver_mode=ResolverMode.INTERPRETER) -> CompiledTree:
+        """
+        Compiles tree. Unless resolver_mode is ResolverMode.INTERPRETER,
+        the values of all arguments are compiled too (see
+        ExpressionCompiler), so that Story#resolve doesn't have to walk
+        them every time.
+        """
+        compiled = CompiledTree()
+
+        for ln, raw_line in tree.items():
+            line = Line(raw_line)
+            line.index = len(compiled.lines)
+            line.handler = cls.handlers.get(line.get('method'))
+            line.sync_handler = cls.sync_handlers.get(line.get('method'))
+            line.arguments = cls.arguments_by_name(line)
+            line.service_plan = None
+
+            args = line.get('args')
+            if isinstance(args, list):
+                # Copied, so that the raw tree of the release is untouched.
+                line['args'] = [cls.compile_node(arg) for arg in args]
+
+            compiled[ln] = line
+            compiled.lines.append(line)
+
+        for line in compiled.lines:
+            line.next_index = cls._index_of(compiled, line.get('next'))
+            line.parent_index = cls._index_of(compiled, line.get('parent'))
+            line.enter_index = cls._index_of(compiled, line.get('enter'))
+
+        cls._index_blocks(compiled)
+        cls._index_dataflow(compiled)
+        cls._index_purity(compiled)
+
+        if resolver_mode in (ResolverMode.COMPILER,
+                             ResolverMode.DIFFERENTIAL):
+            cls._compile_expressions(compiled, resolver_mode)
+
+        return compiled
+
+    @classmethod
+    def _compile_expressions(cls, compiled: CompiledTree, resolver_mode):
+        for line in compiled.lines:
+            for arg in line.get('args') or []:
+                if isinstance(arg, Node):
+                    for value in arg.arguments.values():
+                        cls._compile_expression(compiled, value,
+                                                resolver_mode)
+                elif isinstance(arg, dict) and \
+                        arg.get('$OBJECT') in ('argument', 'arg'):
+                    # These are resolved by their name (see below).
+                    continue
+                else:
+                    cls._compile_expression(compiled, arg, resolver_mode)
+
+            for value in line.arguments.values():
+                cls._compile_expression(compiled, value, resolver_mode)
+
+    @staticmethod
+    def _compile_expression(compiled: CompiledTree, item, resolver_mode):
+        if type(item) not in (dict, list) or id(item) in compiled.expressions:
+            # Anything else resolves to itself.
+            return
+
+        try:
+            fn = ExpressionCompiler.compile(item)
+        except Exception:
+            # Malformed values are left to the Resolver,
+            # which will fail on them at runtime, in context.
+            return
+
+        if resolver_mode == ResolverMode.DIFFERENTIAL:
+            fn = ExpressionCompiler.differential(item, fn)
+
+        compiled.expressions[id(item)] = (item, fn)
+
+    @classmethod
+    def _index_blocks(cls, compiled: CompiledTree):
+        """
+        Precomputes the hierarchy of every line, and where every block ends,
+        so that navigating through blocks at runtime never has to walk
+        the tree.
+        """
+        for line in compiled.lines:
+            line.ancestors = None
+
+        for line in compiled.lines:
+            cls._index_hierarchy(compiled, line)
+
+        exits = {}
+        for line in reversed(compiled.lines):
+            line.block_exit = cls._block_exit(compiled, line, exits)
+
+    @classmethod
+    def _index_hierarchy(cls, compiled: CompiledTree, line: Line):
+        if line.ancestors is not None:
+            return
+
+        parent = compiled.line_at(line.parent_index)
+        if parent is None:
+            line.ancestors = frozenset()
+            line.enclosing = {}
+            return
+
+        cls._index_hierarchy(compiled, parent)
+        line.ancestors = parent.ancestors | {parent['ln']}
+        line.enclosing = dict(parent.enclosing)
+        line.enclosing[parent.get('method')] = parent['ln']
+
+    @classmethod
+    def _block_exit(cls, compiled: CompiledTree, parent_line: Line,
+                    exits: dict):
+        """
+        Given a parent_line, it skips through the block and returns the next
+        line after this block. See Story#next_block for the details.
+        """
+        if parent_line.index in exits:
+            return exits[parent_line.index]
+
+        parent_line_number = parent_line['ln']
+        next_line = parent_line
+        block_exit = None
+
+        while next_line.next_index is not None:
+            next_line = compiled.lines[next_line.next_index]
+
+            # See if the next line is a block. If it is, skip through it.
+            if next_line.get('enter') is not None \
+                    and next_line.get('parent') == parent_line_number:
+                next_line = cls._block_exit(compiled, next_line, exits)
+
+                if next_line is None:
+                    break
+
+            if parent_line_number not in next_line.ancestors:
+                break
+
+        if next_line is not None \
+                and parent_line_number not in next_line.ancestors \
+                and next_line['ln'] != parent_line_number:
+            block_exit = next_line
+
+        exits[parent_line.index] = block_exit
+        return block_exit
+
+    @classmethod
+    def _index_dataflow(cls, compiled: CompiledTree):
+        """
+        Finds runs of consecutive execute lines (within the same block)
+        which are independent of each other: no line reads a variable which
+        another line of the run writes, no two lines write the same
+        variable, no two lines call the same service (since the order
+        of the calls to a service may be observed by it), and no line calls
+        one of barrier_services. Such lines may be executed concurrently
+        (see Lexicon#execute_parallel).
+
+        Calls of different services which share state otherwise (such as
+        two services backed by the same database) can't be told apart from
+        independent ones: apps list them in runtime.execute.unsafe.
+        """
+        for line in reversed(compiled.lines):
+            line.independent = None
+            if not cls._is_plain_execute(line):
+                continue
+
+            run = [line]
+            accesses = [cls._accesses_of(line)]
+            following = compiled.line_at(line.next_index)
+            while following is not None \
+                    and cls._is_plain_execute(following) \
+                    and following.get('parent') == line.get('parent'):
+                reads, writes = cls._accesses_of(following)
+                if any(reads & w or writes & r or writes & w
+                       for r, w in accesses):
+                    break
+
+                run.append(following)
+                accesses.append((reads, writes))
+                following = compiled.line_at(following.next_index)
+
+            if len(run) > 1:
+                line.independent = tuple(ln.get('ln') for ln in run)
+
+    @staticmethod
+    def _is_plain_execute(line: Line):
+        # Streaming services (which have a block) aren't plain calls.
+        return line.get('method') == 'execute' and line.get('enter') is None
+
+    @classmethod
+    def _accesses_of(cls, line: Line):
+        """
+        :return: The variables read by line, and the variables written by
+        line. The service of line counts as both, and so does the state
+        shared by services, for calls of barrier_services.
+        """
+        reads = set()
+        cls._collect_reads(line.get('args'), reads)
+        writes = set(line.get('output') or [])
+        name = line.get('name')
+        if name:
+            writes.add(name[0])
+
+        service = line.get('service')
+        if service is not None:
+            reads.add(service)
+            writes.add(service)
+            reads.add(cls.external_state)
+            if service in cls.barrier_services:
+                writes.add(cls.external_state)
+
+        return reads, writes
+
+    @classmethod
+    def _collect_reads(cls, item, reads: set):
+        if isinstance(item, list):
+            for value in item:
+                cls._collect_reads(value, reads)
+        elif isinstance(item, dict):
+            if item.get('$OBJECT') == 'path':
+                paths = item.get('paths')
+                if paths and isinstance(paths[0], str):
+                    reads.add(paths[0])
+
+            for value in item.values():
+                cls._collect_reads(value, reads)
+
+    @classmethod
+    def _index_purity(cls, compiled: CompiledTree):
+        """
+        Finds the functions which are pure: they neither call services,
+        nor listen to events, nor read anything but their arguments and
+        their own variables, nor modify a value in place, nor call
+        functions which aren't pure themselves. Calling such a function
+        again with the same arguments returns the same value, so calls of
+        it may be memoized (see FunctionCache).
+        """
+        functions = {}
+        bodies = {}
+        for line in compiled.lines:
+            line.pure = None
+            if line.get('method') == 'function':
+                functions[line.get('function')] = line
+            elif 'function' in line.enclosing:
+                bodies.setdefault(line.enclosing['function'], []).append(line)
+
+        callees = {}
+        for name, function_line in functions.items():
+            callees[name] = set()
+            function_line.pure = cls._is_pure(
+                function_line, bodies.get(function_line.get('ln'), []),
+                callees[name])
+
+        # Functions which call impure ones are impure too, transitively.
+        changed = True
+        while changed:
+            changed = False
+            for name, function_line in functions.items():
+                if function_line.pure and not all(
+                        callee in functions and functions[callee].pure
+                        for callee in callees[name]):
+                    function_line.pure = False
+                    changed = True
+
+    @classmethod
+    def _is_pure(cls, function_line: Line, body: list, callees: set):
+        names = set(function_line.arguments)
+        reads = set()
+        for line in body:
+            if line.get('method') not in cls.pure_methods:
+                return False
+
+            if line.get('method') == 'call':
+                callees.add(line.get('function'))
+
+            name = line.get('name') or []
+            if len(name) > 1:
+                # Such as a.b = 1, which may modify an argument in place.
+                return False
+
+            names.update(name)
+            names.update(line.get('output') or [])
+            if cls._has_impure_mutation(line.get('args')):
+                return False
+
+            cls._collect_reads(line.get('args'), reads)
+
+        return reads <= names
+
+    @classmethod
+    def _has_impure_mutation(cls, item):
+        if isinstance(item, list):
+            return any(cls._has_impure_mutation(value) for value in item)
+
+        if isinstance(item, dict):
+            if item.get('$OBJECT') == 'mutation' and \
+                    item.get('mutation') in cls.impure_mutations:
+                return True
+
+            return any(cls._has_impure_mutation(value)
+                       for value in item.values())
+
+        return False
+
+    @staticmethod
+    def _index_of(compiled: CompiledTree, line_number):
+        line = compiled.get(line_number)
+        if line is None:
+            return None
+
+        return line.index
+
+    @classmethod
+    def compile_stories(cls, stories: dict,
+                        resolver_mode=ResolverMode.INTERPRETER) -> dict:
+        """
+        Compiles the trees of all stories of an app.
+
+        :return: The compiled trees, keyed by the story name
+        """
+        compiled = {}
+        for story_name, story in stories.items():
+            compiled[story_name] = cls.compile(story['tree'], resolver_mode)
+
+        return compiled
+
+    @classmethod
+    def tree_for(cls, app, story_name):
+        """
+        Returns the compiled tree for the story story_name.
+
+        Apps compile all of their stories when they're deployed
+        (see App#compiled_stories). Stories which weren't compiled ahead
+        of time are compiled here, on demand, and kept along with the
+        others, so that they're compiled just once too.
+        """
+        compiled = app.compiled_stories.get(story_name)
+        if isinstance(compiled, CompiledTree):
+            return compiled
+
+        tree = app.stories[story_name]['tree']
+        if isinstance(tree, dict):
+            compiled = cls.compile(tree, app.config.RESOLVER_MODE)
+            app.compiled_stories[story_name] = compiled
+            return compiled
+
+        return tree
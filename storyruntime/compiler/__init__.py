@@ -0,0 +1,6 @@
+from .CompiledTree import CompiledTree, Line, Node
+from .ExpressionCompiler import ExpressionCompiler
+from .StoryCompiler import StoryCompiler
+
+__all__ = ['CompiledTree', 'ExpressionCompiler', 'Line', 'Node',
+           'StoryCompiler']
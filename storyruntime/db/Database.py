@@ -130,6 +130,68 @@ class Database:
             owner_email=data['owner_email']
         )
 
+    @classmethod
+    async def create_subscriptions_table(cls, config: Config):
+        """
+        Creates the table of the subscription registry of apps (see
+        SubscriptionRegistry), unless it exists already.
+        """
+        async with cls.get_pooled_conn(config) as con:
+            await con.execute("""
+            create table if not exists app_subscriptions (
+                app_uuid uuid not null
+                    references apps (uuid) on delete cascade,
+                fingerprint text not null,
+                body jsonb not null,
+                container_id text,
+                primary key (app_uuid, fingerprint)
+            );
+            """)
+
+    @classmethod
+    async def get_subscriptions(cls, config: Config, app_id) -> dict:
+        """
+        :return: The registered subscriptions of app_id (their body, and
+        the ID of the container they were subscribed to), keyed by their
+        fingerprint (see SubscriptionRegistry)
+        """
+        async with cls.get_pooled_conn(config) as con:
+            query = """
+            select fingerprint, body, container_id
+            from app_subscriptions
+            where app_uuid = $1;
+            """
+            rows = await con.fetch(query, app_id)
+            return {
+                row['fingerprint']: {
+                    'body': row['body'],
+                    'container_id': row['container_id']
+                } for row in rows
+            }
+
+    @classmethod
+    async def set_subscriptions(cls, config: Config, app_id,
+                                subscriptions: dict):
+        """
+        Replaces the registered subscriptions of app_id with subscriptions
+        (see Database#get_subscriptions).
+        """
+        async with cls.get_pooled_conn(config) as con:
+            # queries in transaction callback are rolled back on failure
+            async with con.transaction():
+                await con.execute("""
+                delete from app_subscriptions
+                where app_uuid = $1;
+                """, app_id)
+                await con.executemany("""
+                insert into app_subscriptions
+                    (app_uuid, fingerprint, body, container_id)
+                values ($1, $2, $3, $4);
+                """, [
+                    (app_id, fingerprint, sub['body'], sub['container_id'])
+                    for fingerprint, sub in subscriptions.items()
+                ])
+
     @classmethod
     async def get_service_tag_uuids(cls, config: Config, data: list) -> list:
         async with cls.get_pooled_conn(config) as con:
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import enum
+
+
+@enum.unique
+class ExecutionEngine(enum.Enum):
+    LEXICON = 'LEXICON'  # Interprets stories, line by line.
+    CODEGEN = 'CODEGEN'  # Runs code generated once per release.
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+import enum
+
+
+@enum.unique
+class LineRecording(enum.Enum):
+    OFF = 'OFF'  # Nothing is recorded.
+    LAST = 'LAST'  # The last N executions of lines.
+    SAMPLED = 'SAMPLED'  # One in every N executions of lines.
+    FULL = 'FULL'  # The last execution of every line.
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+import enum
+
+
+@enum.unique
+class ResolverMode(enum.Enum):
+    INTERPRETER = 'INTERPRETER'  # Resolves the raw tree, every time.
+    COMPILER = 'COMPILER'  # Uses closures compiled once per release.
+    DIFFERENTIAL = 'DIFFERENTIAL'  # Both, and verifies that they agree.
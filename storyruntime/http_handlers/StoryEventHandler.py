@@ -11,10 +11,13 @@ import ujson
 from .BaseHandler import BaseHandler
 from .. import Metrics
 from ..Apps import Apps
+from ..Story import MAX_BYTES_LOGGING
 from ..constants import ContextConstants
 from ..entities.Multipart import FileFormField
 from ..processing import Stories
 from ..utils.Dict import Dict
+from ..utils.StringUtils import Truncated
+from ..utils.TypeUtils import TypeUtils
 
 CLOUD_EVENTS_FILE_KEY = '_ce_payload'
 
@@ -54,9 +57,9 @@ class StoryEventHandler(BaseHandler):
 
         try:
             event_body = self.get_ce_event_payload()
-            self.logger.info(f'Running story for {app_id}: '
-                             f'{story_name} @ {block} for '
-                             f'event {event_body}')
+            self.logger.info('Running story for {}: {} @ {} for event {}',
+                             app_id, story_name, block,
+                             Truncated(event_body, MAX_BYTES_LOGGING))
 
             await self.run_story(app_id, story_name, block,
                                  event_body)
@@ -102,4 +105,4 @@ class StoryEventHandler(BaseHandler):
                 headers = CaseInsensitiveDict(data=headers)
                 payload['data']['headers'] = headers
 
-        return payload
+        return TypeUtils.sanitize(payload)
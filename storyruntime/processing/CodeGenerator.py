@@ -0,0 +1,774 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .Lexicon import Lexicon
+from .Mutations import Mutations
+from ..Exceptions import StackOverflowException, StoryscriptError, \
+    StoryscriptRuntimeError
+from ..FunctionCache import FunctionCache
+from ..compiler import CompiledTree
+
+Program = namedtuple('Program', ['tree', 'source', 'execute'])
+"""
+The code generated for a story. execute(logger, story) is a coroutine
+function, which executes the story from its entrypoint, just like
+Stories#execute does with the Lexicon.
+"""
+
+Scope = namedtuple('Scope', ['kind', 'line'])
+"""
+A construct which break, continue and return statements jump out of.
+kind is one of 'for', 'while', 'function' and 'block' (a block executed
+by a try statement, which swallows all of these).
+"""
+
+
+class CodeGenerationError(Exception):
+    """
+    Raised when a story can't be translated into code, which behaves
+    exactly like the Lexicon does for it. Such stories are executed by
+    the Lexicon instead.
+    """
+    pass
+
+
+class CodeGenerator:
+    """
+    Translates the compiled tree of a story into the source of a single
+    Python module. The story becomes one coroutine, and every function in
+    the story becomes another one. if/elif/else, for, while and try become
+    native Python control flow, break and continue become Python's break
+    and continue, and a return from a function is Python's return.
+    Looking up lines, following line numbers and passing sentinels
+    through Lexicon#execute_block is thereby done just once, here.
+
+    The generated code mirrors what the Lexicon does, line by line:
+    every line which the Lexicon would execute is started
+    (see Story#start_line) and pushed onto the stack of the story, errors
+    are wrapped and attributed to the same line, and lines which perform
+    I/O (execute, when) are handed to the Lexicon itself.
+
+    The blocks of when statements are executed by the Lexicon, as they're
+    run by Stories#run, once an event arrives.
+    """
+
+    MAX_WHILE_ITERATIONS = 100000
+
+    def __init__(self, tree: CompiledTree, functions: dict,
+                 concurrent_loops=(), parallel_groups=None):
+        self.tree = tree
+        self.functions = functions
+        self.concurrent_loops = concurrent_loops
+        """
+        The line numbers of for loops, which execute their iterations
+        concurrently (see Lexicon#for_loop_concurrent).
+        """
+        self.parallel_groups = parallel_groups or {}
+        """
+        Maps the line numbers of execute lines, which execute concurrently
+        with the lines following them, to their group
+        (see Lexicon#parallel_group).
+        """
+        self.namespace = {
+            'FunctionCache': FunctionCache,
+            'Lexicon': Lexicon,
+            'Mutations': Mutations,
+            'StackOverflowException': StackOverflowException,
+            'StoryscriptError': StoryscriptError,
+            'StoryscriptRuntimeError': StoryscriptRuntimeError
+        }
+        self.constants = {}
+        self.code = []
+        self.depth = 0
+
+        self.scopes = []
+        self.wrap = True
+        """
+        True if errors raised by the current line must be wrapped
+        (see Lexicon#_line_error). Lines nested in a for or while loop,
+        or in a function, don't have to: errors are always attributed to
+        the outermost line which is executing, once they reach it.
+        """
+
+        self.top_level = False
+        """
+        True if the current line is executed by Stories#execute
+        (which logs every line number it executes).
+        """
+
+    @classmethod
+    def generate(cls, tree: CompiledTree, entrypoint, functions: dict,
+                 concurrent_loops=(), parallel_groups=None):
+        """
+        :return: The Program for the story with the given tree
+        :raises CodeGenerationError: If the story can't be translated
+        """
+        generator = cls(tree, functions or {}, concurrent_loops,
+                        parallel_groups)
+        source = generator.module(entrypoint)
+
+        try:
+            code = compile(source, '<story>', 'exec')
+        except (SyntaxError, RecursionError) as e:
+            # Such as "too many statically nested blocks".
+            raise CodeGenerationError(str(e))
+
+        namespace = generator.namespace
+        exec(code, namespace)
+        return Program(tree=tree, source=source, execute=namespace['main'])
+
+    @classmethod
+    def generate_stories(cls, stories: dict, compiled_stories: dict,
+                         app_config=None) -> dict:
+        """
+        Generates the programs for all stories of an app. Stories which
+        can't be translated are left out.
+
+        :param app_config: The AppConfig of the app, which configures
+        which for loops (and which service calls) execute concurrently
+
+        :return: The programs, keyed by the story name
+        """
+        programs = {}
+        for story_name, story in stories.items():
+            tree = compiled_stories.get(story_name)
+            if not isinstance(tree, CompiledTree):
+                continue
+
+            concurrent_loops = {
+                line['ln'] for line in tree.lines
+                if line.get('method') == 'for' and
+                Lexicon.for_loop_concurrency(
+                    app_config, story_name, line) > 1
+            }
+
+            parallel_groups = {}
+            for line in tree.lines:
+                group = Lexicon.parallel_group(app_config, tree, line)
+                if group is not None:
+                    parallel_groups[line['ln']] = group
+
+            try:
+                programs[story_name] = cls.generate(
+                    tree, story.get('entrypoint'), story.get('functions'),
+                    concurrent_loops, parallel_groups)
+            except CodeGenerationError:
+                continue
+
+        return programs
+
+    @staticmethod
+    def program_for(story):
+        """
+        :return: The Program which executes story, or None if it must be
+        executed by the Lexicon
+        """
+        programs = getattr(story.app, 'programs', None)
+        if not isinstance(programs, dict):
+            return None
+
+        program = programs.get(story.name)
+        if isinstance(program, Program) and program.tree is story.tree:
+            return program
+
+        return None
+
+    def module(self, entrypoint):
+        for function_name, line_number in self.functions.items():
+            function_line = self.line(line_number)
+            if function_line is None:
+                raise CodeGenerationError(
+                    f'Function {function_name} not found')
+
+            self.function(function_line)
+
+        self.main(entrypoint)
+        return '\n'.join(self.code) + '\n'
+
+    def main(self, entrypoint):
+        with self.block('async def main(logger, story):'):
+            self.emit('stack = story.get_stack()')
+            self.emit('scheduler = story.scheduler')
+            self.wrap = True
+            self.top_level = True
+            self.sequence(self.line(entrypoint), None)
+            self.top_level = False
+
+    def function(self, function_line):
+        with self.block(f'async def {self.function_name(function_line)}'
+                        f'(logger, story):'):
+            self.emit('stack = story.get_stack()')
+            self.emit('scheduler = story.scheduler')
+            self.wrap = False
+            self.scopes = [Scope(kind='function', line=function_line)]
+            self.sequence(self.first_line(function_line), function_line['ln'])
+            self.scopes = []
+
+    @staticmethod
+    def function_name(function_line):
+        return f'function_{function_line.index}'
+
+    def sequence(self, line, container):
+        """
+        Emits the lines starting at line, for as long as the Lexicon would
+        keep executing them in the block of container (or, if container is
+        None, for as long as Stories#execute would).
+
+        :return: The line the Lexicon would continue with
+        """
+        seen = set()
+        while line is not None and \
+                (container is None or container in line.ancestors):
+            if line.index in seen:
+                raise CodeGenerationError(f'Line {line["ln"]} loops')
+
+            seen.add(line.index)
+            line = self.statement(line)
+
+        return line
+
+    def statement(self, line):
+        """
+        Emits a line.
+
+        :return: The line which the Lexicon would execute next
+        """
+        method = line.get('method')
+        if method in ('set', 'expression', 'mutation'):
+            return self.set(line)
+        elif method == 'if':
+            return self.if_(line)
+        elif method in ('elif', 'else', 'function'):
+            # These are skipped when they're reached.
+            return self.simple(line, None, line.block_exit)
+        elif method == 'for':
+            return self.for_(line)
+        elif method == 'while':
+            return self.while_(line)
+        elif method == 'try':
+            return self.try_(line)
+        elif method == 'call':
+            return self.call(line)
+        elif method == 'execute' and line['ln'] in self.parallel_groups:
+            return self.parallel(line)
+        elif method == 'execute':
+            return self.simple(
+                line,
+                f'await Lexicon.execute(logger, story, {self.ref(line)})',
+                self.next_line(line))
+        elif method == 'when':
+            return self.simple(
+                line, f'await Lexicon.when(logger, story, {self.ref(line)})',
+                line.block_exit)
+        elif method == 'throw':
+            return self.simple(
+                line, f'Lexicon.throw(logger, story, {self.ref(line)})',
+                self.next_line(line))
+        elif method == 'break':
+            return self.jump(line, 'break', 'for' in line.enclosing)
+        elif method == 'continue':
+            return self.jump(line, 'continue', 'for' in line.enclosing or
+                             'while' in line.enclosing)
+        elif method == 'return':
+            return self.ret(line)
+
+        raise CodeGenerationError(f'Unsupported method: {method}')
+
+    def parallel(self, line):
+        """
+        See Lexicon#execute_parallel, which starts (and wraps the errors of)
+        every line of the group itself.
+        """
+        group = self.parallel_groups[line['ln']]
+        self.emit(f'await Lexicon.execute_parallel(logger, story, '
+                  f'{self.const(group)})')
+        successor = self.next_line(self.line(group[-1]))
+        self.log(successor)
+        return successor
+
+    def simple(self, line, statement, successor):
+        self.start(line)
+        if statement is not None:
+            with self.wrapped(line):
+                self.emit(statement)
+
+        self.end(successor)
+        return successor
+
+    def set(self, line):
+        args = line.get('args')
+        if 'name' not in line or not args or \
+                (len(args) > 1 and not self.is_mutation(args[1])):
+            # Lexicon#set_sync raises the appropriate error.
+            return self.simple(
+                line, f'Lexicon.set_sync(logger, story, {self.ref(line)})',
+                self.next_line(line))
+
+        assign = {'$OBJECT': 'path', 'paths': line['name']}
+
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'value = story.resolve({self.const(args[0])})')
+            if len(args) > 1:
+                self.emit(f'value = Mutations.mutate({self.const(args[1])}, '
+                          f'value, story, {self.ref(line)})')
+                self.emit("logger.debug('Mutation result: {}', value)")
+
+            self.emit(f'story.end_line({line["ln"]!r}, output=value, '
+                      f'assign={self.const(assign)})')
+
+        successor = self.next_line(line)
+        self.end(successor)
+        return successor
+
+    @staticmethod
+    def is_mutation(arg):
+        return isinstance(arg, dict) and arg.get('$OBJECT') == 'mutation'
+
+    def if_(self, line):
+        """
+        See Lexicon#if_condition.
+        """
+        members = [line]
+        while members[-1]['method'] != 'else':
+            next_line = members[-1].block_exit
+            if next_line is None or \
+                    next_line.get('parent') != line.get('parent') or \
+                    next_line['method'] not in ('elif', 'else'):
+                break
+
+            members.append(next_line)
+
+        exit_line = members[-1].block_exit
+        branch = f'branch_{line.index}'
+
+        for member in members:
+            if member.get('enter') is None or \
+                    self.line(member['enter']) is None:
+                raise CodeGenerationError(
+                    f'Line {member["ln"]} has nothing to enter')
+
+        # All conditions are evaluated by the first line.
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'{branch} = None')
+            depth = self.depth
+            for index, member in enumerate(members):
+                self.emit(f"logger.log('lexicon-if', {self.ref(member)}, "
+                          f'story.context)')
+                if member['method'] == 'else':
+                    self.emit(f'{branch} = {index}')
+                    break
+
+                self.emit(f'if Lexicon._is_if_condition_true('
+                          f'story, {self.ref(member)}):')
+                self.depth += 1
+                self.emit(f'{branch} = {index}')
+                self.depth -= 1
+                self.emit('else:')
+                self.depth += 1
+
+            if members[-1]['method'] != 'else':
+                self.emit('pass')
+
+            self.depth = depth
+
+        self.emit('stack.pop()')
+
+        for index, member in enumerate(members):
+            keyword = 'if' if index == 0 else 'elif'
+            with self.block(f'{keyword} {branch} == {index}:'):
+                self.log(self.line(member['enter']))
+                next_line = self.sequence(self.line(member['enter']),
+                                          member['ln'])
+
+                # The lines of the other branches are skipped.
+                while next_line is not None and \
+                        next_line is not exit_line and \
+                        any(next_line is m for m in members[index + 1:]):
+                    next_line = self.simple(next_line, None,
+                                            next_line.block_exit)
+
+                if next_line is not exit_line:
+                    raise CodeGenerationError(
+                        f'Line {member["ln"]} is left unexpectedly')
+
+        if members[-1]['method'] != 'else':
+            with self.block('else:'):
+                self.log(exit_line)
+
+        return exit_line
+
+    def for_(self, line):
+        """
+        See Lexicon#for_loop.
+        """
+        args = line.get('args')
+        if not args or not line.get('output'):
+            raise CodeGenerationError(f'Line {line["ln"]} is incomplete')
+
+        if line['ln'] in self.concurrent_loops:
+            if any(line['ln'] in child.ancestors and
+                   child.get('method') == 'return'
+                   for child in self.tree.lines):
+                # Its sentinel would have to be handled here.
+                raise CodeGenerationError(
+                    f'Line {line["ln"]} returns from a concurrent loop')
+
+            return self.simple(
+                line,
+                f'await Lexicon.for_loop(logger, story, {self.ref(line)})',
+                line.block_exit)
+
+        items = f'items_{line.index}'
+        item = f'item_{line.index}'
+        output = self.const(line['output'][0])
+
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'{items} = story.resolve({self.const(args[0])}, '
+                      f'encode=False)')
+            with self.block('try:'):
+                with self.block(f'for {item} in {items}:'):
+                    self.emit(f'story.context[{output}] = {item}')
+                    self.body(line, 'for')
+                    self.pace(line)
+
+            with self.block('finally:'):
+                self.emit(f'del story.context[{output}]')
+
+        self.end(line.block_exit)
+        return line.block_exit
+
+    def while_(self, line):
+        """
+        See Lexicon#while_.
+        """
+        args = line.get('args')
+        if not args:
+            raise CodeGenerationError(f'Line {line["ln"]} is incomplete')
+
+        count = f'count_{line.index}'
+
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'{count} = 0')
+            with self.block(f'while story.evaluate({self.const(args[0])}):'):
+                with self.block(
+                        f'if {count} >= {self.MAX_WHILE_ITERATIONS}:'):
+                    self.emit(
+                        f'raise StoryscriptRuntimeError('
+                        f"message='Call count limit reached within while "
+                        f'loop. Only {self.MAX_WHILE_ITERATIONS} iterations '
+                        f"allowed.', story=story, line={self.ref(line)})")
+
+                self.body(line, 'while')
+                self.pace(line)
+
+        self.end(line.block_exit)
+        return line.block_exit
+
+    def pace(self, loop_line):
+        """
+        Ends an iteration of a loop: lets other stories run once this one
+        has used up its time slice (see Lexicon#for_loop, Lexicon#while_
+        and Scheduler).
+        """
+        with self.block('if scheduler.due():'):
+            self.emit('await scheduler.yield_()')
+
+        if loop_line['method'] == 'while':
+            self.emit(f'count_{loop_line.index} += 1')
+
+    def body(self, line, kind):
+        """
+        Emits the block of line, as executed by Lexicon#execute_block.
+        """
+        state = (self.wrap, self.top_level)
+        self.wrap = kind == 'block'
+        self.top_level = False
+        self.scopes.append(Scope(kind=kind, line=line))
+
+        self.sequence(self.first_line(line), line['ln'])
+
+        self.scopes.pop()
+        self.wrap, self.top_level = state
+
+    def try_(self, line):
+        """
+        See Lexicon#try_catch.
+        """
+        next_line = line.block_exit
+        if next_line is None:
+            # The Lexicon doesn't execute anything in this case.
+            return self.simple(line, None, None)
+
+        if next_line['method'] == 'finally':
+            catch_line = None
+            finally_line = next_line
+        elif next_line['method'] == 'catch':
+            catch_line = next_line
+            finally_line = next_line.block_exit
+            if finally_line is not None and \
+                    finally_line['method'] != 'finally':
+                finally_line = None
+        else:
+            raise CodeGenerationError(
+                f'Line {line["ln"]} is neither caught nor finalized')
+
+        if finally_line is None:
+            exit_line = catch_line.block_exit
+        else:
+            exit_line = finally_line.block_exit
+
+        blocks = [(f'try_{line.index}', line)]
+        if catch_line is not None:
+            blocks.append((f'catch_{line.index}', catch_line))
+        if finally_line is not None:
+            blocks.append((f'finally_{line.index}', finally_line))
+
+        self.start(line)
+        with self.wrapped(line):
+            for name, block_line in blocks:
+                # Blocks are closures, so that the sentinels which they
+                # return (break, continue, return) are swallowed,
+                # as they are by Lexicon#try_catch.
+                scopes = self.scopes
+                self.scopes = []
+                with self.block(f'async def {name}():'):
+                    self.body(block_line, 'block')
+
+                self.scopes = scopes
+
+            run_finally = f'await finally_{line.index}()'
+            with self.block('try:'):
+                self.emit(f'await try_{line.index}()')
+
+            with self.block('except StoryscriptError:'):
+                if catch_line is None:
+                    self.emit('pass')
+                else:
+                    with self.block('try:'):
+                        self.emit(f'await catch_{line.index}()')
+
+                    with self.block('except StoryscriptError as e:'):
+                        if finally_line is not None:
+                            self.emit(run_finally)
+
+                        self.emit('raise e')
+
+            if finally_line is not None:
+                self.emit(run_finally)
+
+        self.end(exit_line)
+        return exit_line
+
+    def call(self, line):
+        """
+        See Lexicon#call.
+        """
+        line_number = self.functions.get(line.get('function'))
+        function_line = self.line(line_number)
+        if function_line is None:
+            # Lexicon#call raises the appropriate error.
+            return self.simple(
+                line, f'await Lexicon.call(logger, story, {self.ref(line)})',
+                self.next_line(line))
+
+        current = f'context_{line.index}'
+        returned = f'returned_{line.index}'
+        key = f'key_{line.index}'
+        hit = f'hit_{line.index}'
+        invoke = [
+            'story.set_context(context)',
+            f'{returned} = await {self.function_name(function_line)}'
+            f'(logger, story)'
+        ]
+
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'{current} = story.context')
+            self.emit(f'context = story.context_for_function_call('
+                      f'{self.ref(line)}, {self.ref(function_line)})')
+            if function_line.pure:
+                self.emit(f'{key}, {hit}, {returned} = FunctionCache.lookup('
+                          f'story, {self.ref(function_line)}, context)')
+            else:
+                self.emit(f'{returned} = None')
+
+            with self.block('try:'):
+                if function_line.pure:
+                    with self.block(f'if not {hit}:'):
+                        for statement in invoke:
+                            self.emit(statement)
+                        with self.block(f'if {key} is not None:'):
+                            self.emit(f'story.app.function_cache.put('
+                                      f'{key}, {returned})')
+                else:
+                    for statement in invoke:
+                        self.emit(statement)
+
+            with self.block('finally:'):
+                self.emit(f'story.set_context({current})')
+                if line.get('name') is not None and len(line['name']) > 0:
+                    assign = {'$OBJECT': 'path', 'paths': line['name']}
+                    self.emit(f'story.end_line({line["ln"]!r}, '
+                              f'output={returned}, '
+                              f'assign={self.const(assign)})')
+
+        successor = self.next_line(line)
+        self.end(successor)
+        return successor
+
+    def ret(self, line):
+        """
+        See Lexicon#ret.
+        """
+        if 'when' in line.enclosing:
+            # Such returns end blocks which are executed by the Lexicon.
+            raise CodeGenerationError(f'Line {line["ln"]} returns from when')
+
+        statement = f'Lexicon.ret_sync(logger, story, {self.ref(line)})'
+        if 'function' not in line.enclosing:
+            # Raises InvalidKeywordUsage.
+            return self.simple(line, statement, self.next_line(line))
+
+        self.start(line)
+        with self.wrapped(line):
+            self.emit(f'returned = {statement}.return_value')
+
+        self.emit('stack.pop()')
+        self.exit_scopes('return')
+        return self.next_line(line)
+
+    def jump(self, line, keyword, valid):
+        """
+        See Lexicon#break_ and Lexicon#continue_.
+        """
+        if not valid:
+            # Raises InvalidKeywordUsage.
+            return self.simple(
+                line, f'Lexicon.{keyword}_sync(logger, story, '
+                      f'{self.ref(line)})',
+                self.next_line(line))
+
+        self.start(line)
+        self.emit('stack.pop()')
+        self.exit_scopes(keyword)
+        return self.next_line(line)
+
+    def exit_scopes(self, keyword):
+        """
+        Emits the jump out of the innermost scope which handles keyword,
+        unwinding all scopes on the way, as the sentinel which the Lexicon
+        uses for keyword would.
+        """
+        for scope in reversed(self.scopes):
+            if scope.kind == 'block':
+                self.emit('return')
+                return
+            elif scope.kind == 'function':
+                if keyword != 'return':
+                    raise CodeGenerationError(f"Can't {keyword} here")
+
+                self.emit('return returned')
+                return
+
+            self.pace(scope.line)
+
+            if keyword != 'return':
+                self.emit(keyword)
+                return
+
+            # The loop returns the sentinel, and is therefore done.
+            self.emit('stack.pop()')
+
+        raise CodeGenerationError(f"Can't {keyword} here")
+
+    def start(self, line):
+        """
+        See Lexicon#execute_line and Story#new_frame.
+        """
+        line_number = repr(line['ln'])
+        self.emit(f'story.start_line({line_number})')
+        with self.block('if len(stack) >= story.max_frames:'):
+            self.emit('raise StackOverflowException(story.max_frames)')
+
+        self.emit(f'stack.append({line_number})')
+
+    def end(self, successor):
+        self.emit('stack.pop()')
+        self.log(successor)
+
+    def log(self, successor):
+        """
+        Stories#execute logs every line number it continues with.
+        """
+        if self.top_level:
+            line_number = None if successor is None else successor['ln']
+            self.emit(f"logger.log('story-execution', {line_number!r})")
+
+    @contextmanager
+    def wrapped(self, line):
+        if not self.wrap:
+            yield
+            return
+
+        with self.block('try:'):
+            yield
+
+        with self.block('except BaseException as e:'):
+            self.emit(f'raise Lexicon._line_error(story, {self.ref(line)}, e)')
+
+    @contextmanager
+    def block(self, header):
+        self.emit(header)
+        self.depth += 1
+        length = len(self.code)
+        yield
+        if len(self.code) == length:
+            self.emit('pass')
+
+        self.depth -= 1
+
+    def emit(self, statement):
+        self.code.append('    ' * self.depth + statement)
+
+    def const(self, value):
+        """
+        :return: The name under which the generated code finds value
+        """
+        name = self.constants.get(id(value))
+        if name is None:
+            name = f'C{len(self.constants)}'
+            self.constants[id(value)] = name
+            self.namespace[name] = value
+
+        return name
+
+    def ref(self, line):
+        return self.const(line)
+
+    def line(self, line_number):
+        if line_number is None:
+            return None
+
+        line = self.tree.get(line_number)
+        if line is None:
+            raise CodeGenerationError(f'Line {line_number} not found')
+
+        return line
+
+    def next_line(self, line):
+        return self.line(line.get('next'))
+
+    def first_line(self, parent_line):
+        """
+        See Lexicon#execute_block.
+        """
+        if 'enter' not in parent_line:
+            raise CodeGenerationError(
+                f'Line {parent_line["ln"]} has nothing to enter')
+
+        return self.line(parent_line['enter'])
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+from ..Exceptions import StoryscriptRuntimeError
+from ..FunctionCache import FunctionCache
+from ..constants.LineSentinels import LineSentinels, ReturnSentinel
+
+
+class Frame:
+    """
+    A block which Lexicon#execute_block is executing, on its stack of
+    frames. Instead of awaiting the handler of a for loop, a while loop
+    or a function call (which would await Lexicon#execute_block for its
+    block in turn), Lexicon#execute_block pushes a frame for such a line,
+    and executes its block itself. Nesting these doesn't nest coroutines,
+    and therefore doesn't use up the stack of the interpreter.
+
+    A frame behaves exactly like the handler of its line (see Lexicon),
+    split up in steps:
+    - Frame#enter starts the frame (such as the first iteration of a loop)
+    - Frame#repeat is called whenever the block of the frame ended
+    - Frame#finally_ is called once the frame is done, or once it failed,
+      just like the finally clause of the handler
+
+    Once a frame is done, Frame#exit holds either the line to continue with
+    after the line of the frame, or the sentinel to end the enclosing block
+    with.
+
+    The frame at the bottom of the stack has no line: it's the block which
+    Lexicon#execute_block was called for.
+    """
+
+    def __init__(self, line, parent):
+        self.line = line
+        """The line which started this frame."""
+
+        self.parent = parent
+        """The line whose block this frame executes."""
+
+        self.next_line = None
+        """The line of the block to execute next."""
+
+        self.exit = None
+        self.closed = False
+
+    def start_block(self, story):
+        self.next_line = story.line(self.parent['enter'])
+        return True
+
+    def enter(self, story) -> bool:
+        """
+        :return: True if the block of this frame is to be executed, False
+        if the frame is done already
+        """
+        return self.start_block(story)
+
+    async def repeat(self, story, result) -> bool:
+        """
+        Continues once the block of this frame ended, with result (None,
+        or the sentinel which ended it).
+
+        :return: True if the block is to be executed again, False if the
+        frame is done
+        """
+        self.exit = result
+        return False
+
+    def close(self, story):
+        if not self.closed:
+            self.closed = True
+            self.finally_(story)
+
+    def finally_(self, story):
+        pass
+
+
+class ForFrame(Frame):
+    """
+    See Lexicon#for_loop (for loops which don't execute concurrently).
+    """
+
+    def __init__(self, line):
+        super().__init__(line, line)
+        self.output = line['output'][0]
+        self.items = None
+        self.started = False
+
+    def enter(self, story):
+        self.items = iter(story.resolve(self.line['args'][0], encode=False))
+        self.started = True
+        return self.next_item(story)
+
+    def next_item(self, story):
+        for item in self.items:
+            story.context[self.output] = item
+            return self.start_block(story)
+
+        self.exit = story.next_block(self.line)
+        return False
+
+    async def repeat(self, story, result):
+        if story.scheduler.due():
+            await story.scheduler.yield_()
+
+        if LineSentinels.BREAK == result:
+            self.exit = story.next_block(self.line)
+            return False
+
+        if LineSentinels.is_sentinel(result) and \
+                LineSentinels.CONTINUE != result:
+            self.exit = result
+            return False
+
+        return self.next_item(story)
+
+    def finally_(self, story):
+        if self.started:
+            # Don't leak the variable to the outer scope.
+            del story.context[self.output]
+
+
+class WhileFrame(Frame):
+    """
+    See Lexicon#while_.
+    """
+
+    def __init__(self, line):
+        super().__init__(line, line)
+        self.call_count = 0
+
+    def enter(self, story):
+        if not story.evaluate(self.line['args'][0]):
+            self.exit = story.next_block(self.line)
+            return False
+
+        if self.call_count >= 100000:
+            raise StoryscriptRuntimeError(
+                message='Call count limit reached within while loop. '
+                        'Only 100000 iterations allowed.',
+                story=story, line=self.line
+            )
+
+        return self.start_block(story)
+
+    async def repeat(self, story, result):
+        # Don't starve other stories (see Scheduler).
+        if story.scheduler.due():
+            await story.scheduler.yield_()
+
+        self.call_count += 1
+        if result == LineSentinels.BREAK:
+            self.exit = story.next_block(self.line)
+            return False
+
+        if LineSentinels.is_sentinel(result) and \
+                result != LineSentinels.CONTINUE:
+            self.exit = result
+            return False
+
+        return self.enter(story)
+
+
+class CallFrame(Frame):
+    """
+    See Lexicon#call.
+    """
+
+    def __init__(self, line):
+        super().__init__(line, None)
+        self.current_context = None
+        self.key = None
+        self.returned = None
+        self.started = False
+
+    def enter(self, story):
+        self.current_context = story.context
+        self.parent = story.function_line_by_name(self.line.get('function'))
+        context = story.context_for_function_call(self.line, self.parent)
+        self.key, hit, self.returned = FunctionCache.lookup(
+            story, self.parent, context)
+        self.started = True
+        if hit:
+            self.exit = story.line(self.line.get('next'))
+            return False
+
+        story.set_context(context)
+        return self.start_block(story)
+
+    async def repeat(self, story, result):
+        if LineSentinels.is_sentinel(result):
+            if not isinstance(result, ReturnSentinel):
+                raise StoryscriptRuntimeError(
+                    f'Uncaught sentinel has'
+                    f' escaped! sentinel={result}'
+                )
+
+            self.returned = result.return_value
+
+        if self.key is not None:
+            story.app.function_cache.put(self.key, self.returned)
+
+        self.exit = story.line(self.line.get('next'))
+        return False
+
+    def finally_(self, story):
+        if not self.started:
+            return
+
+        story.set_context(self.current_context)
+        name = self.line.get('name')
+        if name is not None and len(name) > 0:
+            story.end_line(self.line['ln'], output=self.returned,
+                           assign={'$OBJECT': 'path', 'paths': name})
@@ -2,17 +2,21 @@
 import asyncio
 import time
 
+from .Frames import CallFrame, ForFrame, Frame, WhileFrame
 from .Mutations import Mutations
 from .Services import Services
 from .. import Metrics
+from ..AppConfig import AppConfig
+from ..Context import ChildContext
 from ..Exceptions import InvalidKeywordUsage, \
     StoryscriptError, StoryscriptRuntimeError
+from ..FunctionCache import FunctionCache
 from ..Story import Story
 from ..Types import StreamingService
+from ..compiler import Line, StoryCompiler
 from ..constants import ContextConstants
 from ..constants.LineConstants import LineConstants
 from ..constants.LineSentinels import LineSentinels, ReturnSentinel
-from ..utils import Resolver
 
 
 class Lexicon:
@@ -41,6 +45,7 @@ class Lexicon:
                     # do something with result
             """
             output = await Services.start_container(story, line)
+            story.scheduler.resume()
             Metrics.container_start_seconds_total.labels(
                 app_id=story.app.app_id,
                 story_name=story.name, service=service
@@ -52,6 +57,7 @@ class Lexicon:
             return Lexicon.line_number_or_none(story.line(line.get('next')))
         else:
             output = await Services.execute(story, line)
+            story.scheduler.resume()
             Metrics.container_exec_seconds_total.labels(
                 app_id=story.app.app_id,
                 story_name=story.name, service=service
@@ -81,48 +87,116 @@ class Lexicon:
 
         with story.new_frame(line_number):
             try:
-                method = line['method']
-                if method == 'if' or method == 'else' or method == 'elif':
-                    return await Lexicon.if_condition(logger, story, line)
-                elif method == 'for':
-                    return await Lexicon.for_loop(logger, story, line)
-                elif method == 'execute':
-                    return await Lexicon.execute(logger, story, line)
-                elif method == 'set' or method == 'expression' \
-                        or method == 'mutation':
-                    return await Lexicon.set(logger, story, line)
-                elif method == 'call':
-                    return await Lexicon.call(logger, story, line)
-                elif method == 'function':
-                    return await Lexicon.function(logger, story, line)
-                elif method == 'when':
-                    return await Lexicon.when(logger, story, line)
-                elif method == 'return':
-                    return await Lexicon.ret(logger, story, line)
-                elif method == 'break':
-                    return await Lexicon.break_(logger, story, line)
-                elif method == 'continue':
-                    return await Lexicon.continue_(logger, story, line)
-                elif method == 'while':
-                    return await Lexicon.while_(logger, story, line)
-                elif method == 'try':
-                    return await Lexicon.try_catch(logger, story, line)
-                elif method == 'throw':
-                    return await Lexicon.throw(logger, story, line)
+                if isinstance(line, Line):
+                    handler = line.handler
                 else:
+                    handler = StoryCompiler.handlers.get(line['method'])
+
+                if handler is None:
                     raise NotImplementedError(
-                        f'Unknown method to execute: {method}'
+                        f'Unknown method to execute: {line["method"]}'
                     )
+
+                return await getattr(Lexicon, handler)(logger, story, line)
             except BaseException as e:
-                # Don't wrap StoryscriptError.
-                if isinstance(e, StoryscriptError):
-                    e.story = story  # Always set.
-                    e.line = line  # Always set.
-                    raise e
+                raise Lexicon._line_error(story, line, e)
 
-                raise StoryscriptRuntimeError(
-                    message='Failed to execute line',
-                    story=story, line=line, root=e)
+    @staticmethod
+    def execute_line_sync(logger, story, line: Line):
+        """
+        Executes a line which doesn't perform any I/O (see
+        StoryCompiler#sync_handlers), without scheduling a coroutine for it.
+        Apart from that, this behaves exactly like Lexicon#execute_line.
+
+        :return: Returns the next line number to be executed
+        (return value from Lexicon), or None if there is none.
+        """
+        line_number = line['ln']
+        story.start_line(line_number)
+
+        with story.new_frame(line_number):
+            try:
+                return getattr(Lexicon, line.sync_handler)(logger, story, line)
+            except BaseException as e:
+                raise Lexicon._line_error(story, line, e)
+
+    @staticmethod
+    def parallel_group(app_config, tree, line):
+        """
+        :return: The line numbers of the lines of tree, starting with line,
+        which may execute concurrently (see Lexicon#execute_parallel), or
+        None if line has to execute on its own. Only independent lines (see
+        StoryCompiler#_index_dataflow) may, and only if the app enables
+        this (see AppConfig#is_execute_concurrent). The group ends before
+        the first line calling a service which is configured as unsafe.
+        """
+        if not isinstance(line, Line) or line.independent is None or \
+                not isinstance(app_config, AppConfig) or \
+                not app_config.is_execute_concurrent():
+            return None
+
+        group = []
+        for line_number in line.independent:
+            member = tree[line_number]
+            if app_config.is_execute_unsafe(member['service'],
+                                            member.get('command')):
+                break
+
+            group.append(line_number)
+
+        if len(group) < 2:
+            return None
+
+        return tuple(group)
+
+    @staticmethod
+    async def execute_parallel(logger, story, group):
+        """
+        Executes the lines of group (see Lexicon#parallel_group)
+        concurrently, each one on a fork of story (see Story#fork), which
+        shares the context of story. Since these lines neither read nor
+        write the same variables, it doesn't matter in which order they
+        assign their output.
+
+        Every line executes to completion, even if another line fails.
+        The error of the first line which failed (in the order of the story)
+        is then raised.
+
+        :return: The line after group, or None if there is none.
+        """
+        results = await asyncio.gather(
+            *[Lexicon.execute_line(logger, story.fork(story.context),
+                                   line_number)
+              for line_number in group],
+            return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException):
+                if isinstance(result, StoryscriptError):
+                    result.story = story
+                raise result
+
+        return Lexicon.line_number_or_none(
+            story.line(story.line(group[-1]).get('next')))
+
+    @staticmethod
+    def is_sync(line):
+        """
+        :return: True if line can be executed by Lexicon#execute_line_sync
+        """
+        return isinstance(line, Line) and line.sync_handler is not None
+
+    @staticmethod
+    def _line_error(story, line, e):
+        # Don't wrap StoryscriptError.
+        if isinstance(e, StoryscriptError):
+            e.story = story  # Always set.
+            e.line = line  # Always set.
+            return e
+
+        return StoryscriptRuntimeError(
+            message='Failed to execute line',
+            story=story, line=line, root=e)
 
     @staticmethod
     async def execute_block(logger, story, parent_line: dict):
@@ -134,9 +208,12 @@ class Lexicon:
 
         The result can have special significance, such as the BREAK
         line sentinel.
-        """
-        next_line = story.line(parent_line['enter'])
 
+        For loops, while loops and function calls within the block are
+        executed here too, on a stack of frames (see Frame), rather than
+        by awaiting their handlers. However deeply these nest, executing
+        them never nests coroutines.
+        """
         # If this block represents a streaming service, copy over it's
         # output to the context, so that Lexicon can read it later.
         if parent_line.get('output') is not None \
@@ -148,19 +225,120 @@ class Lexicon:
                 story.context[parent_line['output'][0]] = \
                     story.context[ContextConstants.service_event].get('data')
 
-        while next_line is not None \
-                and story.line_has_parent(parent_line['ln'], next_line):
-            result = await Lexicon.execute_line(logger, story, next_line['ln'])
+        frames = [Frame(None, parent_line)]
+        frames[0].start_block(story)
+        try:
+            while True:
+                frame = frames[-1]
+                next_line = frame.next_line
+                result = None
+                if next_line is not None and \
+                        story.line_has_parent(frame.parent['ln'], next_line):
+                    nested = Lexicon.frame_for(story, next_line)
+                    if nested is None:
+                        result = await Lexicon.execute_in_block(
+                            logger, story, next_line)
+                        if not LineSentinels.is_sentinel(result):
+                            frame.next_line = story.line(result)
+                            continue
+                    else:
+                        # See Lexicon#execute_line.
+                        story.start_line(next_line['ln'])
+                        story.push_frame(next_line['ln'])
+                        frames.append(nested)
+                        if nested.enter(story):
+                            continue
+
+                        result = Lexicon.close_frame(story, frames)
+                        if not LineSentinels.is_sentinel(result):
+                            frame.next_line = result
+                            continue
+
+                # The block of a frame ended, with result.
+                while len(frames) > 1:
+                    if await frames[-1].repeat(story, result):
+                        break
+
+                    result = Lexicon.close_frame(story, frames)
+                    if not LineSentinels.is_sentinel(result):
+                        frames[-1].next_line = result
+                        break
+                else:
+                    return result
+        except BaseException as e:
+            # Unwinds the way nested handlers would: every frame ends as if
+            # it failed, and its line claims the error.
+            while len(frames) > 1:
+                frame = frames.pop()
+                try:
+                    frame.close(story)
+                except BaseException as error:
+                    e = error
 
-            if LineSentinels.is_sentinel(result):
-                return result
+                e = Lexicon._line_error(story, frame.line, e)
+
+            raise e
+
+    @staticmethod
+    async def execute_in_block(logger, story, line):
+        """
+        Executes line, which doesn't start a frame (see
+        Lexicon#frame_for), within a block.
 
-            next_line = story.line(result)
+        :return: The next line number to be executed, or a sentinel.
+        """
+        group = Lexicon.parallel_group(story.app.app_config, story.tree,
+                                       line)
+        if group is not None:
+            return await Lexicon.execute_parallel(logger, story, group)
+
+        if Lexicon.is_sync(line):
+            # Runs of lines without I/O execute without ever
+            # creating a coroutine.
+            return Lexicon.execute_line_sync(logger, story, line)
+
+        return await Lexicon.execute_line(logger, story, line['ln'])
+
+    @staticmethod
+    def frame_for(story, line):
+        """
+        :return: The Frame which executes line within Lexicon#execute_block,
+        or None if line is executed by its handler (see
+        Lexicon#execute_in_block)
+        """
+        method = line.get('method')
+        if method == 'for':
+            if Lexicon.for_loop_concurrency(story.app.app_config,
+                                            story.name, line) > 1:
+                return None
+
+            return ForFrame(line)
+        elif method == 'while':
+            return WhileFrame(line)
+        elif method == 'call':
+            return CallFrame(line)
 
         return None
 
+    @staticmethod
+    def close_frame(story, frames):
+        """
+        Pops the frame on top of frames, which is done.
+
+        :return: The line to continue with, or the sentinel to end the
+        enclosing block with (see Frame#exit)
+        """
+        frames[-1].close(story)
+        frame = frames.pop()
+        story.pop_frame()
+        return frame.exit
+
     @staticmethod
     async def function(logger, story, line):
+        return Lexicon.function_sync(logger, story, line)
+
+    @staticmethod
+    def function_sync(logger, story, line):
         """
         Functions are not executed when they're encountered.
         This method returns the next block's line number,
@@ -178,8 +356,13 @@ class Lexicon:
         current_context = story.context
         function_line = story.function_line_by_name(line.get('function'))
         context = story.context_for_function_call(line, function_line)
-        return_from_function_call = None
+        key, hit, return_from_function_call = FunctionCache.lookup(
+            story, function_line, context)
         try:
+            if hit:
+                return Lexicon.line_number_or_none(
+                    story.line(line.get('next')))
+
             story.set_context(context)
             result = await Lexicon.execute_block(logger, story, function_line)
             if LineSentinels.is_sentinel(result):
@@ -191,6 +374,9 @@ class Lexicon:
 
                 return_from_function_call = result.return_value
 
+            if key is not None:
+                story.app.function_cache.put(key, return_from_function_call)
+
             return Lexicon.line_number_or_none(story.line(line.get('next')))
         finally:
             story.set_context(current_context)
@@ -202,6 +388,9 @@ class Lexicon:
 
     @staticmethod
     def _does_line_have_parent_method(story, line, parent_method_wanted):
+        if isinstance(line, Line):
+            return parent_method_wanted in line.enclosing
+
         # Just walk up the stack using 'parent'.
         while True:
             parent_line = line.get('parent')
@@ -217,6 +406,10 @@ class Lexicon:
 
     @staticmethod
     async def break_(logger, story, line):
+        return Lexicon.break_sync(logger, story, line)
+
+    @staticmethod
+    def break_sync(logger, story, line):
         # Ensure that we're in a foreach loop. If we are, return BREAK,
         # otherwise raise an exception.
         if Lexicon._does_line_have_parent_method(story, line, 'for'):
@@ -227,6 +420,10 @@ class Lexicon:
 
     @staticmethod
     async def continue_(logger, story, line):
+        return Lexicon.continue_sync(logger, story, line)
+
+    @staticmethod
+    def continue_sync(logger, story, line):
         # Ensure that we're in a foreach loop. If we are, return CONTINUE,
         # otherwise raise an exception.
         if Lexicon._does_line_have_parent_method(story, line, 'for') or \
@@ -245,13 +442,17 @@ class Lexicon:
 
     @staticmethod
     async def set(logger, story, line):
+        return Lexicon.set_sync(logger, story, line)
+
+    @staticmethod
+    def set_sync(logger, story, line):
         value = story.resolve(line['args'][0])
 
         if len(line['args']) > 1:
             # Check if args[1] is a mutation.
             if line['args'][1]['$OBJECT'] == 'mutation':
                 value = Mutations.mutate(line['args'][1], value, story, line)
-                logger.debug(f'Mutation result: {value}')
+                logger.debug('Mutation result: {}', value)
             else:
                 raise StoryscriptError(
                     message=f'Unsupported argument in set: '
@@ -274,6 +475,10 @@ class Lexicon:
 
     @staticmethod
     async def if_condition(logger, story, line):
+        return Lexicon.if_condition_sync(logger, story, line)
+
+    @staticmethod
+    def if_condition_sync(logger, story, line):
         """
         Evaluates the resolution value to decide whether to enter
         inside an if-block.
@@ -409,12 +614,25 @@ class Lexicon:
         _list = story.resolve(line['args'][0], encode=False)
         output = line['output'][0]
 
+        concurrency = Lexicon.for_loop_concurrency(story.app.app_config,
+                                                   story.name, line)
+        if concurrency > 1:
+            result = await Lexicon.for_loop_concurrent(
+                logger, story, line, _list, concurrency)
+            if LineSentinels.is_sentinel(result):
+                return result
+
+            return Lexicon.line_number_or_none(story.next_block(line))
+
         try:
             for item in _list:
                 story.context[output] = item
 
                 result = await Lexicon.execute_block(logger, story, line)
 
+                if story.scheduler.due():
+                    await story.scheduler.yield_()
+
                 if LineSentinels.BREAK == result:
                     break
                 if LineSentinels.CONTINUE == result:
@@ -430,10 +648,85 @@ class Lexicon:
         # Use story.next_block(line), because line["exit"] is unreliable...
         return Lexicon.line_number_or_none(story.next_block(line))
 
+    @staticmethod
+    def for_loop_concurrency(app_config, story_name, line) -> int:
+        """
+        :return: How many iterations of the for loop at line may execute
+        concurrently (see AppConfig#get_for_concurrency)
+        """
+        if not isinstance(app_config, AppConfig):
+            return 1
+
+        return app_config.get_for_concurrency(story_name, line['ln'])
+
+    @staticmethod
+    async def for_loop_concurrent(logger, story, line, items, concurrency):
+        """
+        Executes the block of a for loop for every item, with up to
+        concurrency iterations executing at the same time. Iterations are
+        started in the order of items, each one on a fork of story
+        (see Story#fork), with a ChildContext of its own.
+
+        Once no iteration is executing anymore, the writes of every
+        iteration are merged into the context of story, in the order of
+        items. This ends with the first iteration (in the order of items)
+        which either raised, or returned a sentinel other than CONTINUE,
+        as it would if the iterations had been executed sequentially:
+        iterations after it aren't started anymore, and the writes of those
+        which were started already are discarded. Its error is then raised,
+        or its sentinel is returned (None for BREAK).
+        """
+        output = line['output'][0]
+        items = list(items)
+        forks = []
+        results = {}
+        errors = {}
+        end = len(items)
+
+        async def worker():
+            nonlocal end
+            while len(forks) < end:
+                index = len(forks)
+                fork = story.fork(ChildContext(story.context))
+                forks.append(fork)
+                fork.context[output] = items[index]
+                try:
+                    result = await Lexicon.execute_block(logger, fork, line)
+                except asyncio.CancelledError:
+                    raise
+                except BaseException as e:
+                    errors[index] = e
+                    end = min(end, index + 1)
+                    continue
+
+                results[index] = result
+                if LineSentinels.is_sentinel(result) and \
+                        result != LineSentinels.CONTINUE:
+                    end = min(end, index + 1)
+
+        await asyncio.gather(*[worker()
+                               for _ in range(min(concurrency, end))])
+
+        for index in range(end):
+            forks[index].context.merge(exclude=(output,))
+
+        # Don't leak the variable to the outer scope.
+        story.context.maps[0].pop(output, None)
+
+        if end > 0 and end - 1 in errors:
+            raise errors[end - 1]
+
+        result = results.get(end - 1)
+        if result == LineSentinels.BREAK or \
+                result == LineSentinels.CONTINUE:
+            return None
+
+        return result
+
     @staticmethod
     async def while_(logger, story, line):
         call_count = 0
-        while Resolver.resolve(line['args'][0], story.context):
+        while story.evaluate(line['args'][0]):
             # note this is only a temporary solution,
             # and we will address this in the future.
             if call_count >= 100000:
@@ -445,9 +738,9 @@ class Lexicon:
 
             result = await Lexicon.execute_block(logger, story, line)
 
-            if call_count % 10 == 0:
-                # Let's sleep so we don't take up 100% of the CPU
-                await asyncio.sleep(0.0002)
+            # Don't starve other stories (see Scheduler).
+            if story.scheduler.due():
+                await story.scheduler.yield_()
 
             call_count += 1
 
@@ -478,6 +771,10 @@ class Lexicon:
 
     @classmethod
     async def ret(cls, logger, story: Story, line):
+        return cls.ret_sync(logger, story, line)
+
+    @classmethod
+    def ret_sync(cls, logger, story: Story, line):
         """
         Implementation for return.
         The semantics for return are as follows:
@@ -9,24 +9,63 @@ from ..Exceptions import StoryscriptError
 
 class Mutations:
 
+    kinds = (
+        (str, StringMutations),
+        (list, ListMutations),
+        (dict, MapMutations),
+        (int, IntegerMutations),
+        (float, FloatMutations)
+    )
+    """
+    The mutations for each type of value, in the order the type of a value
+    is checked in. bool is an int here.
+    """
+
+    handlers = {}
+    """
+    The handler of each (type of value, operator). Built once on import for
+    the types in kinds, and on first use for their subclasses.
+    """
+
+    known = set()
+    """The types of values which handlers has been built for."""
+
+    @classmethod
+    def build(cls):
+        for kind, mutations in cls.kinds:
+            cls.add_handlers(kind, mutations)
+
+    @classmethod
+    def add_handlers(cls, kind, mutations):
+        cls.known.add(kind)
+        if mutations is None:
+            return
+        # Only the methods which mutations defines itself are operators,
+        # and not helpers nor constants it holds.
+        for operator, attribute in vars(mutations).items():
+            if not operator.startswith('_') and \
+                    isinstance(attribute, (classmethod, staticmethod)):
+                cls.handlers[(kind, operator)] = getattr(mutations, operator)
+
+    @classmethod
+    def mutations_for(cls, kind):
+        for base, mutations in cls.kinds:
+            if issubclass(kind, base):
+                return mutations
+        return None
+
+    @classmethod
+    def handler_for(cls, kind, operator):
+        handler = cls.handlers.get((kind, operator))
+        if handler is None and kind not in cls.known:
+            cls.add_handlers(kind, cls.mutations_for(kind))
+            handler = cls.handlers.get((kind, operator))
+        return handler
+
     @classmethod
     def mutate(cls, mutation, value, story, line):
         operator = mutation['mutation']
-        handler = None
-        try:
-            if isinstance(value, str):
-                handler = getattr(StringMutations, operator)
-            elif isinstance(value, list):
-                handler = getattr(ListMutations, operator)
-            elif isinstance(value, dict):
-                handler = getattr(MapMutations, operator)
-            elif isinstance(value, int):
-                handler = getattr(IntegerMutations, operator)
-            elif isinstance(value, float):
-                handler = getattr(FloatMutations, operator)
-        except AttributeError:
-            pass  # handler is None at this point.
-
+        handler = cls.handler_for(type(value), operator)
         if handler is None:
             raise StoryscriptError(
                 message=f'Unsupported data type {str(type(value))} '
@@ -38,3 +77,6 @@ class Mutations:
             raise StoryscriptError(
                 message=f'Failed to apply mutation {operator}! err={str(e)}',
                 story=story, line=line)
+
+
+Mutations.build()
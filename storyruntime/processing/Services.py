@@ -3,7 +3,7 @@ import base64
 import json
 import urllib
 import uuid
-from collections import deque
+from collections import deque, namedtuple
 from functools import partial
 from re import Pattern
 from urllib import parse
@@ -11,15 +11,21 @@ from urllib import parse
 from requests.structures import CaseInsensitiveDict
 
 from tornado.gen import coroutine
-from tornado.httpclient import AsyncHTTPClient
 
 import ujson
 
 from ..Containers import Containers
 from ..Exceptions import ArgumentTypeMismatchError, StoryscriptError
+from ..Hedge import Hedge
+from ..HttpTransport import HttpTransport
 from ..Logger import Logger
+from ..ResponseCache import ResponseCache
+from ..SingleFlight import SingleFlight
+from ..Story import MAX_BYTES_LOGGING
+from ..Synapse import Synapse
 from ..Types import Command, Event, InternalCommand, \
     InternalService, Service, StreamingService
+from ..compiler import Line
 from ..constants.ContextConstants import ContextConstants
 from ..constants.LineConstants import LineConstants
 from ..constants.ServiceConstants import ServiceConstants
@@ -27,10 +33,44 @@ from ..entities.Multipart import FileFormField, FormField
 from ..omg.ServiceOutputValidator import ServiceOutputValidator
 from ..utils import Dict
 from ..utils.HttpUtils import HttpUtils
-from ..utils.StringUtils import StringUtils
+from ..utils.StringUtils import StringUtils, Truncated
 from ..utils.TypeUtils import TypeUtils
 
 
+ServicePlan = namedtuple('ServicePlan', ['chain', 'command_conf', 'http'])
+"""
+How an execute line calls its service: the chain of the line (see
+Services#resolve_chain), the conf of its command (None for internal
+services), and how to invoke the command via HTTP (see HttpPlan).
+"""
+
+HttpPlan = namedtuple('HttpPlan', [
+    'arguments', 'body_fields', 'form_fields', 'method', 'content_type',
+    'url', 'port', 'path', 'idempotent', 'hedge', 'coalesce', 'cache_ttl'
+])
+"""
+How to invoke a command via HTTP, read from its conf: the name and the
+location of every argument, how many of them go to the request body and
+to the form body, the method, the content type, and either the external
+url, or the port and the path on the container of the service.
+
+A command is idempotent if its method is, or if its conf says so
+(http.idempotent), and may then be retried on any failure. Calls of
+commands using GET, and of idempotent ones, may be hedged (see Hedge).
+Identical concurrent calls of commands which opted in (http.coalesce)
+share a single request (see SingleFlight), and the outputs of commands
+which declare a ttl (http.cacheTtl) are cached (see ResponseCache).
+"""
+
+SubscriptionPlan = namedtuple('SubscriptionPlan', [
+    'service', 'command', 'port', 'path', 'method', 'arguments'
+])
+"""
+How a when line subscribes to the event of a streaming service, read
+from the conf of the event.
+"""
+
+
 class HttpDataEncoder(json.JSONEncoder):
     """
     This is utilized to sanitize the data sent back
@@ -158,10 +198,11 @@ class Services:
                     continue
                 resolved_args[arg] = actual
 
-        return await command.handler(
+        output = await command.handler(
             story=story, line=line,
             resolved_args=resolved_args
         )
+        return TypeUtils.sanitize(output)
 
     @classmethod
     async def execute_external(cls, story, line):
@@ -175,7 +216,7 @@ class Services:
         """
         service = line[LineConstants.service]
         chain = cls.resolve_chain(story, line)
-        command_conf = cls.get_command_conf(story, chain)
+        command_conf = cls.command_conf_for(story, line, chain)
         await cls.start_container(story, line)
         if command_conf.get('format') is not None:
             return await Containers.exec(story.logger, story, line,
@@ -212,6 +253,21 @@ class Services:
 
         The first entry in the chain will always be a concrete service,
         and the last entry will always be a command.
+
+        For a line of a compiled story, the chain is resolved only once
+        (see Services#plan_for).
+        """
+        plan = cls.plan_for(story, line)
+        if plan is not None:
+            return plan.chain
+
+        return cls.walk_chain(story, line)
+
+    @classmethod
+    def walk_chain(cls, story, line):
+        """
+        Resolves the chain of line (see Services#resolve_chain), walking
+        up the owners of the line.
         """
 
         def get_owner(line):
@@ -248,7 +304,7 @@ class Services:
             parent_line = get_owner(parent_line)
             assert parent_line is not None
 
-        story.logger.debug(f'Chain resolved - {chain}')
+        story.logger.debug('Chain resolved - {}', chain)
         return chain
 
     @classmethod
@@ -267,6 +323,107 @@ class Services:
 
         return next or {}
 
+    @classmethod
+    def command_conf_for(cls, story, line, chain):
+        """
+        Returns the conf for the command of line, whose chain is chain
+        (see Services#get_command_conf).
+        """
+        plan = cls.plan_for(story, line)
+        if plan is not None and plan.command_conf is not None:
+            return plan.command_conf
+
+        return cls.get_command_conf(story, chain)
+
+    @classmethod
+    def plan_for(cls, story, line):
+        """
+        Returns the ServicePlan of an execute line of a compiled story,
+        resolving it on its first use (which App#start_services does as
+        the app is deployed). Once resolved, the plan is kept on the line:
+        neither the services nor the tree of an app change after it has
+        been deployed.
+
+        Returns None for lines which aren't compiled, and for lines whose
+        plan can't be resolved (so that the error surfaces from the same
+        place it always did).
+        """
+        if not isinstance(line, Line):
+            return None
+
+        plan = getattr(line, 'service_plan', None)
+        if isinstance(plan, ServicePlan):
+            return plan
+
+        try:
+            chain = cls.walk_chain(story, line)
+        except (AssertionError, KeyError):
+            return None
+
+        command_conf = None
+        http = None
+        if not cls.is_internal(chain[0].name, cls.last(chain).name):
+            try:
+                command_conf = cls.get_command_conf(story, chain)
+            except (KeyError, TypeError):
+                # Such as an unknown command (see Services#execute_external).
+                command_conf = None
+
+        if isinstance(command_conf, dict) and \
+                isinstance(command_conf.get('http'), dict):
+            http = cls.http_plan(command_conf)
+
+        plan = ServicePlan(chain=chain, command_conf=command_conf, http=http)
+        line.service_plan = plan
+        return plan
+
+    @classmethod
+    def http_plan(cls, command_conf):
+        """
+        Returns the HttpPlan for invoking the command of command_conf.
+        """
+        args = command_conf.get('arguments', {})
+        arguments = tuple(
+            (arg, args[arg].get('in', 'requestBody')) for arg in args
+        )
+        http = command_conf['http']
+        method = http.get('method', 'post')
+        flagged = http.get('idempotent') is True
+        cache_ttl = http.get('cacheTtl')
+        if not isinstance(cache_ttl, (int, float)) or \
+                isinstance(cache_ttl, bool) or cache_ttl <= 0:
+            cache_ttl = None
+        return HttpPlan(
+            arguments=arguments,
+            body_fields=sum(1 for _, location in arguments
+                            if location == 'requestBody'),
+            form_fields=sum(1 for _, location in arguments
+                            if location == 'formBody'),
+            method=method,
+            content_type=http.get('contentType', 'application/json'),
+            url=http.get('url'),
+            port=http.get('port', 5000),
+            path=http.get('path'),
+            idempotent=flagged or
+            method.upper() in HttpUtils.IDEMPOTENT_METHODS,
+            hedge=flagged or method.upper() in ('GET', 'HEAD'),
+            coalesce=http.get('coalesce') is True,
+            cache_ttl=cache_ttl
+        )
+
+    @classmethod
+    def http_plan_for(cls, story, line, command_conf):
+        """
+        Returns the HttpPlan of line, unless command_conf isn't the one
+        which the plan of line was resolved for.
+        """
+        plan = cls.plan_for(story, line)
+        if plan is not None and plan.http is not None and \
+                plan.command_conf is command_conf:
+            return plan.http
+
+        return cls.http_plan(command_conf)
+
     @classmethod
     async def execute_inline(cls, story, line, chain, command_conf):
         assert isinstance(chain, deque)
@@ -434,18 +591,14 @@ class Services:
     async def execute_http(cls, story, line, chain, command_conf):
         assert isinstance(chain, deque)
         assert isinstance(chain[0], Service)
-        args = command_conf.get('arguments', {})
+        plan = cls.http_plan_for(story, line, command_conf)
         body = {}
         query_params = {}
         path_params = {}
         header_params = {}
 
-        form_fields_count = 0
-        request_body_fields_count = 0
-
-        for arg in args:
+        for arg, location in plan.arguments:
             value = story.argument_by_name(line, arg)
-            location = args[arg].get('in', 'requestBody')
             if location == 'query':
                 cls.smart_insert(story, line, command_conf,
                                  arg, value, query_params)
@@ -455,7 +608,6 @@ class Services:
             elif location == 'requestBody':
                 cls.smart_insert(story, line, command_conf,
                                  arg, value, body)
-                request_body_fields_count += 1
             elif location == 'formBody':
                 # Created in StoryEventHandler.
                 if isinstance(value, FileFormField):
@@ -463,7 +615,6 @@ class Services:
                                               value.content_type)
                 else:
                     body[arg] = FormField(arg, value)
-                form_fields_count += 1
             elif location == 'header':
                 cls.smart_insert(story, line, command_conf, arg, value,
                                  header_params)
@@ -474,40 +625,46 @@ class Services:
                     story=story, line=line
                 )
 
-        if form_fields_count > 0 and request_body_fields_count > 0:
+        if plan.form_fields > 0 and plan.body_fields > 0:
             raise StoryscriptError(f'Mixed locations are not permitted. '
-                                   f'Found {request_body_fields_count}'
+                                   f'Found {plan.body_fields}'
                                    f' fields of which '
-                                   f'{form_fields_count}'
+                                   f'{plan.form_fields}'
                                    f' were in the form body',
                                    story=story, line=line)
 
-        method = command_conf['http'].get('method', 'post')
+        method = plan.method
         kwargs = {
             'method': method.upper(),
             'headers': header_params
         }
 
-        content_type = command_conf['http'] \
-            .get('contentType', 'application/json')
-
         if method.lower() == 'post':
-            cls._fill_http_req_body(kwargs, content_type, body)
+            cls._fill_http_req_body(kwargs, plan.content_type, body)
         elif len(body) > 0:
             raise StoryscriptError(
                 message=f'Parameters found in the request body, '
                 f'but the method is {method}', story=story, line=line)
 
-        url = await cls._get_url_for_http_call(story, line, chain,
-                                               command_conf,
+        url = await cls._get_url_for_http_call(story, line, chain, plan,
                                                path_params, query_params)
 
-        story.logger.debug(f'Invoking service on {url} with payload {kwargs}')
+        story.logger.debug('Invoking service on {} with payload {}', url,
+                           Truncated(kwargs, MAX_BYTES_LOGGING))
 
-        client = AsyncHTTPClient()
-        response = await HttpUtils.fetch_with_retry(
-            3, story.logger, url, client, kwargs
-        )
+        service = chain[0].name
+        command = cls.last(chain).name
+        cache = story.app.response_cache
+        ttl = ResponseCache.ttl_for(story.app, plan, service, command)
+        key = None
+        if ttl is not None:
+            key = SingleFlight.key_for(service, command, url, kwargs)
+        if key is not None:
+            hit, output = cache.get(key)
+            if hit:
+                return output
+
+        response = await cls._fetch_http(story, chain, plan, url, kwargs)
 
         story.logger.debug(f'HTTP response code is {response.code}')
         if int(response.code / 100) == 2:
@@ -525,10 +682,15 @@ class Services:
                 if expected_service_output is not None:
                     ServiceOutputValidator.raise_if_invalid(
                         expected_service_output, body, chain)
-                return body
+                output = TypeUtils.sanitize(body)
             else:
-                return cls.parse_output(command_conf, response.body,
-                                        story, line, content_type)
+                output = cls.parse_output(command_conf, response.body,
+                                          story, line, content_type)
+
+            if key is not None:
+                cache.put(key, output, len(response.body or b''), ttl)
+
+            return output
         else:
             response_body = HttpUtils.read_response_body_quietly(response)
             raise StoryscriptError(
@@ -539,22 +701,67 @@ class Services:
             )
 
     @classmethod
-    async def _get_url_for_http_call(cls, story, line, chain, command_conf,
-                                     path_params, query_params):
-        external_url = command_conf['http'].get('url')
-        if external_url is not None:
+    async def _fetch_http(cls, story, chain, plan: HttpPlan, url, kwargs):
+        """
+        Sends the request of a service call, hedging it (see Hedge),
+        coalescing it with identical calls in flight (see SingleFlight),
+        and waiting for the turn of the call if calls to its service are
+        limited (see ServiceLimit), as configured.
+
+        Calls to a limited service aren't hedged, since a backup request
+        would be in flight without a turn of its own.
+        """
+        service = chain[0].name
+        command = cls.last(chain).name
+        # Services with a url of their own are outside of the cluster.
+        app_id = story.app.app_id if plan.url is not None else None
+        client = HttpTransport.services(url, app_id)
+        limit = story.app.limiter.limit_for(service)
+        hedge = None
+        if plan.hedge and limit is None:
+            hedge = Hedge.for_action(story.app, service, command)
+
+        async def send():
+            if hedge is not None:
+                return await HttpUtils.fetch_hedged(
+                    3, story.logger, url, client, kwargs, hedge)
+
+            return await HttpUtils.fetch_with_retry(
+                3, story.logger, url, client, kwargs,
+                idempotent=plan.idempotent
+            )
+
+        async def fetch():
+            if limit is None:
+                return await send()
+
+            return await limit.run(send)
+
+        app_config = story.app.app_config
+        coalesce = plan.coalesce or (
+            app_config is not None and
+            app_config.is_coalesce_http(service, command))
+        key = SingleFlight.key_for(service, command, url, kwargs)
+        if not coalesce or key is None:
+            return await fetch()
+
+        return await story.app.flights.call(key, service, fetch)
+
+    @classmethod
+    async def _get_url_for_http_call(cls, story, line, chain,
+                                     plan: HttpPlan, path_params,
+                                     query_params):
+        if plan.url is not None:
             return HttpUtils.add_params_to_url(
-                external_url.format(**path_params), query_params)
+                plan.url.format(**path_params), query_params)
         else:
             hostname = await Containers.get_hostname(story, line,
                                                      chain[0].name)
-            port = command_conf['http'].get('port', 5000)
 
             path = HttpUtils.add_params_to_url(
-                command_conf['http']['path'].format(**path_params),
-                query_params)
+                plan.path.format(**path_params), query_params)
 
-            url = f'http://{hostname}:{port}{path}'
+            url = f'http://{hostname}:{plan.port}{path}'
 
             return url
 
@@ -625,19 +832,13 @@ class Services:
     async def when(cls, s: StreamingService, story, line: dict):
         service = line[LineConstants.service]
         command = line[LineConstants.command]
-        conf = story.app.services[s.name][ServiceConstants.config]
-        conf_event = Dict.find(
-            conf, f'actions.{s.command}.events.{command}')
-
-        port = Dict.find(conf_event, f'http.port', 80)
-        subscribe_path = Dict.find(conf_event, 'http.subscribe.path')
-        subscribe_method = Dict.find(conf_event,
-                                     'http.subscribe.method', 'post')
-
-        event_args = Dict.find(conf_event, 'arguments', {})
+        plan = cls.subscription_plan_for(s, story, line)
+        port = plan.port
+        subscribe_path = plan.path
+        subscribe_method = plan.method
 
         data = {}
-        for key in event_args:
+        for key in plan.arguments:
             data[key] = story.argument_by_name(line, key)
 
         # HACK for http - send the DNS name of the app.
@@ -676,29 +877,18 @@ class Services:
             'app_id': story.app.app_id
         }
 
-        # Why request_timeout is set to 120 seconds:
-        # Since this is the Synapse, Synapse does multiple internal retries,
-        # so we must set this to a really high value.
-        kwargs = {
-            'method': subscribe_method.upper(),
-            'body': json.dumps(body, cls=HttpDataEncoder),
-            'headers': {
-                'Content-Type': 'application/json; charset=utf-8'
-            },
-            'request_timeout': 120
-        }
+        batch = story.app.subscription_batch
+        if batch is not None:
+            story.logger.debug(f'Subscribing to {service} '
+                               f'from {s.command} once all stories ran...')
+            batch.add(story, line, s, command, body)
+            return
 
-        client = AsyncHTTPClient()
         story.logger.debug(f'Subscribing to {service} '
                            f'from {s.command} via Synapse...')
 
-        url = f'http://{story.app.config.ASYNCY_SYNAPSE_HOST}:' \
-            f'{story.app.config.ASYNCY_SYNAPSE_PORT}' \
-            f'/subscribe'
-
-        # Okay to retry a request to the Synapse a hundred times.
-        response = await HttpUtils.fetch_with_retry(100, story.logger, url,
-                                                    client, kwargs)
+        response = await Synapse.subscribe(story.logger, story.app.config,
+                                           body)
         if int(response.code / 100) == 2:
             story.logger.debug(f'Subscribed!')
             story.app.add_subscription(sub_id, s, command, body)
@@ -709,6 +899,37 @@ class Services:
                 f'http err={response.error}; code={response.code}',
                 story=story, line=line)
 
+    @classmethod
+    def subscription_plan_for(cls, s: StreamingService, story, line):
+        """
+        Returns the SubscriptionPlan of a when line, for the streaming
+        service s. For a line of a compiled story, it's kept on the line,
+        for as long as the line subscribes to the same command of the
+        same service.
+        """
+        plan = getattr(line, 'service_plan', None)
+        if isinstance(plan, SubscriptionPlan) and \
+                plan.service == s.name and plan.command == s.command:
+            return plan
+
+        command = line[LineConstants.command]
+        conf = story.app.services[s.name][ServiceConstants.config]
+        conf_event = Dict.find(
+            conf, f'actions.{s.command}.events.{command}')
+
+        plan = SubscriptionPlan(
+            service=s.name,
+            command=s.command,
+            port=Dict.find(conf_event, f'http.port', 80),
+            path=Dict.find(conf_event, 'http.subscribe.path'),
+            method=Dict.find(conf_event, 'http.subscribe.method', 'post'),
+            arguments=tuple(Dict.find(conf_event, 'arguments', {}))
+        )
+        if isinstance(line, Line):
+            line.service_plan = plan
+
+        return plan
+
     @classmethod
     def log_internal(cls):
         for key in cls.internal_services:
@@ -5,7 +5,9 @@ from .. import Metrics
 from ..Exceptions import StoryscriptRuntimeError
 from ..Story import Story
 from ..constants.LineSentinels import LineSentinels
+from ..enums.ExecutionEngine import ExecutionEngine
 from ..processing import Lexicon
+from ..processing.CodeGenerator import CodeGenerator
 
 
 class Stories:
@@ -26,9 +28,24 @@ class Stories:
         """
         Executes each line in the story
         """
+        program = CodeGenerator.program_for(story)
+        if program is not None:
+            story.scheduler.use(ExecutionEngine.CODEGEN)
+            await program.execute(logger, story)
+            return
+
         line_number = story.first_line()
         while line_number:
-            result = await Lexicon.execute_line(logger, story, line_number)
+            line = story.line(line_number)
+            group = Lexicon.parallel_group(story.app.app_config, story.tree,
+                                           line)
+            if group is not None:
+                result = await Lexicon.execute_parallel(logger, story, group)
+            elif Lexicon.is_sync(line):
+                result = Lexicon.execute_line_sync(logger, story, line)
+            else:
+                result = await Lexicon.execute_line(logger, story,
+                                                    line_number)
 
             # Sentinels are not allowed to escape from here.
             if LineSentinels.is_sentinel(result):
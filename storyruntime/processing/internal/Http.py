@@ -4,10 +4,9 @@ import json
 
 import certifi
 
-from tornado.httpclient import AsyncHTTPClient
-
 from .Decorators import Decorators
 from ...Exceptions import StoryscriptError
+from ...HttpTransport import HttpTransport
 from ...utils.HttpUtils import HttpUtils
 
 
@@ -19,7 +18,8 @@ from ...utils.HttpUtils import HttpUtils
 }, output_type='any')
 async def http_post(story, line, resolved_args):
     method = resolved_args.get('method', 'get') or 'get'
-    http_client = AsyncHTTPClient()
+    http_client = HttpTransport.services(resolved_args['url'],
+                                         story.app.app_id)
     kwargs = {'method': method.upper(), 'ca_certs': certifi.where()}
 
     headers = resolved_args.get('headers') or {}
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
 import random
 
+import numpy as np
+
+NUMPY_SORT_THRESHOLD = 2048
+"""
+Numeric lists at least this long are sorted by NumPy. Below it, converting
+the list to an array and back costs more than the sort itself.
+"""
+
 
 class ListMutations:
 
@@ -36,8 +44,36 @@ class ListMutations:
 
     @classmethod
     def sort(cls, mutation, value, story, line, operator):
+        if len(value) >= NUMPY_SORT_THRESHOLD:
+            items = cls._numeric_array(value)
+            if items is not None:
+                items.sort()
+                value[:] = items.tolist()
+                return
         value.sort()
 
+    @staticmethod
+    def _numeric_array(value):
+        """
+        :return: value as a NumPy array, if it only holds ints which fit in
+        64 bits or only holds floats, and if sorting that array orders it
+        exactly like list.sort would. None otherwise.
+        """
+        types = set(map(type, value))
+        if types == {int}:
+            try:
+                return np.fromiter(value, np.int64, len(value))
+            except OverflowError:
+                return None
+        if types == {float}:
+            items = np.fromiter(value, np.float64, len(value))
+            # list.sort leaves NaN where it is and keeps -0.0 and 0.0 in
+            # their original order, NumPy doesn't.
+            if np.isnan(items).any() or np.signbit(items[items == 0]).any():
+                return None
+            return items
+        return None
+
     @classmethod
     def min(cls, mutation, value, story, line, operator):
         return min(value)
@@ -57,14 +93,13 @@ class ListMutations:
 
     @classmethod
     def unique(cls, mutation, value, story, line, operator):
-        tmp_set = set()
-        i = 0
-        while i < len(value):
-            if value[i] in tmp_set:
-                del value[i]
-            else:
-                tmp_set.add(value[i])
-                i += 1
+        seen = set()
+        result = []
+        for item in value:
+            if item not in seen:
+                seen.add(item)
+                result.append(item)
+        value[:] = result
 
     @classmethod
     def remove(cls, mutation, value, story, line, operator):
@@ -79,6 +114,4 @@ class ListMutations:
     def replace(cls, mutation, value, story, line, operator):
         by = story.argument_by_name(mutation, 'by')
         item = story.argument_by_name(mutation, 'item')
-        for i, el in enumerate(value):
-            if el == item:
-                value[i] = by
+        value[:] = [by if el == item else el for el in value]
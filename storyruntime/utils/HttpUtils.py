@@ -1,12 +1,32 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import random
+import time
 from urllib.parse import urlencode
 
 from tornado.httpclient import HTTPError
+from tornado.iostream import StreamClosedError
+
+from ..HttpTransport import CircuitOpenError, HttpPool
 
 
 class HttpUtils:
 
+    IDEMPOTENT_METHODS = frozenset(
+        ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'))
+
+    RETRY_CODES = frozenset((502, 503, 504))
+    """
+    Status codes of responses which idempotent requests are retried on,
+    besides 599 (network connectivity issues).
+    """
+
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 10
+
+    CURLE_COULDNT_CONNECT = 7
+    """The errno of the CurlError of a request which couldn't connect."""
+
     @staticmethod
     def read_response_body_quietly(response):
         try:
@@ -14,30 +34,170 @@ class HttpUtils:
         except BaseException:
             return None
 
-    @staticmethod
-    async def fetch_with_retry(tries, logger, url, http_client, kwargs):
+    @classmethod
+    def backoff(cls, attempt):
+        """
+        :return: The seconds to wait before retrying for the attempt'th
+        time (exponential, with full jitter, so that callers which failed
+        together don't retry together)
+        """
+        return random.uniform(
+            0, min(cls.BACKOFF_CAP, cls.BACKOFF_BASE * 2 ** (attempt - 1)))
+
+    @classmethod
+    def is_retriable(cls, idempotent, error):
+        """
+        Requests which aren't idempotent (such as a POST to a service,
+        as declared in its OMG) are only retried if they certainly
+        didn't reach their destination.
+        """
+        return idempotent or cls.is_connect_error(error)
+
+    @classmethod
+    def is_connect_error(cls, error):
+        """
+        :return: True if error (the error of a response) tells that the
+        request couldn't connect, whichever client of HttpTransport sent it
+        """
+        if isinstance(error, StreamClosedError):
+            error = error.real_error
+
+        if isinstance(error, ConnectionRefusedError):
+            return True
+
+        # A CurlError, which isn't imported since pycurl is optional.
+        return isinstance(error, HTTPError) and error.code == 599 and \
+            getattr(error, 'errno', None) == cls.CURLE_COULDNT_CONNECT
+
+    @classmethod
+    async def fetch_with_retry(cls, tries, logger, url, http_client, kwargs,
+                               idempotent=None):
+        """
+        Fetches url, trying up to tries times, backing off between them.
+
+        If http_client is an HttpPool, its circuit breaker and its retry
+        budget apply: once its destination fails too often, a
+        CircuitOpenError is raised straight away, and retries stop
+        once they'd exceed the budget.
+
+        :param idempotent: Whether the request may be repeated safely.
+        Defaults to whether its method is idempotent
+        """
         kwargs['raise_error'] = False
+        if idempotent is None:
+            method = kwargs.get('method', 'GET').upper()
+            idempotent = method in cls.IDEMPOTENT_METHODS
+
+        pool = http_client if isinstance(http_client, HttpPool) else None
         attempts = 0
         last_exception = None
+        res = None
         while attempts < tries:
             attempts = attempts + 1
+            if pool is not None:
+                if not pool.breaker.allow():
+                    raise CircuitOpenError(pool.destination) \
+                        from last_exception
+
+                pool.budget.deposit()
+
+            res = None
             try:
                 res = await http_client.fetch(url, **kwargs)
                 if res.code == 599:  # Network connectivity issues.
                     raise HTTPError(res.code, message=str(res.error),
                                     response=res)
-                return res
             except HTTPError as e:
                 last_exception = e
                 logger.error(
                     f'Failed to call {url}; attempt={attempts}; err={str(e)}'
                 )
-                await asyncio.sleep(0.5)
+                retriable = cls.is_retriable(idempotent,
+                                             getattr(res, 'error', None))
+            else:
+                if res.code not in cls.RETRY_CODES:
+                    # Any other server error fails the destination too,
+                    # though it isn't retried.
+                    if pool is not None:
+                        pool.breaker.record(res.code < 500)
+                    return res
+
+                logger.error(f'Failed to call {url}; attempt={attempts}; '
+                             f'code={res.code}')
+                retriable = idempotent
+
+            if pool is not None:
+                pool.breaker.record(False)
+
+            if not retriable or attempts >= tries:
+                break
+
+            if pool is not None and not pool.budget.withdraw():
+                logger.error(f'Not retrying {url}; retry budget exhausted')
+                break
+
+            await asyncio.sleep(cls.backoff(attempts))
+
+        if res is not None and res.code in cls.RETRY_CODES:
+            # Returned as is, just like any other response.
+            return res
 
-        assert last_exception is not None  # Impossible.
         raise HTTPError(500, message=f'Failed to call {url}!') \
             from last_exception
 
+    @classmethod
+    async def fetch_hedged(cls, tries, logger, url, http_client, kwargs,
+                           hedge):
+        """
+        Fetches url like HttpUtils#fetch_with_retry, for an idempotent
+        request. If it takes longer than the delay of hedge (see Hedge),
+        a backup request is sent, and the first good response wins: the
+        other request is cancelled.
+        """
+        delay = hedge.delay()
+        primary = asyncio.ensure_future(cls._fetch_timed(
+            tries, logger, url, http_client, dict(kwargs), hedge))
+        backup = None
+        try:
+            if delay is None or not hedge.allow():
+                hedge.called(False)
+                return await primary
+
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if primary in done or not hedge.allow():
+                hedge.called(False)
+                return primary.result()
+
+            hedge.called(True)
+            logger.debug(f'Hedging {url} after {delay:.3f}s')
+            backup = asyncio.ensure_future(cls._fetch_timed(
+                1, logger, url, http_client, dict(kwargs), hedge))
+            pending = {primary, backup}
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().code < 500:
+                        if task is backup:
+                            hedge.won()
+                        return task.result()
+
+            # Neither responded well, so this is just like not hedging.
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    @classmethod
+    async def _fetch_timed(cls, tries, logger, url, http_client, kwargs,
+                           hedge):
+        start = time.monotonic()
+        res = await cls.fetch_with_retry(tries, logger, url, http_client,
+                                         kwargs, idempotent=True)
+        hedge.record(time.monotonic() - start)
+        return res
+
     @staticmethod
     def add_params_to_url(url, params: dict):
         if len(params) == 0:
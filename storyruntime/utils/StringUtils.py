@@ -1,6 +1,13 @@
 # -*- coding: utf-8 -*-
 
 
+class _Full(Exception):
+    """
+    Raised once as much of a value has been rendered, as will be kept.
+    """
+    pass
+
+
 class StringUtils:
 
     @staticmethod
@@ -16,3 +23,77 @@ class StringUtils:
                      f'({truncated_len} bytes truncated)'
 
         return result
+
+    @classmethod
+    def truncate_incrementally(cls, value, max_bytes: int) -> str:
+        """
+        Like StringUtils#truncate, but lists, tuples and dicts are rendered
+        item by item, and rendering stops as soon as max_bytes have been
+        rendered. A large value is therefore never stringified as a whole,
+        just to be truncated. Since its size remains unknown, the number of
+        bytes which were truncated isn't reported.
+        """
+        chunks = []
+        size = 0
+
+        def write(text: str):
+            nonlocal size
+            # No character takes up less than a byte.
+            chunk = text[:max_bytes - size + 1].encode('utf-8', 'ignore')
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                raise _Full()
+
+        try:
+            cls._render(value, write, nested=False)
+        except _Full:
+            head = b''.join(chunks)[:max_bytes].decode('utf-8', 'ignore')
+            return f'{head} ... (truncated)'
+
+        return b''.join(chunks).decode('utf-8', 'ignore')
+
+    @classmethod
+    def _render(cls, value, write, nested: bool):
+        """
+        Writes str(value) (or repr(value), if value is nested in
+        another value), piece by piece.
+        """
+        kind = type(value)
+        if kind is list or kind is tuple:
+            write('[' if kind is list else '(')
+            for index, item in enumerate(value):
+                if index > 0:
+                    write(', ')
+                cls._render(item, write, nested=True)
+
+            if kind is tuple and len(value) == 1:
+                write(',')
+            write(']' if kind is list else ')')
+        elif kind is dict:
+            write('{')
+            for index, (key, item) in enumerate(value.items()):
+                if index > 0:
+                    write(', ')
+                cls._render(key, write, nested=True)
+                write(': ')
+                cls._render(item, write, nested=True)
+            write('}')
+        else:
+            write(repr(value) if nested else str(value))
+
+
+class Truncated:
+    """
+    A value, which formats as StringUtils#truncate_incrementally renders
+    it. Formatting is deferred until the Truncated is formatted, which it
+    never is if it's logged at a level which isn't enabled (see Logger).
+    """
+    __slots__ = ('value', 'max_bytes')
+
+    def __init__(self, value, max_bytes: int):
+        self.value = value
+        self.max_bytes = max_bytes
+
+    def __str__(self):
+        return StringUtils.truncate_incrementally(self.value, self.max_bytes)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import re
+from collections import OrderedDict, namedtuple
 
 import storyscript.compiler.semantics.types.Types as types
 
@@ -11,6 +12,18 @@ from ..utils.TypeUtils import TypeUtils
 # Python 3.7: re.Pattern
 RE_PATTERN = type(re.compile('a'))
 
+CastPlan = namedtuple('CastPlan', ['type', 'cast'])
+"""
+A type cast, compiled once per type (see TypeResolver#plan). cast(item)
+casts item to type, or raises if it can't (see TypeResolver#apply).
+"""
+
+BULK_TYPES = frozenset((str, int, float, bool, bytes))
+"""
+Types which TypeUtils#safe_type returns as they are. Collections of these
+are cast in bulk (see TypeResolver#plan).
+"""
+
 
 class TypeAssertionError(Exception):
     """
@@ -20,6 +33,14 @@ class TypeAssertionError(Exception):
 
 
 class TypeResolver:
+    _plans = OrderedDict()
+    """
+    Plans for the types found in stories, keyed by TypeResolver#key. The
+    least recently used ones are evicted beyond max_plans, since the types
+    of all releases of all apps end up here.
+    """
+
+    max_plans = 1024
 
     @classmethod
     def resolve_type(cls, item):
@@ -83,47 +104,159 @@ class TypeResolver:
             return f'unknown type {type(item)}'
 
     @classmethod
-    def check_type_cast(cls, type_exp, item):
-        item = TypeUtils.safe_type(item)
+    def key(cls, item):
+        """
+        :return: A hashable key for a type (as found in a story), which is
+        the same for all equal types
+        """
+        assert isinstance(item, dict)
+        values = item.get('values')
+        if not values:
+            return item.get('type')
+
+        return (item.get('type'),) + tuple(cls.key(v) for v in values)
+
+    @classmethod
+    def plan_for(cls, item) -> CastPlan:
+        """
+        :return: The CastPlan for a type (as found in a story), which is
+        only compiled the first time it's needed
+        """
+        key = cls.key(item)
+        plan = cls._plans.get(key)
+        if plan is not None:
+            cls._plans.move_to_end(key)
+            return plan
 
-        if item is None:
-            return None
-        elif isinstance(type_exp, types.ListType):
-            cls.assert_type([list], item)
-            li = []
-            for el in item:
-                li.append(cls.check_type_cast(type_exp.inner, el))
-            return li
+        plan = cls.plan(cls.resolve_type(item))
+        cls._plans[key] = plan
+        while len(cls._plans) > cls.max_plans:
+            cls._plans.popitem(last=False)
+
+        return plan
+
+    @classmethod
+    def plan(cls, type_exp) -> CastPlan:
+        """
+        Compiles the type cast to type_exp (see TypeResolver#resolve_type).
+        """
+        return CastPlan(type=type_exp, cast=cls._compile_cast(type_exp))
+
+    @classmethod
+    def _compile_cast(cls, type_exp):
+        """
+        Compiles the cast of an item to type_exp, recursing into
+        collections.
+        """
+        if isinstance(type_exp, types.ListType):
+            return cls._compile_list_cast(type_exp)
         elif isinstance(type_exp, types.MapType):
+            return cls._compile_map_cast(type_exp)
+
+        convert = cls._converter(type_exp)
+
+        def cast(item):
+            item = TypeUtils.safe_type(item)
+            if item is None:
+                return None
+
+            return convert(item)
+
+        return cast
+
+    @classmethod
+    def _compile_list_cast(cls, type_exp):
+        inner = cls._compile_cast(type_exp.inner)
+        bulk = cls._bulk_converter(type_exp.inner)
+
+        def cast_list(item):
+            item = TypeUtils.safe_type(item)
+            if item is None:
+                return None
+
+            cls.assert_type([list], item)
+            if bulk is not None and BULK_TYPES.issuperset(map(type, item)):
+                # Neither safe_type nor None have to be considered.
+                return bulk(item)
+
+            return [inner(el) for el in item]
+
+        return cast_list
+
+    @classmethod
+    def _compile_map_cast(cls, type_exp):
+        key = cls._compile_cast(type_exp.key)
+        value = cls._compile_cast(type_exp.value)
+
+        def cast_map(item):
+            item = TypeUtils.safe_type(item)
+            if item is None:
+                return None
+
             cls.assert_type([dict], item)
             obj = {}
             for k, v in item.items():
-                key = cls.check_type_cast(type_exp.key, k)
-                value = cls.check_type_cast(type_exp.value, v)
-                obj[key] = value
+                obj[key(k)] = value(v)
             return obj
+
+        return cast_map
+
+    @classmethod
+    def _bulk_converter(cls, type_exp):
+        """
+        :return: A function, which converts a list of items of BULK_TYPES
+        to type_exp all at once (None if type_exp is a collection)
+        """
+        if isinstance(type_exp, types.AnyType):
+            return list
+        elif isinstance(type_exp, types.IntType):
+            return lambda items: list(map(int, items))
+        elif isinstance(type_exp, types.FloatType):
+            return lambda items: list(map(float, items))
         elif isinstance(type_exp, types.BooleanType):
-            return bool(item)
+            return lambda items: list(map(bool, items))
+        elif isinstance(type_exp, (types.StringType, types.RegExpType)):
+            convert = cls._converter(type_exp)
+            return lambda items: [convert(item) for item in items]
+
+        return None
+
+    @classmethod
+    def _converter(cls, type_exp):
+        """
+        :return: A function, which converts an item (which is neither None,
+        nor a collection) to type_exp
+        """
+        if isinstance(type_exp, types.BooleanType):
+            return bool
         elif isinstance(type_exp, types.IntType):
-            return int(item)
+            return int
         elif isinstance(type_exp, types.FloatType):
-            return float(item)
+            return float
         elif isinstance(type_exp, types.StringType):
-            # bools are always lowercase in SS
-            if isinstance(item, bool):
-                return str(item).lower()
-            # bytes must be properly decoded
-            elif isinstance(item, bytes):
-                return item.decode()
-            return str(item)
+            return cls._to_string
         elif isinstance(type_exp, types.AnyType):
-            return item
-        else:
-            assert isinstance(type_exp, types.RegExpType)
-            cls.assert_type([str, RE_PATTERN], item)
-            if isinstance(item, str):
-                return re.compile(item)
-            return item
+            return lambda item: item
+
+        assert isinstance(type_exp, types.RegExpType)
+        return cls._to_regexp
+
+    @staticmethod
+    def _to_string(item):
+        # bools are always lowercase in SS
+        if isinstance(item, bool):
+            return str(item).lower()
+        # bytes must be properly decoded
+        elif isinstance(item, bytes):
+            return item.decode()
+        return str(item)
+
+    @classmethod
+    def _to_regexp(cls, item):
+        cls.assert_type([str, RE_PATTERN], item)
+        if isinstance(item, str):
+            return re.compile(item)
+        return item
 
     @staticmethod
     def item_to_string(item):
@@ -136,16 +269,23 @@ class TypeResolver:
 
     @classmethod
     def type_cast(cls, item, type_, data):
-        t = cls.resolve_type(type_)
-        value = cls.item_to_string(item)
-        type_received = cls.type_string(item)
+        return cls.apply(cls.plan_for(type_), item)
+
+    @classmethod
+    def apply(cls, plan: CastPlan, item):
+        """
+        Casts item as planned. The description of item for the error
+        is only built if item can't be cast.
+        """
         try:
-            return cls.check_type_cast(t, item)
+            return plan.cast(item)
         except (TypeError, TypeAssertionError):
-            raise TypeAssertionRuntimeError(type_expected=t,
-                                            type_received=type_received,
-                                            value=value)
+            raise TypeAssertionRuntimeError(
+                type_expected=plan.type,
+                type_received=cls.type_string(item),
+                value=cls.item_to_string(item))
         except (ValueError, re.error):
-            raise TypeValueRuntimeError(type_expected=t,
-                                        type_received=type_received,
-                                        value=value)
+            raise TypeValueRuntimeError(
+                type_expected=plan.type,
+                type_received=cls.type_string(item),
+                value=cls.item_to_string(item))
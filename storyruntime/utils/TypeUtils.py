@@ -27,6 +27,18 @@ class TypeUtils:
         bytes
     ]
 
+    trusted_types = frozenset(allowed_types)
+    """
+    Values of exactly these types are safe as they are: safe_type returns
+    them without inspecting them any further. Values which enter the
+    runtime are sanitized once (see TypeUtils#sanitize), after which
+    every value nested in them is of one of these types (or is
+    a CaseInsensitiveDict).
+    """
+
+    scalar_types = trusted_types - {list, dict}
+    """The trusted types, which don't nest other values."""
+
     @staticmethod
     def isnamedtuple(o):
         t = type(o)
@@ -47,7 +59,10 @@ class TypeUtils:
         :param o: the object you wish to convert
         :return: returns a converted type
         """
-        if o is None:
+        if type(o) in TypeUtils.trusted_types:
+            # By far the most common case, so it's checked first.
+            return o
+        elif o is None:
             return None
         elif isinstance(o, CaseInsensitiveDict):
             return dict(o.items())
@@ -69,11 +84,40 @@ class TypeUtils:
                 output_type=o.output_type
             )
         else:
-            # ensure the type is a primitive type
-            if not type(o) in TypeUtils.allowed_types:
-                raise StoryscriptRuntimeError(
-                    message=f'Incompatible type: '
-                            f'{type(o)}'
-                )
+            # The type isn't a primitive type (see trusted_types).
+            raise StoryscriptRuntimeError(
+                message=f'Incompatible type: '
+                        f'{type(o)}'
+            )
 
+    @staticmethod
+    def sanitize(o):
+        """
+        Sanitizes a value where it enters the runtime (such as the output
+        of a service, or the payload of an event), including every value
+        nested in it (see TypeUtils#safe_type). Since this is done once
+        for such a value, safe_type doesn't have to inspect anything which
+        is nested in it later on.
+
+        Lists and dicts are sanitized in place. A CaseInsensitiveDict is
+        kept as it is, so that stories can look up its keys regardless of
+        their case (its values are sanitized too).
+
+        :param o: the value which enters the runtime
+        :return: the sanitized value
+        """
+        kind = type(o)
+        if kind is list:
+            for index, item in enumerate(o):
+                if type(item) not in TypeUtils.scalar_types:
+                    o[index] = TypeUtils.sanitize(item)
             return o
+        elif kind is dict or kind is CaseInsensitiveDict:
+            for key, item in list(o.items()):
+                if type(item) not in TypeUtils.scalar_types:
+                    o[key] = TypeUtils.sanitize(item)
+            return o
+        elif kind in TypeUtils.trusted_types:
+            return o
+
+        return TypeUtils.safe_type(o)
@@ -7,10 +7,15 @@ from unittest.mock import MagicMock
 
 from pytest import mark
 
-from storyruntime.Exceptions import StackOverflowException, StoryscriptError, \
-    StoryscriptRuntimeError, TypeAssertionRuntimeError, TypeValueRuntimeError
+from storyruntime.Exceptions import ResolverMismatchError, \
+    StackOverflowException, StoryscriptError, StoryscriptRuntimeError, \
+    TypeAssertionRuntimeError, TypeValueRuntimeError
 from storyruntime.Story import Story
+from storyruntime.compiler import StoryCompiler
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
+from storyruntime.enums.ResolverMode import ResolverMode
 from storyruntime.processing import Stories
+from storyruntime.processing.CodeGenerator import CodeGenerator
 from storyruntime.processing.internal import File, Http, Json, Log
 
 import storyscript
@@ -20,10 +25,16 @@ from .Assertions import ContextAssertion, IsANumberAssertion, \
 
 
 class TestCase:
-    def __init__(self, append=None, prepend=None, assertion=None):
+    def __init__(self, append=None, prepend=None, assertion=None,
+                 codegen=True):
         self.append = append
         self.prepend = prepend
         self.assertion = assertion
+        self.codegen = codegen
+        """
+        False if the story can't be translated by the CodeGenerator, and is
+        executed by the Lexicon even for ExecutionEngine.CODEGEN.
+        """
 
 
 class TestSuite:
@@ -1211,11 +1222,14 @@ async def test_mutation(suite: TestSuite, logger):
 
 
 async def run_suite(suite: TestSuite, logger):
-    for case in suite.cases:
-        await run_test_case_in_suite(suite, case, logger)
+    # Every case must behave the same, regardless of the engine.
+    for engine in ExecutionEngine:
+        for case in suite.cases:
+            await run_test_case_in_suite(suite, case, logger, engine)
 
 
-async def run_test_case_in_suite(suite: TestSuite, case: TestCase, logger):
+async def run_test_case_in_suite(suite: TestSuite, case: TestCase, logger,
+                                 engine=ExecutionEngine.LEXICON):
     File.init()
     Log.init()
     Http.init()
@@ -1252,12 +1266,30 @@ async def run_test_case_in_suite(suite: TestSuite, case: TestCase, logger):
     }
     app.environment = {}
 
+    # Every value is resolved by both, the Resolver and the compiled
+    # expression, so that every case verifies that they agree.
+    app.compiled_stories = StoryCompiler.compile_stories(
+        app.stories, ResolverMode.DIFFERENTIAL)
+
+    app.programs = {}
+    if engine == ExecutionEngine.CODEGEN:
+        app.programs = CodeGenerator.generate_stories(
+            app.stories, app.compiled_stories)
+        # Otherwise, the case would silently verify the Lexicon twice.
+        assert (story_name in app.programs) == case.codegen, \
+            f'Unexpected translation (codegen={case.codegen}):\n\n' \
+            f'{all_lines}'
+
     context = {}
 
     story = Story(app, story_name, logger)
     story.prepare(context)
     try:
         await Stories.execute(logger, story)
+    except ResolverMismatchError:
+        print(f'The compiled story disagrees with the Resolver:'
+              f'\n\n{all_lines}', file=sys.stderr)
+        raise
     except StoryscriptError as story_error:
         try:
             assert isinstance(case.assertion, RuntimeExceptionAssertion)
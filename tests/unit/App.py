@@ -13,16 +13,20 @@ from storyruntime.App import App, AppData
 from storyruntime.AppConfig import Forward
 from storyruntime.Containers import Containers
 from storyruntime.Exceptions import StoryscriptError
+from storyruntime.HttpTransport import HttpTransport
 from storyruntime.Kubernetes import Kubernetes
+from storyruntime.Synapse import SubscriptionBatch, SubscriptionRegistry
 from storyruntime.Types import StreamingService
 from storyruntime.constants.ServiceConstants import ServiceConstants
 from storyruntime.entities.Release import Release
 from storyruntime.enums.AppEnvironment import AppEnvironment
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
 from storyruntime.processing import Stories
+from storyruntime.processing.CodeGenerator import CodeGenerator
 from storyruntime.processing.Services import Command, Service, Services
 from storyruntime.utils.HttpUtils import HttpUtils
 
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPResponse
+from tornado.httpclient import HTTPError, HTTPRequest, HTTPResponse
 
 
 @fixture
@@ -119,13 +123,10 @@ async def test_unsubscribe_all(patch, app, async_mock, magic, response_code):
     patch.object(HttpUtils, 'fetch_with_retry',
                  new=async_mock(return_value=res))
 
-    patch.init(AsyncHTTPClient)
-
-    client = AsyncHTTPClient()
-
     await app.unsubscribe_all()
 
     url = 'http://alpine.com:28/unsub'
+    client = HttpTransport.services(url)
     expected_kwargs = {
         'method': 'POST',
         'body': json.dumps(payload['sub_body']),
@@ -141,6 +142,22 @@ async def test_unsubscribe_all(patch, app, async_mock, magic, response_code):
         app.logger.error.assert_called_once()
 
 
+@mark.asyncio
+async def test_unsubscribe_all_errors(patch, app, async_mock, magic):
+    app.add_subscription('a', magic(), 'event_name', {})
+    app.add_subscription('b', magic(), 'event_name', {})
+    app.add_subscription('c', magic(), 'event_name', {})
+
+    def unsubscribe(sub):
+        if sub.id != 'b':
+            raise HTTPError(500)
+
+    patch.object(app, 'unsubscribe', new=async_mock(side_effect=unsubscribe))
+    await app.unsubscribe_all()
+    assert app.unsubscribe.mock.call_count == 3
+    assert app.logger.error.call_count == 2
+
+
 @mark.parametrize('env', [{'env': True}, None, {'a': {'nested': '1'}}])
 @mark.parametrize('always_pull_images', [False, True])
 def test_app_init(magic, config, logger, env, always_pull_images):
@@ -203,6 +220,58 @@ def test_app_init(magic, config, logger, env, always_pull_images):
         assert app.image_pull_policy() == 'IfNotPresent'
 
 
+@mark.parametrize('app_engine,engine,expected', [
+    (None, ExecutionEngine.LEXICON, ExecutionEngine.LEXICON),
+    (None, ExecutionEngine.CODEGEN, ExecutionEngine.CODEGEN),
+    (ExecutionEngine.CODEGEN, ExecutionEngine.LEXICON,
+     ExecutionEngine.CODEGEN)
+])
+def test_app_execution_engine(app, app_engine, engine, expected):
+    app.app_config.get_execution_engine.return_value = app_engine
+    app.config.EXECUTION_ENGINE = engine
+    assert app.execution_engine() == expected
+
+
+@mark.parametrize('engine', [ExecutionEngine.LEXICON,
+                             ExecutionEngine.CODEGEN])
+def test_app_init_programs(patch, magic, config, logger, engine):
+    patch.object(CodeGenerator, 'generate_stories')
+    config.EXECUTION_ENGINE = engine
+    app_config = magic()
+    app_config.get_execution_engine.return_value = None
+    stories = {'entrypoint': [], 'stories': {}}
+
+    app = App(app_data=AppData(
+        release=Release(
+            app_uuid='app_id',
+            app_name='app_name',
+            app_dns='app_dns',
+            version=1,
+            stories=stories,
+            always_pull_images=False,
+            environment={},
+            owner_uuid='owner_1',
+            owner_email='example@example.com',
+            maintenance=False,
+            deleted=False,
+            state='QUEUED',
+            app_environment=AppEnvironment.PRODUCTION
+        ),
+        app_config=app_config,
+        services={},
+        config=config,
+        logger=logger
+    ))
+
+    if engine == ExecutionEngine.CODEGEN:
+        CodeGenerator.generate_stories.assert_called_with(
+            app.stories, app.compiled_stories, app_config)
+        assert app.programs == CodeGenerator.generate_stories()
+    else:
+        CodeGenerator.generate_stories.assert_not_called()
+        assert app.programs == {}
+
+
 @mark.asyncio
 async def test_app_bootstrap(patch, app, async_mock):
     patch.object(app, 'run_stories', new=async_mock())
@@ -289,6 +358,7 @@ async def test_start_services_completed_exc(patch, app, async_mock, magic):
         'a': {
             'tree': {
                 '1': {
+                    'ln': '1',
                     'method': 'execute'
                 }
             },
@@ -318,14 +388,16 @@ async def test_start_services(patch, app, async_mock, magic,
         'a.story': {
             'tree': {
                 '1': {
+                    'ln': '1',
                     'method': 'execute',
                     'next': '2'
                 },
                 '2': {
+                    'ln': '2',
                     'method': 'execute',
                     'next': '3'
                 },
-                '3': {'method': 'not_execute'}
+                '3': {'ln': '3', 'method': 'not_execute'}
             },
             'entrypoint': '1'
         }
@@ -419,8 +491,11 @@ async def test_app_run_stories(patch, app, async_mock):
     app.entrypoint = ['foo', 'bar']
     app.stories = stories
     patch.object(Stories, 'run', new=async_mock())
+    patch.object(SubscriptionBatch, 'flush', new=async_mock())
     await app.run_stories()
     assert Stories.run.mock.call_count == 2
+    assert SubscriptionBatch.flush.mock.call_count == 1
+    assert app.subscription_batch is None
 
 
 @mark.asyncio
@@ -473,7 +548,8 @@ async def test_clear_subscriptions_synapse(patch, app, async_mock,
 
     ret = await app.clear_subscriptions_synapse()
     HttpUtils.fetch_with_retry.mock.assert_called_with(
-        3, app.logger, expected_url, AsyncHTTPClient(), expected_kwargs)
+        3, app.logger, expected_url, HttpTransport.control(expected_url),
+        expected_kwargs, idempotent=True)
 
     if status_code == 200:
         assert ret is True
@@ -491,8 +567,33 @@ async def test_app_destroy(patch, app, async_mock):
     patch.object(app, 'unsubscribe_all', new=async_mock())
     patch.object(app, 'clear_subscriptions_synapse', new=async_mock())
     patch.object(app, 'cleanup_tmp_dir')
+    dropped = []
+    patch.object(HttpTransport, 'drop',
+                 side_effect=lambda *args: dropped.append(
+                     (args[0], set(args[1]))))
+    app.containers.started('foo', 'host')
+    app.response_cache.put(('a', 'b', 'GET', 'u', None, ()), 'a', 1, 60)
     await app.destroy()
 
-    app.unsubscribe_all.mock.assert_called()
+    assert dropped == [(app.app_id, {'host'})]
+    assert app.containers.hostname_for('foo') is None
+    assert len(app.response_cache.entries) == 0
+    app.unsubscribe_all.mock.assert_called_with()
     app.clear_subscriptions_synapse.mock.assert_called()
     app.cleanup_tmp_dir.assert_called()
+
+
+@mark.asyncio
+async def test_app_destroy_bulk(patch, app, async_mock, magic):
+    app.config.SYNAPSE_BULK_SUBSCRIBE = True
+    patch.object(app, 'unsubscribe_all', new=async_mock())
+    patch.object(app, 'clear_subscriptions_synapse', new=async_mock())
+    patch.object(app, 'cleanup_tmp_dir')
+    patch.object(SubscriptionRegistry, 'unsubscribe', new=async_mock())
+    app.add_subscription('a', magic(), 'event_name', {})
+    app.add_subscription('b', magic(), 'event_name', {})
+    await app.destroy()
+
+    SubscriptionRegistry.unsubscribe.mock.assert_called_with(app, ['a', 'b'])
+    app.unsubscribe_all.mock.assert_called_with()
+    app.clear_subscriptions_synapse.mock.assert_not_called()
@@ -1,5 +1,10 @@
 # -*- coding: utf-8 -*-
-from storyruntime.AppConfig import AppConfig
+import pytest
+from pytest import mark
+
+from storyruntime.AppConfig import AppConfig, Limit
+from storyruntime.Config import Config
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
 
 
 def test_app_config():
@@ -28,3 +33,132 @@ def test_app_config():
         assert exposes[i].service == f'service_{i}'
         assert exposes[i].http_path == f'/my_expose_path_{i}'
         assert exposes[i].service_forward_name == f'expose_name_{i}'
+
+
+@mark.parametrize('engine,expected', [
+    (None, None),
+    ('codegen', ExecutionEngine.CODEGEN),
+    ('LEXICON', ExecutionEngine.LEXICON)
+])
+def test_app_config_engine(engine, expected):
+    raw = {}
+    if engine is not None:
+        raw['runtime'] = {'engine': engine}
+
+    assert AppConfig(raw).get_execution_engine() == expected
+
+
+def test_app_config_engine_unknown():
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'engine': 'unknown'}})
+
+
+def test_app_config_for_concurrency():
+    config = AppConfig({'runtime': {'for': {
+        'concurrency': 4,
+        'loops': [{'story': 'a.story', 'line': 12, 'concurrency': 8}]
+    }}})
+    assert config.get_for_concurrency('a.story', '12') == 8
+    assert config.get_for_concurrency('a.story', '13') == 4
+    assert AppConfig({}).get_for_concurrency('a.story', '12') == 1
+
+
+@mark.parametrize('concurrency', [0, -1, 'many'])
+def test_app_config_for_concurrency_invalid(concurrency):
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'for': {'concurrency': concurrency}}})
+
+
+def test_app_config_execute():
+    config = AppConfig({'runtime': {'execute': {
+        'concurrent': True,
+        'unsafe': ['log', 'http.write']
+    }}})
+    assert config.is_execute_concurrent() is True
+    assert config.is_execute_unsafe('log', 'info') is True
+    assert config.is_execute_unsafe('http', 'write') is True
+    assert config.is_execute_unsafe('http', 'fetch') is False
+
+    config = AppConfig({})
+    assert config.is_execute_concurrent() is False
+    assert config.is_execute_unsafe('log', 'info') is False
+
+
+@mark.parametrize('execute', [{'concurrent': 'yes'}, {'unsafe': 'log'}])
+def test_app_config_execute_invalid(execute):
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'execute': execute}})
+
+
+def test_app_config_memoize_functions():
+    config = AppConfig({'runtime': {'functions': {'memoize': True}}})
+    assert config.is_memoize_functions() is True
+    assert AppConfig({}).is_memoize_functions() is False
+
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'functions': {'memoize': 'yes'}}})
+
+
+def test_app_config_hedge_http():
+    config = AppConfig({'runtime': {'http': {'hedge': True}}})
+    assert config.is_hedge_http() is True
+    assert AppConfig({}).is_hedge_http() is False
+
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'http': {'hedge': 'yes'}}})
+
+
+def test_app_config_coalesce_http():
+    config = AppConfig({'runtime': {'http': {'coalesce': ['a', 'b.c']}}})
+    assert config.is_coalesce_http('a', 'x') is True
+    assert config.is_coalesce_http('b', 'c') is True
+    assert config.is_coalesce_http('b', 'x') is False
+    assert AppConfig({}).is_coalesce_http('a', 'x') is False
+
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'http': {'coalesce': 'a'}}})
+
+
+def test_app_config_cache_ttl():
+    config = AppConfig({'runtime': {'http': {'cache': [
+        {'service': 'a', 'ttl': 60},
+        {'service': 'a', 'command': 'b', 'ttl': 0.5}
+    ]}}})
+    assert config.get_cache_ttl('a', 'x') == 60
+    assert config.get_cache_ttl('a', 'b') == 0.5
+    assert config.get_cache_ttl('b', 'b') is None
+    assert AppConfig({}).get_cache_ttl('a', 'x') is None
+
+
+@mark.parametrize('cache', [{'ttl': 60}, {'service': 'a'},
+                            {'service': 'a', 'ttl': 0}])
+def test_app_config_cache_ttl_invalid(cache):
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'http': {'cache': [cache]}}})
+
+
+def test_app_config_service_limit():
+    config = AppConfig({'runtime': {'http': {'limits': [
+        {'service': 'a', 'concurrency': 4},
+        {'service': 'b', 'concurrency': 8, 'queue': 0, 'timeout': 0.5,
+         'adaptive': True}
+    ]}}})
+    assert config.get_service_limit('a') == Limit(
+        concurrency=4, queue=Config.SERVICE_QUEUE_SIZE,
+        timeout=Config.SERVICE_QUEUE_TIMEOUT, adaptive=False)
+    assert config.get_service_limit('b') == Limit(
+        concurrency=8, queue=0, timeout=0.5, adaptive=True)
+    assert config.get_service_limit('c') is None
+    assert AppConfig({}).get_service_limit('a') is None
+
+
+@mark.parametrize('limit', [
+    {'concurrency': 4},
+    {'service': 'a'},
+    {'service': 'a', 'concurrency': 4, 'queue': -1},
+    {'service': 'a', 'concurrency': 4, 'timeout': 0},
+    {'service': 'a', 'concurrency': 4, 'adaptive': 'yes'}
+])
+def test_app_config_service_limit_invalid(limit):
+    with pytest.raises(AssertionError):
+        AppConfig({'runtime': {'http': {'limits': [limit]}}})
@@ -9,6 +9,7 @@ from pytest import fixture, mark
 from storyruntime.App import App, AppData
 from storyruntime.AppConfig import AppConfig
 from storyruntime.Apps import Apps
+from storyruntime.ContainerRegistry import ContainerRegistry
 from storyruntime.Containers import Containers
 from storyruntime.Exceptions import StoryscriptError, TooManyActiveApps, \
     TooManyServices, TooManyVolumes
@@ -172,6 +173,20 @@ async def test_init_all(app_environment, patch, magic,
     ] if config.APP_ENVIRONMENT == AppEnvironment.PRODUCTION else [])
 
 
+@mark.asyncio
+@mark.parametrize('bulk', [False, True])
+async def test_init_all_bulk(patch, async_mock, config, logger, bulk):
+    config.SYNAPSE_BULK_SUBSCRIBE = bulk
+    patch.object(Database, 'create_subscriptions_table', new=async_mock())
+    patch.object(Apps, 'reload_apps', new=async_mock())
+    patch.object(Apps, 'start_release_listener')
+    patch.object(asyncio, 'create_task')
+
+    await Apps.init_all(config, logger)
+    assert Database.create_subscriptions_table.mock.call_count == int(bulk)
+    Apps.reload_apps.mock.assert_called_with(config, logger)
+
+
 def test_get(magic):
     app = magic()
     Apps.apps['app_id'] = app
@@ -462,6 +477,7 @@ async def test_deploy_release(config, magic, patch, deleted,
 
     patch.object(Apps, 'get_services', new=async_mock(return_value=services))
     patch.init(App)
+    patch.object(App, 'containers', ContainerRegistry(), create=True)
     if raise_exc is not None:
         patch.object(App, 'bootstrap', new=async_mock(side_effect=raise_exc()))
     else:
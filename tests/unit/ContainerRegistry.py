@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from storyruntime.ContainerRegistry import ContainerRegistry
+
+
+def test_container_registry():
+    registry = ContainerRegistry()
+    line = {'ln': '1'}
+    assert registry.name_for('a.story', line, 'alpine') is None
+    registry.set_name('a.story', line, 'alpine', 'alpine-1')
+    assert registry.name_for('a.story', line, 'alpine') == 'alpine-1'
+    assert registry.name_for('b.story', line, 'alpine') is None
+
+    assert registry.hostname_for('alpine-1') is None
+    registry.started('alpine-1', 'host')
+    assert registry.hostname_for('alpine-1') == 'host'
+
+    registry.clear()
+    assert registry.name_for('a.story', line, 'alpine') is None
+    assert registry.hostname_for('alpine-1') is None
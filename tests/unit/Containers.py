@@ -6,6 +6,7 @@ import pytest
 from pytest import fixture, mark
 
 from storyruntime.AppConfig import Forward
+from storyruntime.ContainerRegistry import ContainerRegistry
 from storyruntime.Containers import Containers
 from storyruntime.Exceptions import ActionNotFound, \
     ContainerSpecNotRegisteredError, \
@@ -117,6 +118,40 @@ async def test_clean_app(patch, async_mock):
     Kubernetes.clean_namespace.mock.assert_called_with(app)
 
 
+@mark.asyncio
+async def test_clean_app_registry(patch, async_mock):
+    patch.object(Kubernetes, 'clean_namespace', new=async_mock())
+    app = MagicMock()
+    app.containers = ContainerRegistry()
+    app.containers.started('alpine-1', 'host')
+    await Containers.clean_app(app)
+    assert app.containers.hostname_for('alpine-1') is None
+
+
+@mark.asyncio
+async def test_start_registry(patch, story, async_mock):
+    story.app.containers = ContainerRegistry()
+    story.app.app_id = 'my_app'
+    line = {LineConstants.service: 'alpine', LineConstants.command: 'echo',
+            'ln': '1'}
+    patch.object(Containers, 'create_and_start', new=async_mock())
+    patch.object(Containers, 'get_container_name',
+                 return_value='asyncy-alpine')
+
+    first = await Containers.start(story, line)
+    second = await Containers.start(story, line)
+    assert first == second
+    assert first.hostname == 'asyncy-alpine.my_app.svc.cluster.local'
+    assert Containers.create_and_start.mock.call_count == 1
+    assert Containers.get_container_name.call_count == 1
+    assert await Containers.get_hostname(story, line, 'alpine') == \
+        first.hostname
+
+    story.app.containers.clear()
+    await Containers.start(story, line)
+    assert Containers.create_and_start.mock.call_count == 2
+
+
 @mark.asyncio
 async def test_remove_volume(patch, story, line, async_mock):
     patch.object(Kubernetes, 'remove_volume', new=async_mock())
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from storyruntime.Context import ChildContext, Context
+from storyruntime.utils import Dict
+
+
+def test_context():
+    scope = {'a': 1}
+    context = Context(scope, {'b': 2})
+    context['c'] = 3
+    assert context['a'] == 1
+    assert context['b'] == 2
+    assert scope == {'a': 1, 'b': 2, 'c': 3}
+
+
+def test_context_missing():
+    context = Context({}, {})
+    with pytest.raises(KeyError):
+        context['a']
+
+    assert context.get('a') is None
+    assert 'a' not in context
+
+
+def test_context_copy_on_access():
+    app = {'hostname': 'foo'}
+    shared = {'app': app}
+    first = Context({}, shared)
+    second = Context({}, shared)
+
+    assert first.maps[0] == {}
+    Dict.set(first, ['app', 'hostname'], 'bar')
+
+    assert first['app'] == {'hostname': 'bar'}
+    assert first['app'] is first['app']
+    assert second['app'] == {'hostname': 'foo'}
+    assert app == {'hostname': 'foo'}
+
+
+def test_context_delete():
+    context = Context({'a': 1}, {'a': 2})
+    del context['a']
+    assert context['a'] == 2
+
+
+def test_child_context():
+    parent = Context({'a': 1, 'nested': {'b': 2}}, {'app': {'c': 3}})
+    child = ChildContext(parent)
+    assert child.maps[0] == {}
+    assert child['a'] == 1
+    assert child.maps[0] == {'a': 1}
+
+    child['a'] = 10
+    Dict.set(child, ['nested', 'b'], 20)
+    Dict.set(child, ['app', 'c'], 30)
+    child['d'] = 4
+    child['loop'] = 5
+    assert parent['a'] == 1
+    assert parent['nested'] == {'b': 2}
+
+    child.merge(exclude=('loop',))
+    assert parent.maps[0] == {'a': 10, 'nested': {'b': 20},
+                              'app': {'c': 30}, 'd': 4}
+
+
+def test_child_context_delete():
+    parent = Context({'a': 1}, {})
+    child = ChildContext(parent)
+    child['a'] = 2
+    del child['a']
+    assert child['a'] == 1
+
+    child.merge()
+    assert parent.maps[0] == {}
+
+
+def test_child_context_nested():
+    parent = Context({'a': 1}, {'app': {}})
+    child = ChildContext(ChildContext(parent))
+    assert child['a'] == 1
+    assert child['app'] == {}
+    assert child.maps[0] == {'a': 1, 'app': {}}
+    assert 'app' in child.maps[0]
+
+
+def test_child_context_discarded():
+    parent = Context({'a': {'b': {'c': 0}}}, {})
+    child = ChildContext(parent)
+    Dict.set(child, ['a', 'b', 'c'], 1)
+    assert child['a'] == {'b': {'c': 1}}
+
+    # The iteration is discarded (such as by break), so it's never merged.
+    assert parent['a'] == {'b': {'c': 0}}
+
+
+def test_child_context_modified_in_place():
+    items = [1]
+    parent = Context({'items': items, 'other': [2]}, {})
+    child = ChildContext(parent)
+    child['items'].append(99)
+    assert child['other'] == [2]
+    assert parent['items'] == [1]
+
+    child.merge()
+    assert parent.maps[0] == {'items': [1, 99], 'other': [2]}
+    assert items == [1]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import re
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import mark
+
+from storyruntime import Metrics
+from storyruntime.AppConfig import AppConfig
+from storyruntime.FunctionCache import FunctionCache
+from storyruntime.compiler import Line
+
+
+def story_with(cache):
+    story = MagicMock()
+    story.name = 'story'
+    story.app.function_cache = cache
+    return story
+
+
+def function_line(pure=True):
+    line = Line({'ln': '1', 'method': 'function', 'function': 'f'})
+    line.pure = pure
+    return line
+
+
+@mark.parametrize('value,size', [
+    ('a', 1),
+    (None, 1),
+    ([1, [2.0, True]], 5),
+    ({'a': [1], 'b': {}}, 6)
+])
+def test_function_cache_freeze(value, size):
+    frozen, frozen_size = FunctionCache.freeze(value)
+    assert hash(frozen) is not None
+    assert frozen_size == size
+
+
+def test_function_cache_freeze_types():
+    keys = {FunctionCache.freeze(v)[0] for v in (1, 1.0, True, '1', [1])}
+    assert len(keys) == 5
+
+
+@mark.parametrize('value', [re.compile('a'), {'a': object()}, (1,)])
+def test_function_cache_freeze_unsupported(value):
+    with pytest.raises(TypeError):
+        FunctionCache.freeze(value)
+
+
+def test_function_cache_for_config():
+    app_config = AppConfig({'runtime': {'functions': {'memoize': True}}})
+    config = MagicMock()
+    config.FUNCTION_CACHE_SIZE = 10
+    assert FunctionCache.for_config(config, app_config, 'app').capacity == 10
+    assert FunctionCache.for_config(config, AppConfig({}), 'app') is None
+    assert FunctionCache.for_config(config, None, 'app') is None
+
+
+def test_function_cache_lookup(patch, magic):
+    patch.object(Metrics, 'function_cache_hits', new=magic())
+    patch.object(Metrics, 'function_cache_misses', new=magic())
+    cache = FunctionCache('app', 100)
+    story = story_with(cache)
+    line = function_line()
+
+    key, hit, value = FunctionCache.lookup(story, line, {'n': [1]})
+    assert hit is False and value is None
+    returned = {'a': [1]}
+    cache.put(key, returned)
+    returned['a'].append(2)
+
+    key, hit, value = FunctionCache.lookup(story, line, {'n': [1]})
+    assert hit is True and value == {'a': [1]}
+    value['a'].append(3)
+    assert FunctionCache.lookup(story, line, {'n': [1]})[1:] == \
+        (True, {'a': [1]})
+    assert (cache.hits, cache.misses) == (2, 1)
+    Metrics.function_cache_hits.labels.assert_called_with(app_id='app')
+    assert Metrics.function_cache_misses.labels().inc.call_count == 1
+
+
+@mark.parametrize('cache,pure,context', [
+    (FunctionCache('app', 100), False, {}),
+    (FunctionCache('app', 100), True, {'n': re.compile('a')}),
+    (None, True, {})
+])
+def test_function_cache_lookup_not_memoized(cache, pure, context):
+    assert FunctionCache.lookup(story_with(cache), function_line(pure),
+                                context) == (None, False, None)
+
+
+def test_function_cache_evicts():
+    cache = FunctionCache('app', 12)
+    story = story_with(cache)
+    line = function_line()
+
+    def key(n):
+        return FunctionCache.lookup(story, line, {'n': n})[0]
+
+    # The key of every call holds 3 values, and each return value 3.
+    cache.put(key(1), [1, 2])
+    cache.put(key(2), [1, 2])
+    assert cache.size == 12
+    assert cache.get(key(1)[0]) == (True, [1, 2])
+
+    cache.put(key(3), [1, 2])
+    assert cache.size == 12
+    assert cache.get(key(2)[0]) == (False, None)
+    assert cache.get(key(1)[0])[0] is True
+
+    cache.put(key(3), 'a')
+    assert cache.size == 10
+
+    cache.put(key(4), list(range(10)))
+    assert cache.get(key(4)[0]) == (False, None)
+    cache.put(key(5), re.compile('a'))
+    assert cache.get(key(5)[0]) == (False, None)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock
+
+from storyruntime.Hedge import Hedge
+
+
+def test_hedge_for_action():
+    app = MagicMock(hedges={}, app_id='app_id')
+    app.config.HTTP_HEDGE_MAX_RATE = 0.1
+    hedge = Hedge.for_action(app, 'alpine', 'echo')
+    assert hedge.service == 'alpine'
+    assert hedge.max_rate == 0.1
+    assert Hedge.for_action(app, 'alpine', 'echo') is hedge
+    assert Hedge.for_action(app, 'alpine', 'ls') is not hedge
+
+    assert Hedge.for_action(MagicMock(hedges=None), 'alpine', 'echo') is None
+
+
+def test_hedge_delay():
+    hedge = Hedge('app_id', 'alpine', 0.05)
+    for i in range(hedge.min_samples - 1):
+        hedge.record(i / 100)
+    assert hedge.delay() is None
+
+    hedge.record(1)
+    assert hedge.delay() == 0.18
+
+
+def test_hedge_allow():
+    hedge = Hedge('app_id', 'alpine', 0.05)
+    assert hedge.allow() is False
+
+    for _ in range(20):
+        hedge.called(False)
+    assert hedge.allow() is True
+    hedge.called(True)
+    assert hedge.allow() is False
+
+    for _ in range(hedge.window):
+        hedge.called(False)
+    assert hedge.hedged == 0
+    assert hedge.allow() is True
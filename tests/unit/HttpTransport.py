@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+from pytest import mark
+
+from storyruntime import Metrics
+from storyruntime.Config import Config
+from storyruntime.HttpTransport import CircuitBreaker, HttpPool, \
+    HttpTransport, RetryBudget
+
+from tornado.simple_httpclient import SimpleAsyncHTTPClient
+
+
+@mark.asyncio
+async def test_http_transport_pools(patch):
+    patch.object(Config, 'HTTP_CLIENT', 'simple')
+    patch.object(Config, 'HTTP_MAX_CONNECTIONS', 7)
+    patch.object(Config, 'HTTP_CONTROL_MAX_CONNECTIONS', 3)
+
+    pool = HttpTransport.services('http://alpine:5000/echo?a=b')
+    assert pool is HttpTransport.services('http://alpine:5000/other')
+    assert pool.destination == 'http://alpine:5000'
+    assert pool.max_connections == 7
+    assert isinstance(pool.client, SimpleAsyncHTTPClient)
+    assert pool.client.max_clients == 7
+
+    assert HttpTransport.services('http://alpine:5001/echo') is not pool
+    control = HttpTransport.control('http://alpine:5000/echo')
+    assert control is not pool
+    assert control.max_connections == 3
+
+
+@mark.asyncio
+async def test_http_transport_evicts_pools(patch):
+    patch.object(Config, 'HTTP_CLIENT', 'simple')
+    patch.object(Config, 'HTTP_MAX_POOLS', 2)
+    patch.object(HttpPool, 'close')
+
+    a = HttpTransport.services('http://a')
+    b = HttpTransport.services('http://b')
+    assert HttpTransport.services('http://a') is a
+    HttpTransport.services('http://c')
+    HttpPool.close.assert_called_once()
+    assert HttpTransport.services('http://a') is a
+    assert HttpTransport.services('http://b') is not b
+
+    # Pools with requests in flight aren't closed.
+    a.in_flight = 1
+    HttpTransport.services('http://d')
+    assert HttpTransport.services('http://a') is a
+    assert HttpPool.close.call_count == 3
+
+
+@mark.asyncio
+async def test_http_transport_pools_per_app(patch):
+    patch.object(Config, 'HTTP_CLIENT', 'simple')
+    shared = HttpTransport.services('http://alpine')
+    a = HttpTransport.services('https://api.com/a', 'a')
+    assert HttpTransport.services('https://api.com/b', 'a') is a
+    b = HttpTransport.services('https://api.com/a', 'b')
+    assert b is not a
+    assert b.breaker is not a.breaker and b.budget is not a.budget
+    assert a.app_id == 'a' and shared.app_id is None
+
+    patch.object(HttpPool, 'close')
+    HttpTransport.drop('a', ['alpine'])
+    assert HttpPool.close.call_count == 2
+    assert HttpTransport.services('https://api.com/a', 'b') is b
+    assert HttpTransport.services('https://api.com/a', 'a') is not a
+    assert HttpTransport.services('http://alpine') is not shared
+
+
+@mark.parametrize('name,expected', [
+    ('simple', SimpleAsyncHTTPClient),
+    ('tornado.simple_httpclient.SimpleAsyncHTTPClient',
+     SimpleAsyncHTTPClient)
+])
+def test_http_transport_client_class(patch, name, expected):
+    patch.object(Config, 'HTTP_CLIENT', name)
+    assert HttpTransport.client_class() is expected
+
+
+def test_http_transport_client_class_curl(patch):
+    patch.object(Config, 'HTTP_CLIENT', 'curl')
+    try:
+        import pycurl  # noqa: F401
+    except ImportError:
+        assert HttpTransport.client_class() is SimpleAsyncHTTPClient
+    else:
+        assert HttpTransport.client_class().__name__ == \
+            'CurlAsyncHTTPClient'
+
+
+def test_http_transport_client_class_unknown(patch):
+    patch.object(Config, 'HTTP_CLIENT', 'storyruntime.Nothing')
+    with pytest.raises(ImportError):
+        HttpTransport.client_class()
+
+
+@mark.asyncio
+async def test_http_pool_fetch(patch, magic):
+    patch.object(Metrics, 'http_queue_wait_seconds', new=magic())
+    in_flight = []
+    peak = []
+
+    class Client:
+        @staticmethod
+        async def fetch(url, **kwargs):
+            in_flight.append(url)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(url)
+            return url, kwargs
+
+    pool = HttpPool('services', 'http://alpine', Client(), 2)
+    results = await asyncio.gather(
+        *[pool.fetch(f'http://alpine/{i}', method='GET') for i in range(5)])
+
+    assert results[3] == ('http://alpine/3', {'method': 'GET'})
+    assert max(peak) == 2
+    Metrics.http_queue_wait_seconds.labels.assert_called_with(
+        pool='services')
+    assert Metrics.http_queue_wait_seconds.labels().observe.call_count == 5
+
+
+def test_circuit_breaker(patch, magic):
+    patch.object(Metrics, 'http_circuits', new=magic())
+    now = [100.0]
+    patch.object(time, 'monotonic', side_effect=lambda: now[0])
+    breaker = CircuitBreaker('services', 'http://alpine', 0.5, 5)
+
+    for _ in range(breaker.min_requests - 1):
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+    # The breaker moved from closed to open.
+    assert Metrics.http_circuits.labels.call_args_list == [
+        mock.call(pool='services', state='closed'),
+        mock.call(pool='services', state='closed'),
+        mock.call(pool='services', state='open')
+    ]
+    assert Metrics.http_circuits.labels().inc.call_count == 2
+    assert Metrics.http_circuits.labels().dec.call_count == 1
+
+    now[0] += 5
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is False
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] += 5
+    assert breaker.allow() is True
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+    breaker.discard()
+    assert breaker.state is None
+    Metrics.http_circuits.labels.assert_called_with(
+        pool='services', state='closed')
+    assert Metrics.http_circuits.labels().inc.call_count == \
+        Metrics.http_circuits.labels().dec.call_count
+
+
+def test_circuit_breaker_error_rate(patch, magic):
+    patch.object(Metrics, 'http_circuits', new=magic())
+    breaker = CircuitBreaker('services', 'http://alpine', 0.5, 5)
+    for _ in range(breaker.window * 2):
+        breaker.record(True)
+        breaker.record(True)
+        breaker.record(False)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == breaker.outcomes.count(False)
+
+
+def test_retry_budget(patch):
+    now = [100.0]
+    patch.object(time, 'monotonic', side_effect=lambda: now[0])
+    budget = RetryBudget(0.5, 1)
+    for _ in range(4):
+        budget.deposit()
+
+    assert [budget.withdraw() for _ in range(4)] == \
+        [True, True, True, False]
+
+    now[0] += RetryBudget.ttl + 1
+    budget.deposit()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
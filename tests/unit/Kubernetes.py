@@ -13,6 +13,7 @@ from pytest import fixture, mark
 
 from storyruntime.AppConfig import Forward, KEY_EXPOSE, KEY_FORWARDS
 from storyruntime.Exceptions import K8sError
+from storyruntime.HttpTransport import HttpTransport
 from storyruntime.Kubernetes import Kubernetes
 from storyruntime.constants.LineConstants import LineConstants
 from storyruntime.constants.ServiceConstants import ServiceConstants
@@ -21,8 +22,6 @@ from storyruntime.entities.ContainerConfig import ContainerConfig
 from storyruntime.entities.Volume import Volume
 from storyruntime.utils.HttpUtils import HttpUtils
 
-from tornado.httpclient import AsyncHTTPClient
-
 
 @fixture
 def line():
@@ -235,9 +234,7 @@ async def test_make_k8s_call(patch, story, async_mock, method):
     patch.object(Kubernetes, 'new_ssl_context', return_value=context)
     context.load_verify_locations = MagicMock()
 
-    patch.init(AsyncHTTPClient)
-
-    client = AsyncHTTPClient()
+    client = HttpTransport.control('https://k8s.local')
 
     story.app.config.CLUSTER_CERT = 'this_is\\nmy_cert'  # Notice the \\n.
     story.app.config.CLUSTER_AUTH_TOKEN = 'my_token'
@@ -269,7 +266,7 @@ async def test_make_k8s_call(patch, story, async_mock, method):
 
     HttpUtils.fetch_with_retry.mock.assert_called_with(
         3, story.app.logger, 'https://k8s.local/hello_world', client,
-        expected_kwargs)
+        expected_kwargs, idempotent=True)
 
     # Notice the \n. \\n MUST be converted to \n in Kubernetes#make_k8s_call.
     context.load_verify_locations.assert_called_with(cadata='this_is\nmy_cert')
@@ -947,6 +944,37 @@ async def test_check_for_image_errors(patch, app, async_mock):
                                                      f'/pods?{qs}')
 
 
+def _pod_with(*states):
+    return {
+        'status': {
+            'containerStatuses': [{
+                'containerID': f'docker://{index}',
+                'state': {state: {}}
+            } for index, state in enumerate(states)]
+        }
+    }
+
+
+@mark.parametrize('items,container_id', [
+    ([_pod_with('running')], 'docker://0'),
+    ([_pod_with('waiting', 'running')], 'docker://1'),
+    ([_pod_with('waiting')], None),
+    ([_pod_with('running'), _pod_with('running')], None),
+    ([], None)
+])
+@mark.asyncio
+async def test_get_container_id(patch, app, async_mock, items, container_id):
+    app.app_id = 'my_app'
+    patch.object(Kubernetes, 'make_k8s_call', new=async_mock(
+        return_value=_create_response(200, {'items': items})))
+
+    assert await Kubernetes.get_container_id(app, 'alpine-1') == \
+        container_id
+    qs = urllib.parse.urlencode({'labelSelector': 'app=alpine-1'})
+    Kubernetes.make_k8s_call.mock.assert_called_with(
+        app.config, app.logger, f'/api/v1/namespaces/my_app/pods?{qs}')
+
+
 @mark.parametrize('service', [{
     'name': 'first',
     'configuration': {},
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import time
+
+from pytest import mark
+
+from storyruntime.Config import Config
+from storyruntime.LineResults import LineResults
+from storyruntime.enums.LineRecording import LineRecording
+
+
+def run(results, line_numbers):
+    for line_number in line_numbers:
+        results.start(line_number)
+        results.end(line_number, output=f'output {line_number}')
+
+
+def test_line_results_off():
+    results = LineResults(LineRecording.OFF)
+    run(results, ['1', '2'])
+    assert results == {}
+    assert list(results.executions()) == []
+
+
+def test_line_results_last(patch):
+    patch.object(time, 'time', return_value=1)
+    results = LineResults(LineRecording.LAST, size=3)
+    run(results, ['1', '2', '1', '3', '4'])
+    assert list(results.keys()) == ['1', '3', '4']
+    assert results['4'] == {'start': 1, 'end': 1}
+    assert [e[0] for e in results.executions()] == ['1', '3', '4']
+
+
+def test_line_results_last_overwritten():
+    results = LineResults(LineRecording.LAST, size=2)
+    results.start('1')
+    run(results, ['2', '3'])
+    results.end('1')
+    assert list(results.keys()) == ['2', '3']
+    assert all(e[2] is not None for e in results.executions())
+
+
+def test_line_results_sampled():
+    results = LineResults(LineRecording.SAMPLED, size=10, sample_rate=3)
+    run(results, [str(i) for i in range(7)])
+    assert list(results.keys()) == ['0', '3', '6']
+
+
+def test_line_results_full(patch):
+    patch.object(time, 'time', return_value=1)
+    results = LineResults(LineRecording.FULL, size=1, outputs=True)
+    run(results, ['1', '2', '1'])
+    results.start('3')
+    assert len(results) == 3
+    assert results['1'] == {'start': 1, 'end': 1, 'output': 'output 1'}
+    assert results['3'] == {'start': 1, 'output': None}
+    assert list(results.executions())[2] == ('3', 1, None, None)
+
+
+@mark.parametrize('mode', [
+    LineRecording.LAST, LineRecording.SAMPLED, LineRecording.FULL
+])
+def test_line_results_latest(mode):
+    results = LineResults(mode, size=4, sample_rate=2)
+    line_numbers = [str(i % 5) for i in range(1, 40, 3)]
+    run(results, line_numbers)
+    latest = {}
+    for line_number, start, end, output in results.executions():
+        latest.pop(line_number, None)
+        latest[line_number] = start
+
+    if mode == LineRecording.FULL:
+        assert sorted(results) == sorted(latest)
+    else:
+        assert list(results) == list(latest)
+    assert len(results) == len(latest)
+    for line_number, start in latest.items():
+        assert results[line_number]['start'] == start
+
+
+def test_line_results_end_not_started():
+    results = LineResults(LineRecording.FULL)
+    results.end('1', output='output')
+    assert results == {}
+
+
+def test_line_results_for_config(magic):
+    results = LineResults.for_config(magic())
+    assert results.mode == Config.LINE_RESULTS
+    assert results.size == Config.LINE_RESULTS_SIZE
+    assert results.sample_rate == Config.LINE_RESULTS_SAMPLE_RATE
+    assert results._outputs is None
+
+
+def test_line_results_for_config_custom(magic):
+    config = magic()
+    config.LINE_RESULTS = LineRecording.FULL
+    config.LINE_RESULTS_SIZE = 5
+    config.LINE_RESULTS_SAMPLE_RATE = 2
+    config.LINE_RESULTS_OUTPUTS = True
+    results = LineResults.for_config(config)
+    assert (results.mode, results.size, results.sample_rate,
+            results._outputs) == (LineRecording.FULL, 5, 2, [])
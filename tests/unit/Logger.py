@@ -232,3 +232,49 @@ def test_logger_log_error_with_exc(patch, logger):
     patch.object(logger, 'frustum')
     logger.error('my-event', 'exc')
     logger.frustum.logger.error.assert_called_with('my-event', exc_info='exc')
+
+
+@mark.parametrize('method,level', [('info', 'info'), ('debug', 'debug'),
+                                   ('warn', 'warning')])
+def test_logger_lazy(patch, magic, logger, method, level):
+    patch.object(logger, 'frustum')
+    arg = magic()
+    arg.__str__.return_value = 'arg'
+
+    logger.frustum.logger.isEnabledFor.return_value = False
+    getattr(logger, method)('message {}', arg)
+    assert getattr(logger.frustum.logger, level).call_count == 0
+    assert arg.__str__.call_count == 0
+
+    logger.frustum.logger.isEnabledFor.return_value = True
+    getattr(logger, method)('message {}', arg)
+    getattr(logger.frustum.logger, level).assert_called_with('message arg')
+
+
+def test_logger_format():
+    assert Logger.format('{} and {}', ('a', 1)) == 'a and 1'
+    # Messages without arguments are taken as they are.
+    assert Logger.format('{not formatted}', ()) == '{not formatted}'
+
+
+def test_logger_sample_rate(patch, magic):
+    patch.init(Frustum)
+    assert Logger(magic(LOGGER_SAMPLE_RATE=3)).sample_rate == 3
+    assert Logger(magic(LOGGER_SAMPLE_RATE=0)).sample_rate == \
+        Config.LOGGER_SAMPLE_RATE
+
+
+def test_logger_debug_sampled(patch, logger):
+    patch.object(logger, 'frustum')
+    patch.object(logger, 'debug')
+    logger.sample_rate = 3
+    for i in range(7):
+        logger.debug_sampled('message {}', i)
+
+    assert [c[0] for c in logger.debug.call_args_list] == [
+        ('message {}', 0), ('message {}', 3), ('message {}', 6)]
+
+    logger.frustum.logger.isEnabledFor.return_value = False
+    logger.debug_sampled('message {}', 7)
+    assert logger.debug.call_count == 3
+    assert logger.sampled == 7
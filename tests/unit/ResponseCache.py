@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import time
+from unittest.mock import MagicMock
+
+from storyruntime import Metrics
+from storyruntime.AppConfig import AppConfig
+from storyruntime.ResponseCache import ResponseCache
+
+
+def key_for(url, body=None):
+    return 'alpine', 'echo', 'GET', url, body, ()
+
+
+def test_response_cache_for_config():
+    config = MagicMock()
+    config.HTTP_CACHE_SIZE = 10
+    assert ResponseCache.for_config(config, 'app').capacity == 10
+
+
+def test_response_cache_ttl_for():
+    plan = MagicMock(cache_ttl=10)
+    app = MagicMock(app_config=AppConfig({}))
+    assert ResponseCache.ttl_for(app, plan, 'alpine', 'echo') == 10
+
+    app.app_config = AppConfig({'runtime': {'http': {'cache': [
+        {'service': 'alpine', 'ttl': 60}]}}})
+    assert ResponseCache.ttl_for(app, plan, 'alpine', 'echo') == 60
+
+    app.app_config = None
+    plan.cache_ttl = None
+    assert ResponseCache.ttl_for(app, plan, 'alpine', 'echo') is None
+
+
+def test_response_cache_get_put(patch):
+    patch.object(Metrics, 'response_cache_hits')
+    patch.object(Metrics, 'response_cache_misses')
+    cache = ResponseCache('app', 100)
+    key = key_for('u', '{}')
+
+    assert cache.get(key) == (False, None)
+    output = {'a': [1]}
+    cache.put(key, output, 10, 60)
+    assert cache.size == 13
+    output['a'].append(2)
+
+    hit, value = cache.get(key)
+    assert hit is True
+    assert value == {'a': [1]}
+    value['a'].append(2)
+    assert cache.get(key) == (True, {'a': [1]})
+
+    Metrics.response_cache_hits.labels.assert_called_with(app_id='app')
+    Metrics.response_cache_misses.labels.assert_called_with(app_id='app')
+
+
+def test_response_cache_ttl(patch):
+    patch.object(time, 'monotonic', return_value=100)
+    cache = ResponseCache('app', 100)
+    key = key_for('u')
+    cache.put(key, 'a', 1, 10)
+    assert cache.get(key) == (True, 'a')
+
+    time.monotonic.return_value = 110
+    assert cache.get(key) == (False, None)
+    assert cache.size == 0
+
+
+def test_response_cache_evict(patch):
+    patch.object(Metrics, 'response_cache_evictions')
+    cache = ResponseCache('app', 10)
+    cache.put(key_for('a'), 'a', 4, 60)
+    cache.put(key_for('b'), 'b', 4, 60)
+    cache.get(key_for('a'))
+    cache.put(key_for('c'), 'c', 4, 60)
+    assert list(cache.entries) == [key_for('a'), key_for('c')]
+    assert cache.size == 10
+    Metrics.response_cache_evictions.labels.assert_called_once_with(
+        app_id='app')
+
+    # Outputs bigger than the whole cache aren't cached.
+    cache.put(key_for('d'), 'd', 100, 60)
+    assert key_for('d') not in cache.entries
+
+    cache.clear()
+    assert cache.size == 0
+    assert len(cache.entries) == 0
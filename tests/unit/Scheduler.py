@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from pytest import mark
+
+from storyruntime import Metrics
+from storyruntime.Config import Config
+from storyruntime.Scheduler import Scheduler
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
+
+
+def scheduler():
+    return Scheduler('app_id', {ExecutionEngine.LEXICON: 0.01,
+                                ExecutionEngine.CODEGEN: 0.05})
+
+
+def test_scheduler_due(patch):
+    patch.object(time, 'perf_counter', return_value=1)
+    s = scheduler()
+    assert s.time_slice == 0.01
+    assert s.due() is False
+
+    time.perf_counter.return_value = 1.01
+    assert s.due() is True
+
+    s.use(ExecutionEngine.CODEGEN)
+    assert s.due() is False
+
+    s.resume()
+    time.perf_counter.return_value = 1.05
+    assert s.due() is False
+
+
+@mark.parametrize('elapsed,overrun', [(0.01, False), (0.02, True)])
+@mark.asyncio
+async def test_scheduler_yield(patch, magic, async_mock, elapsed, overrun):
+    patch.object(time, 'perf_counter', return_value=1)
+    patch.object(asyncio, 'sleep', new=async_mock())
+    patch.object(Metrics, 'scheduler_yields', new=magic())
+    patch.object(Metrics, 'scheduler_overruns', new=magic())
+    s = scheduler()
+
+    time.perf_counter.return_value = 1 + elapsed
+    await s.yield_()
+
+    asyncio.sleep.mock.assert_called_once_with(0)
+    assert s.yields == 1
+    assert s.slice_start == 1 + elapsed
+    Metrics.scheduler_yields.labels.assert_called_with(app_id='app_id')
+    Metrics.scheduler_yields.labels.return_value.inc.assert_called_once()
+    if overrun:
+        assert s.overruns == 1
+        Metrics.scheduler_overruns.labels.return_value.inc \
+            .assert_called_once()
+    else:
+        assert s.overruns == 0
+        assert Metrics.scheduler_overruns.labels.call_count == 0
+
+
+def test_scheduler_for_config(magic):
+    config = magic(TIME_SLICE_LEXICON=0.1, TIME_SLICE_CODEGEN='fast')
+    s = Scheduler.for_config(config, 'app_id')
+    assert s.app_id == 'app_id'
+    assert s.time_slices == {ExecutionEngine.LEXICON: 0.1,
+                             ExecutionEngine.CODEGEN:
+                                 Config.TIME_SLICE_CODEGEN}
+    assert s.time_slice == 0.1
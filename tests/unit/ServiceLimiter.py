@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import mark
+
+from storyruntime.AppConfig import AppConfig, Limit
+from storyruntime.Exceptions import ServiceOverloadedError
+from storyruntime.ServiceLimiter import ServiceLimit, ServiceLimiter
+
+
+def limit_with(concurrency=1, queue=10, timeout=10, adaptive=False):
+    return ServiceLimit('app_id', 'alpine', Limit(
+        concurrency=concurrency, queue=queue, timeout=timeout,
+        adaptive=adaptive))
+
+
+def test_service_limiter_limit_for():
+    app_config = AppConfig({'runtime': {'http': {'limits': [
+        {'service': 'alpine', 'concurrency': 4}]}}})
+    limiter = ServiceLimiter('app_id', app_config)
+    limit = limiter.limit_for('alpine')
+    assert limit.capacity() == 4
+    assert limiter.limit_for('alpine') is limit
+    assert limiter.limit_for('python') is None
+    assert ServiceLimiter('app_id', None).limit_for('alpine') is None
+
+
+@mark.asyncio
+async def test_service_limit_run():
+    limit = limit_with(concurrency=2)
+    running = []
+    most = []
+
+    async def fetch():
+        running.append(1)
+        most.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return MagicMock(code=200)
+
+    await asyncio.gather(*[limit.run(fetch) for _ in range(6)])
+    assert max(most) == 2
+    assert limit.in_flight == 0
+    assert len(limit.waiters) == 0
+
+
+@mark.asyncio
+async def test_service_limit_queue_full():
+    limit = limit_with(queue=1)
+    await limit.acquire()
+    waiting = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(ServiceOverloadedError):
+        await limit.acquire()
+
+    limit.release_turn()
+    await waiting
+    assert limit.in_flight == 1
+
+
+@mark.asyncio
+async def test_service_limit_deadline():
+    limit = limit_with(timeout=0.01)
+    await limit.acquire()
+
+    with pytest.raises(ServiceOverloadedError):
+        await limit.acquire()
+
+    assert len(limit.waiters) == 0
+    limit.release_turn()
+    assert limit.in_flight == 0
+
+
+@mark.asyncio
+async def test_service_limit_cancelled():
+    limit = limit_with()
+    await limit.acquire()
+    waiting = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    assert len(limit.waiters) == 0
+    limit.release_turn()
+    assert limit.in_flight == 0
+
+
+def test_service_limit_adapt():
+    limit = limit_with(concurrency=10, adaptive=True)
+    limit.adapt(0.1, True)
+    assert limit.concurrency == 10
+
+    limit.adapt(1, True)
+    assert limit.concurrency == 9
+    limit.adapt(0.1, False)
+    assert limit.concurrency == 8.1
+    assert limit.capacity() == 8
+
+    limit.adapt(0.1, True)
+    assert limit.concurrency == pytest.approx(8.1 + 1 / 8.1)
+
+    for _ in range(100):
+        limit.adapt(0.1, False)
+    assert limit.capacity() == 1
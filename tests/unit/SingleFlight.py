@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import mark
+
+from storyruntime import Metrics
+from storyruntime.SingleFlight import SingleFlight
+
+
+def test_single_flight_key_for():
+    a = SingleFlight.key_for('alpine', 'echo', 'http://alpine/echo', {
+        'method': 'POST', 'body': '{}', 'headers': {'a': '1', 'b': '2'}})
+    b = SingleFlight.key_for('alpine', 'echo', 'http://alpine/echo', {
+        'method': 'POST', 'body': '{}', 'headers': {'b': '2', 'a': '1'}})
+    assert a == b
+    assert SingleFlight.key_for('alpine', 'echo', 'http://alpine/echo', {
+        'method': 'POST', 'body': '{"a": 1}', 'headers': {}}) != a
+    assert SingleFlight.key_for('alpine', 'echo', 'http://alpine/echo', {
+        'method': 'POST', 'body_producer': MagicMock()}) is None
+
+
+@mark.asyncio
+async def test_single_flight_call(patch):
+    patch.object(Metrics.http_coalesced, 'labels')
+    flights = SingleFlight('app_id')
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return 'res'
+
+    rets = await asyncio.gather(flights.call('key', 'alpine', fetch),
+                                flights.call('key', 'alpine', fetch),
+                                flights.call('other', 'alpine', fetch))
+    assert rets == ['res'] * 3
+    assert len(calls) == 2
+    assert flights.flights == {}
+    Metrics.http_coalesced.labels.assert_called_once_with(
+        app_id='app_id', service='alpine')
+
+    assert await flights.call('key', 'alpine', fetch) == 'res'
+    assert len(calls) == 3
+
+
+@mark.asyncio
+async def test_single_flight_call_error():
+    flights = SingleFlight('app_id')
+
+    async def fetch():
+        await asyncio.sleep(0)
+        raise ValueError()
+
+    results = await asyncio.gather(flights.call('key', 'alpine', fetch),
+                                   flights.call('key', 'alpine', fetch),
+                                   return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    with pytest.raises(ValueError):
+        await flights.call('key', 'alpine', fetch)
@@ -5,8 +5,14 @@ import time
 import pytest
 from pytest import mark
 
+from storyruntime.Context import ChildContext, Context
 from storyruntime.Exceptions import StackOverflowException
+from storyruntime.LineResults import LineResults
+from storyruntime.Scheduler import Scheduler
 from storyruntime.Story import MAX_BYTES_LOGGING, Story
+from storyruntime.compiler import StoryCompiler
+from storyruntime.enums.LineRecording import LineRecording
+from storyruntime.enums.ResolverMode import ResolverMode
 from storyruntime.utils import Dict, Resolver
 
 
@@ -16,7 +22,10 @@ def test_story_init(app, logger, story):
     assert story.name == 'hello.story'
     assert story.logger == logger
     assert story.execution_id is not None
+    assert isinstance(story.results, LineResults)
     assert story.results == {}
+    assert isinstance(story.scheduler, Scheduler)
+    assert story.scheduler.app_id == app.app_id
 
 
 def test_new_frame(story):
@@ -52,6 +61,23 @@ def test_new_frame_for_no_overflow(story):
         assert len(current_stack) == Story.MAX_FRAMES_IN_STACK
 
 
+def test_story_max_frames(app, logger):
+    assert Story(app, 'hello.story', logger).max_frames == \
+        Story.MAX_FRAMES_IN_STACK
+    app.config.MAX_FRAMES_IN_STACK = 1000
+    story = Story(app, 'hello.story', logger)
+    assert story.max_frames == 1000
+
+    story.max_frames = 2
+    story.push_frame('1')
+    story.push_frame('2')
+    with pytest.raises(StackOverflowException):
+        story.push_frame('3')
+
+    story.pop_frame()
+    assert story.get_stack() == ['1']
+
+
 def test_new_frame_stack_does_not_unwind_on_exception(story):
     try:
         with story.new_frame('10'):
@@ -119,6 +145,25 @@ def test_story_resolve(patch, story, encode):
     story.resolve(obj, encode)
     Resolver.resolve.assert_called_with(obj, story.context)
     assert Story.encode.call_count == encode
+    story.logger.debug_sampled.assert_called_once()
+    assert story.logger.info.call_count == 0
+
+
+def test_story_evaluate_compiled(patch, story):
+    patch.object(Resolver, 'resolve')
+    story.tree = StoryCompiler.compile({
+        '1': {
+            'ln': '1', 'method': 'set',
+            'args': [{'$OBJECT': 'path', 'paths': ['a']}]
+        }
+    }, ResolverMode.COMPILER)
+    story.context = {'a': 'b'}
+    assert story.evaluate(story.tree['1']['args'][0]) == 'b'
+    assert Resolver.resolve.call_count == 0
+
+    obj = {'$OBJECT': 'path', 'paths': ['a']}
+    story.evaluate(obj)
+    Resolver.resolve.assert_called_with(obj, story.context)
 
 
 def test_command_arguments_list(patch, story):
@@ -141,64 +186,36 @@ def test_command_arguments_list_none(patch, story):
 
 
 def test_story_start_line(patch, story):
-    patch.object(time, 'time')
+    patch.object(LineResults, 'start')
     story.start_line('1')
-    assert story.results['1'] == {'start': time.time()}
+    LineResults.start.assert_called_with('1')
 
 
 def test_story_end_line(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
+    patch.object(LineResults, 'end')
+    patch.object(Story, 'set_variable')
     story.end_line('1')
-    assert story.results['1']['output'] is None
-    assert story.results['1']['end'] == time.time()
-    assert story.results['1']['start'] == 'start'
+    LineResults.end.assert_called_with('1', None)
+    assert Story.set_variable.call_count == 0
 
 
-def test_story_end_line_output(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
-    story.end_line('1', output='output')
-    assert story.results['1']['output'] == 'output'
+@mark.parametrize('output', [None, 'output', ['a', 'b'], '{"key":"value"}',
+                             '   foobar\n\t', b'output'])
+def test_story_end_line_output(patch, story, output):
+    patch.object(time, 'time', return_value=2)
+    story.results = LineResults(LineRecording.FULL, outputs=True)
+    story.results.start('1')
+    story.end_line('1', output=output)
+    assert story.results['1'] == {'start': 2, 'end': 2, 'output': output}
 
 
 def test_story_end_line_output_assign(patch, story):
     patch.object(Dict, 'set')
-    story.results = {'1': {'start': 'start'}}
     assign = {'paths': ['x']}
     story.end_line('1', output='output', assign=assign)
-    assert story.results['1']['output'] == 'output'
     Dict.set.assert_called_with(story.context, assign['paths'], 'output')
 
 
-def test_story_end_line_output_as_list(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
-    story.end_line('1', output=['a', 'b'])
-    assert story.results['1']['output'] == ['a', 'b']
-
-
-def test_story_end_line_output_as_json_no_auto_convert(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
-    story.end_line('1', output='{"key":"value"}')
-    assert story.results['1']['output'] == '{"key":"value"}'
-
-
-def test_story_end_line_output_as_sting(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
-    story.end_line('1', output='   foobar\n\t')
-    assert story.results['1']['output'] == '   foobar\n\t'
-
-
-def test_story_end_line_output_as_bytes(patch, story):
-    patch.object(time, 'time')
-    story.results = {'1': {'start': 'start'}}
-    story.end_line('1', output=b'output')
-    assert story.results['1']['output'] == b'output'
-
-
 @mark.parametrize('input,output', [
     (None, 'null'),
     (False, 'false'),
@@ -250,6 +267,40 @@ def test_story_prepare_context(story, app):
     assert story.context == context
 
 
+def test_story_fork(story):
+    story.set_context({})
+    story.get_stack().append('1')
+    context = ChildContext(story.context)
+    fork = story.fork(context)
+    assert fork.context is context
+    assert fork.get_stack() == ['1']
+    assert fork.get_stack() is not story.get_stack()
+    assert fork.tree is story.tree
+    assert fork.results is story.results
+    assert fork.scheduler is story.scheduler
+
+
+def test_story_set_context(story, app):
+    app.app_context = {'hostname': 'foo'}
+    context = {}
+    story.set_context(context)
+    assert isinstance(story.context, Context)
+    assert context == {}
+
+    story.context['a'] = 1
+    assert story.context['app'] == {'hostname': 'foo'}
+    assert story.context['app'] is not app.app_context
+    assert context == {'a': 1, 'app': {'hostname': 'foo'}}
+
+
+def test_story_set_context_restore(story):
+    story.set_context({'a': 1})
+    current = story.context
+    story.set_context({})
+    story.set_context(current)
+    assert story.context is current
+
+
 def test_story_next_block_simple(patch, story):
     story.tree = {
         '2': {'ln': '2', 'enter': '3', 'next': '3'},
@@ -391,3 +442,24 @@ def test_story_next_block_nested_inner(patch, story):
     assert isinstance(story, Story)
 
     assert story.tree['7'] == story.next_block(story.line('4'))
+
+
+def test_story_argument_by_name_compiled(patch, story):
+    compiled = StoryCompiler.compile({
+        '1': {
+            'ln': '1',
+            'args': [
+                {
+                    '$OBJECT': 'argument',
+                    'name': 'foo',
+                    'argument': {'$OBJECT': 'string', 'string': 'bar'}
+                }
+            ]
+        }
+    })
+
+    patch.object(story, 'resolve')
+    story.argument_by_name(compiled['1'], 'foo')
+    story.resolve.assert_called_with({'$OBJECT': 'string', 'string': 'bar'},
+                                     encode=False)
+    assert story.argument_by_name(compiled['1'], 'missing') is None
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import fixture, mark
+
+from storyruntime.ContainerRegistry import ContainerRegistry
+from storyruntime.Exceptions import StoryscriptError
+from storyruntime.HttpTransport import HttpTransport
+from storyruntime.Kubernetes import Kubernetes
+from storyruntime.Synapse import PendingSubscription, SubscriptionBatch, \
+    SubscriptionRegistry, Synapse
+from storyruntime.Types import StreamingService
+from storyruntime.db.Database import Database
+
+from tornado.httpclient import HTTPError
+
+
+class FakeSynapse:
+    """
+    Stands in for the Synapse: keeps the subscriptions it's sent, like
+    the Synapse does, and fails those of the pods in failing.
+    """
+
+    def __init__(self, *failing):
+        self.failing = set(failing)
+        self.subscriptions = {}
+        self.requests = []
+
+    async def fetch(self, url, **kwargs):
+        path = url.rsplit('/', 1)[1]
+        self.requests.append(path)
+        payload = json.loads(kwargs['body'])
+        if path == 'clear_all':
+            self.subscriptions.clear()
+            return MagicMock(code=200)
+
+        if path == 'unsubscribe_bulk':
+            for sub_id in payload['sub_ids']:
+                self.subscriptions.pop(sub_id)
+            return MagicMock(code=200)
+
+        if path == 'subscribe_bulk':
+            bodies = payload['subscriptions']
+        else:
+            bodies = [payload]
+
+        if any(body['pod_name'] in self.failing for body in bodies):
+            return MagicMock(code=500)
+
+        for body in bodies:
+            self.subscriptions[body['sub_id']] = body
+        return MagicMock(code=204)
+
+
+def config_with(bulk):
+    config = MagicMock()
+    config.ASYNCY_SYNAPSE_HOST = 'synapse'
+    config.ASYNCY_SYNAPSE_PORT = 80
+    config.SYNAPSE_BULK_SUBSCRIBE = bulk
+    return config
+
+
+def body_for(sub_id, pod_name='alpine-1', foo=b'bar'):
+    return {'sub_id': sub_id, 'sub_method': 'POST', 'pod_name': pod_name,
+            'sub_body': {'data': {'foo': foo}, 'id': sub_id}}
+
+
+def story_named(name):
+    story = MagicMock()
+    story.name = name
+    return story
+
+
+def pending_for(sub_id, pod_name='alpine-1', foo=b'bar', ln='1',
+                story_name='a.story', event='updates'):
+    service = StreamingService('alpine', 'echo', pod_name, 'alpine.com')
+    return PendingSubscription(story=story_named(story_name),
+                               line={'ln': ln}, streaming_service=service,
+                               event=event,
+                               body=body_for(sub_id, pod_name, foo))
+
+
+def app_for(logger, bulk, *started):
+    app = MagicMock(logger=logger, config=config_with(bulk),
+                    app_id='app_id')
+    app.containers = ContainerRegistry()
+    for container_name in started:
+        app.containers.started(container_name, 'alpine.com')
+    return app
+
+
+@fixture
+def registry(patch, async_mock):
+    """
+    Stands in for the app_subscriptions table of Postgres.
+    """
+    registry = {}
+
+    def set_subscriptions(config, app_id, subscriptions):
+        registry.clear()
+        registry.update(json.loads(Synapse.dumps(subscriptions)))
+
+    patch.object(Database, 'get_subscriptions',
+                 new=async_mock(side_effect=lambda *args: dict(registry)))
+    patch.object(Database, 'set_subscriptions',
+                 new=async_mock(side_effect=set_subscriptions))
+    return registry
+
+
+@mark.asyncio
+@mark.parametrize('bulk,requests', [
+    (False, ['subscribe', 'subscribe']),
+    (True, ['subscribe_bulk'])
+])
+async def test_synapse_subscribe_all(patch, logger, bulk, requests):
+    synapse = FakeSynapse()
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    oks = await Synapse.subscribe_all(logger, config_with(bulk), 'app_id',
+                                      [body_for('a'), body_for('b')])
+    assert oks == [True, True]
+    assert synapse.requests == requests
+    assert list(synapse.subscriptions) == ['a', 'b']
+    assert synapse.subscriptions['a']['sub_body']['data']['foo'] == 'YmFy'
+
+    HttpTransport.control.assert_called_with(
+        f'http://synapse:80/{requests[0]}')
+
+
+@mark.asyncio
+async def test_synapse_subscribe_all_error(patch, logger, async_mock):
+    def subscribe(logger, config, body):
+        if body['sub_id'] == 'a':
+            raise HTTPError(500)
+        return MagicMock(code=204)
+
+    patch.object(Synapse, 'subscribe', new=async_mock(side_effect=subscribe))
+    oks = await Synapse.subscribe_all(logger, config_with(False), 'app_id',
+                                      [body_for('a'), body_for('b')])
+    assert oks == [False, True]
+    assert Synapse.subscribe.mock.call_count == 2
+    logger.error.assert_called_once()
+
+
+@mark.asyncio
+async def test_synapse_unsubscribe_all(patch, logger):
+    synapse = FakeSynapse()
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    config = config_with(True)
+    await Synapse.subscribe_all(logger, config, 'app_id',
+                                [body_for('a'), body_for('b')])
+
+    assert await Synapse.unsubscribe_all(logger, config, 'app_id', []) is True
+    assert await Synapse.unsubscribe_all(logger, config, 'app_id',
+                                         ['a']) is True
+    assert synapse.requests == ['subscribe_bulk', 'unsubscribe_bulk']
+    assert list(synapse.subscriptions) == ['b']
+
+    assert await Synapse.clear_all(logger, config, 'app_id') is True
+    assert synapse.subscriptions == {}
+
+
+def test_subscription_registry_fingerprint():
+    fingerprint = SubscriptionRegistry.fingerprint(pending_for('a'))
+    # Container names change with every release of the app.
+    assert SubscriptionRegistry.fingerprint(
+        pending_for('b', pod_name='alpine-2')) == fingerprint
+    assert SubscriptionRegistry.fingerprint(
+        pending_for('a', foo=b'baz')) != fingerprint
+    assert SubscriptionRegistry.fingerprint(
+        pending_for('a', ln='2')) != fingerprint
+    assert SubscriptionRegistry.fingerprint(
+        pending_for('a', story_name='b.story')) != fingerprint
+    assert SubscriptionRegistry.fingerprint(
+        pending_for('a', event='deletes')) != fingerprint
+
+
+@mark.asyncio
+async def test_synapse_subscribe_all_empty(logger):
+    assert await Synapse.subscribe_all(logger, config_with(True),
+                                       'app_id', []) == []
+
+
+@mark.asyncio
+@mark.parametrize('bulk,subscribed,failed', [
+    (False, ['a'], '2'),
+    (True, [], '1')
+])
+async def test_subscription_batch_flush(patch, logger, registry, bulk,
+                                        subscribed, failed):
+    synapse = FakeSynapse('alpine-2')
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    app = app_for(logger, bulk)
+    app.subscription_batch = SubscriptionBatch()
+
+    first = StreamingService('alpine', 'echo', 'alpine-1', 'alpine.com')
+    second = StreamingService('alpine', 'echo', 'alpine-2', 'alpine.com')
+    story = story_named('a.story')
+    app.subscription_batch.add(story, {'ln': '1'}, first, 'updates',
+                               body_for('a'))
+    app.subscription_batch.add(story, {'ln': '2'}, second, 'updates',
+                               body_for('b', 'alpine-2'))
+
+    with pytest.raises(StoryscriptError) as e:
+        await app.subscription_batch.flush(app)
+
+    assert e.value.line == {'ln': failed}
+    assert list(synapse.subscriptions) == subscribed
+    assert app.add_subscription.call_count == len(subscribed)
+    assert app.subscription_batch.pending == []
+    assert list(registry) == []
+
+
+@mark.asyncio
+async def test_subscription_batch_flush_diff(patch, logger, registry,
+                                             async_mock):
+    synapse = FakeSynapse()
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    container_ids = {'alpine-1': 'docker://1'}
+    patch.object(Kubernetes, 'get_container_id', new=async_mock(
+        side_effect=lambda app, name: container_ids.get(name)))
+    service = StreamingService('alpine', 'echo', 'alpine-1', 'alpine.com')
+    story = story_named('a.story')
+
+    async def deploy(*bodies):
+        app = app_for(logger, True, 'alpine-1')
+        batch = SubscriptionBatch()
+        for ln, body in enumerate(bodies):
+            batch.add(story, {'ln': str(ln)}, service, 'updates', body)
+        synapse.requests = []
+        await batch.flush(app)
+        return app
+
+    await deploy(body_for('a'), body_for('b', foo=b'baz'))
+    assert synapse.requests == ['clear_all', 'subscribe_bulk']
+    assert list(synapse.subscriptions) == ['a', 'b']
+    assert len(registry) == 2
+    assert set(sub['container_id'] for sub in registry.values()) == \
+        {'docker://1'}
+
+    # Deployed again, and its container was reused: a is the same but for
+    # its id, and b changed.
+    app = await deploy(body_for('c'), body_for('d', foo=b'qux'))
+    assert synapse.requests == ['unsubscribe_bulk', 'subscribe_bulk']
+    assert list(synapse.subscriptions) == ['a', 'd']
+    assert [c[0][0] for c in app.add_subscription.call_args_list] == \
+        ['a', 'd']
+    assert sorted(sub['body']['sub_id'] for sub in registry.values()) == \
+        ['a', 'd']
+
+    # Its container was recreated, so nothing survived.
+    container_ids['alpine-1'] = 'docker://2'
+    await deploy(body_for('e'), body_for('f', foo=b'qux'))
+    assert synapse.requests == ['unsubscribe_bulk', 'subscribe_bulk']
+    assert list(synapse.subscriptions) == ['e', 'f']
+
+    await deploy(body_for('g'), body_for('h', foo=b'qux'))
+    assert synapse.requests == []
+    assert list(synapse.subscriptions) == ['e', 'f']
+
+
+@mark.asyncio
+async def test_subscription_registry_container_ids(patch, logger,
+                                                   async_mock):
+    patch.object(Kubernetes, 'get_container_id',
+                 new=async_mock(return_value='docker://1'))
+    app = app_for(logger, True, 'alpine-1')
+    container_ids = await SubscriptionRegistry.container_ids(app, [
+        pending_for('a'), pending_for('b'),
+        pending_for('c', pod_name='gateway')
+    ])
+    # The app didn't start the gateway.
+    assert container_ids == {'alpine-1': 'docker://1'}
+    Kubernetes.get_container_id.mock.assert_called_once_with(app, 'alpine-1')
+
+
+@mark.asyncio
+async def test_subscription_registry_unsubscribe(patch, logger, registry):
+    synapse = FakeSynapse()
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    app = app_for(logger, True)
+    synapse.subscriptions['a'] = body_for('a')
+    synapse.subscriptions['b'] = body_for('b')
+    registry['fingerprint'] = {'body': body_for('a'), 'container_id': None}
+    await SubscriptionRegistry.unsubscribe(app, ['a'])
+    assert list(synapse.subscriptions) == ['b'] and registry == {}
+
+
+@mark.asyncio
+async def test_subscription_registry_drop(patch, logger, registry):
+    synapse = FakeSynapse()
+    patch.object(HttpTransport, 'control', return_value=synapse)
+    synapse.subscriptions['a'] = body_for('a')
+    registry['fingerprint'] = {'body': body_for('a'), 'container_id': None}
+    await SubscriptionRegistry.drop(logger, config_with(True), 'app_id')
+    assert synapse.subscriptions == {} and registry == {}
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import re
+
+import pytest
+from pytest import mark
+
+from storyruntime.Exceptions import ResolverMismatchError, \
+    StoryscriptRuntimeError
+from storyruntime.compiler import ExpressionCompiler
+from storyruntime.utils import Resolver
+
+# Note: The compiled expressions of all the stories in integration/Lexicon
+# are verified against the Resolver too (see ResolverMode.DIFFERENTIAL).
+
+
+def path(*paths):
+    return {'$OBJECT': 'path', 'paths': list(paths)}
+
+
+def expression(operator, *values):
+    return {'$OBJECT': 'expression', 'expression': operator,
+            'values': list(values)}
+
+
+def integer(value):
+    return {'$OBJECT': 'int', 'int': value}
+
+
+@mark.parametrize('item', [
+    'literal',
+    None,
+    [path('a'), {'$OBJECT': 'string', 'string': 'b'}],
+    {'$OBJECT': 'string', 'string': '{} {}', 'values': [path('a'), 1]},
+    path('b', {'$OBJECT': 'dot', 'dot': 'c'}, integer(1)),
+    path('b', {'$OBJECT': 'dot', 'dot': 'c'},
+         {'$OBJECT': 'range', 'range': {'start': integer(1)}}),
+    expression('sum', path('a'), integer(1), 'x'),
+    expression('sum', integer(1), {'$OBJECT': 'float', 'float': 1.5}),
+    expression('and', {'$OBJECT': 'boolean', 'boolean': True}, path('t')),
+    expression('or', integer(1), path('t')),
+    expression('not', path('a')),
+    expression('less_equal', path('n'), integer(2)),
+    expression('division', path('n'), integer(2)),
+    {'$OBJECT': 'list', 'items': [path('a'), integer(2)]},
+    {'$OBJECT': 'dict', 'items': [[path('a'), integer(2)]]},
+    {'key': path('n'), 'nested': {'$OBJECT': 'value', 'value': 'v'}}
+])
+def test_compile(item):
+    data = {
+        'a': 'a',
+        'b': {'c': [1, 2, 3]},
+        'n': 3,
+        't': True
+    }
+    expected = Resolver.resolve(item, data)
+    actual = ExpressionCompiler.compile(item)(data)
+    assert ExpressionCompiler.same(expected, actual)
+
+
+@mark.parametrize('item', [
+    path('missing'),
+    path('b', integer(10)),
+    path('b', {'$OBJECT': 'string', 'string': 'missing'}),
+    expression('subtraction', path('a'), integer(1)),
+    expression('unknown', path('a'), integer(1))
+])
+def test_compile_errors(item):
+    data = {'a': 'a', 'b': {'c': 1}}
+    with pytest.raises(Exception) as expected:
+        Resolver.resolve(item, data)
+
+    fn = ExpressionCompiler.compile(item)
+    with pytest.raises(expected.type) as actual:
+        fn(data)
+
+    assert str(actual.value) == str(expected.value)
+
+
+def test_compile_path_out_of_bounds():
+    fn = ExpressionCompiler.compile(path('a', integer(3)))
+    with pytest.raises(StoryscriptRuntimeError):
+        fn({'a': [0]})
+
+
+def test_compile_folds_constants():
+    fn = ExpressionCompiler.compile(expression(
+        'multiplication', integer(2),
+        expression('sum', integer(1), integer(2))))
+    assert fn.constant == 6
+    assert fn({}) == 6
+
+
+def test_compile_does_not_fold_variables():
+    fn = ExpressionCompiler.compile(expression('sum', path('a'), integer(1)))
+    assert not hasattr(fn, 'constant')
+    assert fn({'a': 1}) == 2
+    assert fn({'a': 2}) == 3
+
+
+def test_compile_does_not_fold_mutable_values():
+    fn = ExpressionCompiler.compile(
+        {'$OBJECT': 'list', 'items': [integer(1)]})
+    assert not hasattr(fn, 'constant')
+    assert fn({}) is not fn({})
+
+
+def test_compile_regexp_once():
+    fn = ExpressionCompiler.compile({'$OBJECT': 'regexp', 'regexp': 'a+'})
+    assert fn({}) == re.compile('a+')
+    assert fn({}) is fn({})
+
+
+def test_differential():
+    item = expression('sum', path('a'), integer(1))
+    fn = ExpressionCompiler.differential(item)
+    assert fn({'a': 1}) == 2
+
+
+def test_differential_same_error():
+    item = path('a', {'$OBJECT': 'string', 'string': 'b'})
+    fn = ExpressionCompiler.differential(item)
+    with pytest.raises(StoryscriptRuntimeError) as e:
+        fn({'a': {}})
+
+    assert type(e.value) is StoryscriptRuntimeError
+
+
+def test_differential_mismatch():
+    item = path('a')
+    fn = ExpressionCompiler.differential(item, lambda data: 1.0)
+    with pytest.raises(ResolverMismatchError):
+        fn({'a': 1})
+
+
+def test_differential_mismatch_error():
+    item = path('a')
+
+    def fails(data):
+        raise KeyError('a')
+
+    with pytest.raises(ResolverMismatchError):
+        ExpressionCompiler.differential(item, fails)({'a': 1})
+
+
+@mark.parametrize('a,b,same', [
+    (1, 1, True),
+    (1, 1.0, False),
+    (1, True, False),
+    ([1, {'a': 1}], [1, {'a': 1}], True),
+    ([1, {'a': 1}], [1, {'a': True}], False),
+    ({'a': 1}, {'b': 1}, False),
+    (float('nan'), float('nan'), True)
+])
+def test_same(a, b, same):
+    assert ExpressionCompiler.same(a, b) is same
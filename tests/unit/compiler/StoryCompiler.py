@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pytest import mark
+
+from storyruntime.Exceptions import ResolverMismatchError
+from storyruntime.compiler import CompiledTree, ExpressionCompiler, Line, \
+    Node, StoryCompiler
+from storyruntime.enums.ResolverMode import ResolverMode
+
+
+def tree():
+    return {
+        '1': {
+            'ln': '1', 'method': 'for', 'enter': '2', 'next': '2',
+            'output': ['item'],
+            'args': [{'$OBJECT': 'path', 'paths': ['items']}]
+        },
+        '2': {
+            'ln': '2', 'method': 'mutation', 'parent': '1', 'next': '3',
+            'name': ['a'],
+            'args': [
+                {'$OBJECT': 'path', 'paths': ['a']},
+                {
+                    '$OBJECT': 'mutation', 'mutation': 'append',
+                    'args': [{
+                        '$OBJECT': 'arg', 'name': 'item',
+                        'arg': {'$OBJECT': 'path', 'paths': ['item']}
+                    }]
+                }
+            ]
+        },
+        '3': {
+            'ln': '3', 'method': 'execute', 'service': 'alpine',
+            'command': 'echo',
+            'args': [
+                {
+                    '$OBJECT': 'argument', 'name': 'msg',
+                    'argument': {'$OBJECT': 'string', 'string': 'first'}
+                },
+                {
+                    '$OBJECT': 'argument', 'name': 'msg',
+                    'argument': {'$OBJECT': 'string', 'string': 'second'}
+                }
+            ]
+        }
+    }
+
+
+def test_compile():
+    raw = tree()
+    compiled = StoryCompiler.compile(raw)
+
+    assert isinstance(compiled, CompiledTree)
+    assert compiled == raw
+    assert [line['ln'] for line in compiled.lines] == ['1', '2', '3']
+
+    for index, line in enumerate(compiled.lines):
+        assert isinstance(line, Line)
+        assert line.index == index
+        assert compiled[line['ln']] is line
+        assert compiled.line_at(index) is line
+
+    assert compiled['1'].handler == 'for_loop'
+    assert compiled['1'].next_index == 1
+    assert compiled['1'].enter_index == 1
+    assert compiled['1'].parent_index is None
+    assert compiled['1'].sync_handler is None
+    assert compiled['2'].handler == 'set'
+    assert compiled['2'].sync_handler == 'set_sync'
+    assert compiled['2'].parent_index == 0
+    assert compiled['3'].handler == 'execute'
+    assert compiled['3'].sync_handler is None
+    assert compiled['3'].next_index is None
+    assert compiled.line_at(None) is None
+
+
+def test_compile_arguments():
+    compiled = StoryCompiler.compile(tree())
+
+    # The first argument with a given name wins.
+    assert compiled['3'].arguments == {
+        'msg': {'$OBJECT': 'string', 'string': 'first'}
+    }
+
+    mutation = compiled['2']['args'][1]
+    assert isinstance(mutation, Node)
+    assert mutation.arguments == {
+        'item': {'$OBJECT': 'path', 'paths': ['item']}
+    }
+
+    # Values handed to the Resolver must stay plain dicts.
+    assert type(compiled['2']['args'][0]) is dict
+
+
+def test_compile_does_not_modify_tree():
+    raw = tree()
+    StoryCompiler.compile(raw)
+    assert raw == tree()
+    assert not isinstance(raw['2']['args'][1], Node)
+
+
+def test_compile_unknown_method():
+    compiled = StoryCompiler.compile({'1': {'ln': '1', 'method': 'foo'}})
+    assert compiled['1'].handler is None
+
+
+def test_compile_interpreter():
+    compiled = StoryCompiler.compile(tree())
+    assert compiled.expressions == {}
+
+
+@mark.parametrize('resolver_mode', [
+    ResolverMode.COMPILER, ResolverMode.DIFFERENTIAL
+])
+def test_compile_expressions(resolver_mode):
+    compiled = StoryCompiler.compile(tree(), resolver_mode)
+
+    items = compiled['1']['args'] + \
+        [compiled['2']['args'][0],
+         compiled['2']['args'][1].arguments['item'],
+         compiled['3'].arguments['msg']]
+    for item in items:
+        assert compiled.expression_for(item) is not None
+
+    # Equal, but not the same value.
+    assert compiled.expression_for({'$OBJECT': 'path',
+                                    'paths': ['items']}) is None
+    # The arguments themselves are resolved by their name.
+    assert compiled.expression_for(compiled['3']['args'][0]) is None
+
+    fn = compiled.expression_for(compiled['1']['args'][0])
+    assert fn({'items': [1]}) == [1]
+
+
+def test_compile_expressions_differential(patch):
+    patch.object(ExpressionCompiler, 'compile',
+                 return_value=lambda data: 'wrong')
+    compiled = StoryCompiler.compile(tree(), ResolverMode.DIFFERENTIAL)
+    fn = compiled.expression_for(compiled['1']['args'][0])
+    with pytest.raises(ResolverMismatchError):
+        fn({'items': [1]})
+
+
+def test_compile_expressions_malformed():
+    compiled = StoryCompiler.compile({
+        '1': {
+            'ln': '1', 'method': 'set',
+            'args': [{'$OBJECT': 'expression', 'expression': 'less',
+                      'values': []}]
+        }
+    }, ResolverMode.COMPILER)
+    assert compiled.expressions == {}
+
+
+def test_compile_stories():
+    compiled = StoryCompiler.compile_stories({
+        'a.story': {'tree': tree(), 'entrypoint': '1'}
+    })
+    assert list(compiled.keys()) == ['a.story']
+    assert isinstance(compiled['a.story'], CompiledTree)
+
+
+def test_tree_for_precompiled(magic):
+    app = magic()
+    compiled = StoryCompiler.compile(tree())
+    app.compiled_stories = {'a.story': compiled}
+    assert StoryCompiler.tree_for(app, 'a.story') is compiled
+
+
+def test_tree_for_on_demand(magic):
+    app = magic()
+    app.config.RESOLVER_MODE = ResolverMode.INTERPRETER
+    app.stories = {'a.story': {'tree': tree()}}
+    app.compiled_stories = {}
+    compiled = StoryCompiler.tree_for(app, 'a.story')
+    assert isinstance(compiled, CompiledTree)
+    assert compiled == tree()
+    assert app.compiled_stories == {'a.story': compiled}
+    assert StoryCompiler.tree_for(app, 'a.story') is compiled
+
+
+def nested_tree():
+    return {
+        '1': {'ln': '1', 'method': 'function', 'enter': '2', 'next': '2'},
+        '2': {'ln': '2', 'method': 'for', 'parent': '1', 'enter': '3',
+              'next': '3'},
+        '3': {'ln': '3', 'method': 'if', 'parent': '2', 'enter': '4',
+              'next': '4'},
+        '4': {'ln': '4', 'method': 'break', 'parent': '3', 'next': '5'},
+        '5': {'ln': '5', 'method': 'else', 'parent': '2', 'enter': '6',
+              'next': '6'},
+        '6': {'ln': '6', 'method': 'set', 'parent': '5', 'next': '7'},
+        '7': {'ln': '7', 'method': 'return', 'parent': '1', 'next': '8'},
+        '8': {'ln': '8', 'method': 'set', 'next': '9'},
+        '9': {'ln': '9', 'method': 'while', 'enter': '10', 'next': '10'},
+        '10': {'ln': '10', 'method': 'continue', 'parent': '9'}
+    }
+
+
+def test_compile_hierarchy():
+    compiled = StoryCompiler.compile(nested_tree())
+
+    assert compiled['1'].ancestors == frozenset()
+    assert compiled['6'].ancestors == {'1', '2', '5'}
+    assert compiled['6'].enclosing == {'function': '1', 'for': '2',
+                                       'else': '5'}
+    assert compiled['4'].enclosing == {'function': '1', 'for': '2',
+                                       'if': '3'}
+    assert compiled['10'].enclosing == {'while': '9'}
+
+
+def test_compile_block_exit():
+    compiled = StoryCompiler.compile(nested_tree())
+
+    assert compiled['1'].block_exit is compiled['8']
+    assert compiled['2'].block_exit is compiled['7']
+    assert compiled['3'].block_exit is compiled['5']
+    assert compiled['5'].block_exit is compiled['7']
+    assert compiled['8'].block_exit is compiled['9']
+    assert compiled['9'].block_exit is None
+    assert compiled['10'].block_exit is None
+
+
+def test_compile_block_index_matches_story(story):
+    """
+    The precomputed index must agree with walking the raw tree.
+    """
+    raw = nested_tree()
+    compiled = StoryCompiler.compile(raw)
+
+    story.tree = raw
+    for ln, line in raw.items():
+        expected = story.next_block(line)
+        actual = compiled[ln].block_exit
+        assert (expected and expected['ln']) == (actual and actual['ln'])
+
+        for parent in raw.keys():
+            assert story.line_has_parent(parent, line) == \
+                story.line_has_parent(parent, compiled[ln])
+
+
+def execute(ln, service, reads=(), output=None, enter=None):
+    line = {
+        'ln': ln, 'method': 'execute', 'service': service,
+        'command': 'get', 'next': str(int(ln) + 1),
+        'args': [{'$OBJECT': 'arg', 'name': 'a',
+                  'arg': {'$OBJECT': 'path', 'paths': [r]}}
+                 for r in reads]
+    }
+    if output is not None:
+        line['name'] = [output]
+        line['output'] = [output]
+
+    if enter is not None:
+        line['enter'] = enter
+
+    return line
+
+
+def test_compile_dataflow():
+    compiled = StoryCompiler.compile({
+        '1': execute('1', 'a', reads=['x'], output='r1'),
+        '2': execute('2', 'b', reads=['x'], output='r2'),
+        '3': execute('3', 'c', reads=['y'], output='r3'),
+        # Reads what 1 wrote.
+        '4': execute('4', 'd', reads=['r1'], output='r4'),
+        # Calls the same service as 4.
+        '5': execute('5', 'd', output='r5'),
+        '6': {'ln': '6', 'method': 'set', 'name': ['y'], 'next': '7'},
+        '7': execute('7', 'a', output='r7'),
+        # Writes what 7 wrote.
+        '8': execute('8', 'b', output='r7'),
+        '9': execute('9', 'c', reads=['r10']),
+        # Writes what 9 read.
+        '10': execute('10', 'd', output='r10'),
+        '11': execute('11', 'e'),
+        # A streaming service.
+        '12': execute('12', 'f', enter='13'),
+        '13': execute('13', 'g')
+    })
+
+    assert compiled['1'].independent == ('1', '2', '3')
+    assert compiled['2'].independent == ('2', '3', '4')
+    assert compiled['3'].independent == ('3', '4')
+    assert compiled['4'].independent is None
+    assert compiled['5'].independent is None
+    assert compiled['6'].independent is None
+    assert compiled['7'].independent is None
+    assert compiled['8'].independent == ('8', '9')
+    assert compiled['9'].independent is None
+    assert compiled['10'].independent == ('10', '11')
+    assert compiled['11'].independent is None
+    assert compiled['12'].independent is None
+
+
+def test_compile_dataflow_barriers():
+    compiled = StoryCompiler.compile({
+        '1': execute('1', 'a'),
+        '2': execute('2', 'file'),
+        '3': execute('3', 'b'),
+        '4': execute('4', 'c'),
+        '5': execute('5', 'http')
+    })
+
+    assert compiled['1'].independent is None
+    assert compiled['2'].independent is None
+    assert compiled['3'].independent == ('3', '4')
+    assert compiled['4'].independent is None
+
+
+def test_compile_dataflow_blocks():
+    compiled = StoryCompiler.compile({
+        '1': execute('1', 'a'),
+        '2': dict(execute('2', 'b'), parent='1'),
+        '3': dict(execute('3', 'c'), parent='1'),
+        '4': execute('4', 'd')
+    })
+
+    assert compiled['1'].independent is None
+    assert compiled['2'].independent == ('2', '3')
+    assert compiled['3'].independent is None
+
+
+def test_compile_purity():
+    def function(ln, name, *body):
+        lines = {ln: {'ln': ln, 'method': 'function', 'function': name,
+                      'args': [{'$OBJECT': 'arg', 'name': 'n'}]}}
+        for index, line in enumerate(body):
+            child = str(int(ln) + index + 1)
+            lines[child] = dict(line, ln=child, parent=ln)
+        return lines
+
+    def path(name):
+        return {'$OBJECT': 'path', 'paths': [name]}
+
+    def mutate(name, operator):
+        return {'method': 'mutation', 'name': ['r'],
+                'args': [path(name), {'$OBJECT': 'mutation',
+                                      'mutation': operator, 'args': []}]}
+
+    ret = {'method': 'return', 'args': [path('r')]}
+    tree = {}
+    tree.update(function('10', 'pure',
+                         {'method': 'expression', 'name': ['r'],
+                          'args': [path('n')]}, ret))
+    tree.update(function('20', 'mutates', mutate('n', 'append'), ret))
+    tree.update(function('30', 'length', mutate('n', 'length'), ret))
+    tree.update(function('40', 'reads_outer',
+                         {'method': 'expression', 'name': ['r'],
+                          'args': [path('app')]}, ret))
+    tree.update(function('50', 'sets_nested',
+                         {'method': 'expression', 'name': ['n', 'a'],
+                          'args': [path('n')]}))
+    tree.update(function('60', 'executes', execute('61', 'a')))
+    tree.update(function('70', 'calls_pure',
+                         {'method': 'call', 'function': 'pure',
+                          'name': ['r'], 'args': [
+                              {'$OBJECT': 'arg', 'name': 'n',
+                               'arg': path('n')}]}, ret))
+    tree.update(function('80', 'calls_impure',
+                         {'method': 'call', 'function': 'calls_executes',
+                          'name': ['r'], 'args': []}))
+    tree.update(function('90', 'calls_executes',
+                         {'method': 'call', 'function': 'executes',
+                          'name': ['r'], 'args': []}))
+    tree['100'] = {'ln': '100', 'method': 'call', 'function': 'pure',
+                   'name': ['x'], 'args': []}
+    compiled = StoryCompiler.compile(tree)
+
+    pure = {line['function']: line.pure for line in compiled.lines
+            if line['method'] == 'function'}
+    assert pure == {
+        'pure': True,
+        'mutates': False,
+        'length': True,
+        'reads_outer': False,
+        'sets_nested': False,
+        'executes': False,
+        'calls_pure': True,
+        'calls_impure': False,
+        'calls_executes': False
+    }
+    assert compiled['11'].pure is None
+    assert compiled['100'].pure is None
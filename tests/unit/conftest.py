@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 from pytest import fixture
 
+from storyruntime.Config import Config
+from storyruntime.ContainerRegistry import ContainerRegistry
+from storyruntime.ResponseCache import ResponseCache
+from storyruntime.ServiceLimiter import ServiceLimiter
+from storyruntime.SingleFlight import SingleFlight
 from storyruntime.Story import Story
 
 
@@ -11,12 +16,28 @@ def logger(magic):
 
 @fixture
 def config(magic):
-    return magic()
+    config = magic()
+    config.MAX_FRAMES_IN_STACK = Config.MAX_FRAMES_IN_STACK
+    config.FUNCTION_CACHE_SIZE = Config.FUNCTION_CACHE_SIZE
+    config.HTTP_CACHE_SIZE = Config.HTTP_CACHE_SIZE
+    config.HTTP_HEDGE_MAX_RATE = Config.HTTP_HEDGE_MAX_RATE
+    config.SYNAPSE_BULK_SUBSCRIBE = False
+    return config
 
 
 @fixture
-def app(magic):
-    return magic()
+def app(magic, config):
+    app = magic()
+    app.config = config
+    app.app_config = None
+    app.containers = ContainerRegistry()
+    app.hedges = None
+    app.flights = SingleFlight(app.app_id)
+    app.response_cache = ResponseCache.for_config(config, app.app_id)
+    app.limiter = ServiceLimiter(app.app_id, None)
+    app.subscription_batch = None
+    app.function_cache = None
+    return app
 
 
 @fixture
@@ -321,3 +321,55 @@ async def test_get_service_limits(patch, config, pool, async_mock, limits):
                 1.25 * np.percentile(limits['memory_bytes'], 95)
             )
         }
+
+
+@mark.asyncio
+async def test_create_subscriptions_table(config, pool):
+    await Database.create_subscriptions_table(config)
+    pool.con.execute.mock.assert_called_with("""
+            create table if not exists app_subscriptions (
+                app_uuid uuid not null
+                    references apps (uuid) on delete cascade,
+                fingerprint text not null,
+                body jsonb not null,
+                container_id text,
+                primary key (app_uuid, fingerprint)
+            );
+            """)
+
+
+@mark.asyncio
+async def test_get_subscriptions(patch, config, pool, async_mock):
+    expected_query = """
+            select fingerprint, body, container_id
+            from app_subscriptions
+            where app_uuid = $1;
+            """
+    patch.object(pool.con, 'fetch', new=async_mock(return_value=[
+        {'fingerprint': 'f1', 'body': {'sub_id': 'a'},
+         'container_id': 'docker://1'},
+        {'fingerprint': 'f2', 'body': {'sub_id': 'b'}, 'container_id': None}
+    ]))
+    ret = await Database.get_subscriptions(config, 'app_id')
+    assert ret == {
+        'f1': {'body': {'sub_id': 'a'}, 'container_id': 'docker://1'},
+        'f2': {'body': {'sub_id': 'b'}, 'container_id': None}
+    }
+    pool.con.fetch.mock.assert_called_with(expected_query, 'app_id')
+
+
+@mark.asyncio
+async def test_set_subscriptions(config, pool):
+    await Database.set_subscriptions(config, 'app_id', {
+        'f1': {'body': {'sub_id': 'a'}, 'container_id': 'docker://1'}
+    })
+    assert pool.con.transaction.call_count == 1
+    pool.con.execute.mock.assert_called_with("""
+                delete from app_subscriptions
+                where app_uuid = $1;
+                """, 'app_id')
+    pool.con.executemany.mock.assert_called_with("""
+                insert into app_subscriptions
+                    (app_uuid, fingerprint, body, container_id)
+                values ($1, $2, $3, $4);
+                """, [('app_id', 'f1', {'sub_id': 'a'}, 'docker://1')])
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
+
+
+def test_values():
+    # The values below are set via EXECUTION_ENGINE, or in asyncy.yaml.
+    assert ExecutionEngine.LEXICON.value == 'LEXICON'
+    assert ExecutionEngine.CODEGEN.value == 'CODEGEN'
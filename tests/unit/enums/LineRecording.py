@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+from storyruntime.enums.LineRecording import LineRecording
+
+
+def test_values():
+    # The values below are set via LINE_RESULTS.
+    assert LineRecording.OFF.value == 'OFF'
+    assert LineRecording.LAST.value == 'LAST'
+    assert LineRecording.SAMPLED.value == 'SAMPLED'
+    assert LineRecording.FULL.value == 'FULL'
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from storyruntime.enums.ResolverMode import ResolverMode
+
+
+def test_values():
+    # The values below are set via RESOLVER_MODE.
+    assert ResolverMode.INTERPRETER.value == 'INTERPRETER'
+    assert ResolverMode.COMPILER.value == 'COMPILER'
+    assert ResolverMode.DIFFERENTIAL.value == 'DIFFERENTIAL'
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import copy
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import mark
+
+from storyruntime.AppConfig import AppConfig
+from storyruntime.Config import Config
+from storyruntime.Exceptions import StoryscriptError
+from storyruntime.FunctionCache import FunctionCache
+from storyruntime.Story import Story
+from storyruntime.compiler import StoryCompiler
+from storyruntime.enums.LineRecording import LineRecording
+from storyruntime.processing import Lexicon, Stories
+from storyruntime.processing.CodeGenerator import CodeGenerationError, \
+    CodeGenerator, Program
+
+
+def value(v):
+    return {'$OBJECT': 'int', 'int': v}
+
+
+def path(*paths):
+    return {'$OBJECT': 'path', 'paths': list(paths)}
+
+
+def expression(operator, *values):
+    return {'$OBJECT': 'expression', 'expression': operator,
+            'values': list(values)}
+
+
+def assign(name, *args):
+    return {'method': 'expression', 'name': [name], 'args': list(args)}
+
+
+def block(line, children):
+    line['children'] = children
+    return line
+
+
+def for_(output, items, children):
+    return block({'method': 'for', 'output': [output], 'args': [items]},
+                 children)
+
+
+def while_(condition, children):
+    return block({'method': 'while', 'args': [condition]}, children)
+
+
+def if_(method, condition, children):
+    args = [] if condition is None else [condition]
+    return block({'method': method, 'args': args}, children)
+
+
+def function(name, arguments, children):
+    return block({'method': 'function', 'function': name,
+                  'args': [{'$OBJECT': 'arg', 'name': a}
+                           for a in arguments]}, children)
+
+
+def call(name, output, **arguments):
+    return {'method': 'call', 'function': name, 'name': [output],
+            'args': [{'$OBJECT': 'arg', 'name': k, 'arg': v}
+                     for k, v in arguments.items()]}
+
+
+def keyword(method, *args):
+    return {'method': method, 'args': list(args)}
+
+
+def story_for(*lines):
+    """
+    Numbers lines (and their children) the way the Storyscript compiler
+    does, and returns the resulting story.
+    """
+    lines = copy.deepcopy(lines)
+    tree = {}
+    functions = {}
+    ordered = []
+
+    def add(lines, parent):
+        for line in lines:
+            children = line.pop('children', None)
+            line['ln'] = str(len(ordered) + 1)
+            line['parent'] = parent
+            ordered.append(line)
+            tree[line['ln']] = line
+            if line['method'] == 'function':
+                functions[line['function']] = line['ln']
+
+            if children is not None:
+                line['enter'] = str(len(ordered) + 1)
+                add(children, line['ln'])
+
+    add(lines, None)
+    for index, line in enumerate(ordered):
+        line['next'] = None
+        if index + 1 < len(ordered):
+            line['next'] = ordered[index + 1]['ln']
+
+    return {'tree': tree, 'entrypoint': '1', 'functions': functions}
+
+
+def app_for(story, app_config=None):
+    app = MagicMock()
+    app.app_config = app_config
+    app.stories = {'story': story}
+    app.app_context = {}
+    app.config.LINE_RESULTS = LineRecording.FULL
+    app.config.MAX_FRAMES_IN_STACK = Config.MAX_FRAMES_IN_STACK
+    app.config.FUNCTION_CACHE_SIZE = Config.FUNCTION_CACHE_SIZE
+    app.compiled_stories = StoryCompiler.compile_stories(app.stories)
+    app.programs = {}
+    app.function_cache = FunctionCache.for_config(app.config, app_config,
+                                                  'app_id')
+    return app
+
+
+async def run(story, codegen, app_config=None):
+    app = app_for(story, app_config)
+    if codegen:
+        app.programs = CodeGenerator.generate_stories(
+            app.stories, app.compiled_stories, app_config)
+        assert isinstance(app.programs['story'], Program)
+
+    logger = MagicMock()
+    s = Story(app, 'story', logger)
+    s.prepare({})
+
+    error = None
+    try:
+        await Stories.execute(logger, s)
+    except StoryscriptError as e:
+        error = (type(e), e.message, e.line['ln'], type(e.root))
+
+    context = dict(s.context)
+    context.pop('app')
+    return {
+        'context': context,
+        'error': error,
+        'lines': sorted(s.results.keys()),
+        'log': logger.log.mock_calls,
+        'stack': s.get_stack()
+    }
+
+
+stories = {
+    'if': [
+        assign('a', value(1)),
+        if_('if', expression('equals', path('a'), value(2)),
+            [assign('b', value(2))]),
+        if_('elif', expression('equals', path('a'), value(1)),
+            [assign('b', value(1)), assign('c', value(1))]),
+        if_('else', None, [assign('b', value(0))]),
+        assign('d', value(4))
+    ],
+    'for': [
+        assign('total', value(0)),
+        for_('i', {'$OBJECT': 'list',
+                   'items': [value(1), value(2), value(3), value(4)]}, [
+            if_('if', expression('equals', path('i'), value(2)),
+                [keyword('continue')]),
+            if_('if', expression('equals', path('i'), value(4)),
+                [keyword('break')]),
+            assign('total', expression('sum', path('total'), path('i')))
+        ]),
+        assign('after', path('total'))
+    ],
+    'while': [
+        assign('i', value(0)),
+        while_(expression('less', path('i'), value(25)), [
+            assign('i', expression('sum', path('i'), value(1))),
+            if_('if', expression('equals', path('i'), value(3)),
+                [keyword('continue')]),
+            if_('if', expression('equals', path('i'), value(20)),
+                [keyword('break')])
+        ])
+    ],
+    'function': [
+        function('twice', ['n'], [
+            for_('i', {'$OBJECT': 'list', 'items': [value(1)]}, [
+                keyword('return',
+                        expression('multiplication', path('n'), value(2)))
+            ])
+        ]),
+        call('twice', 'a', n=value(21)),
+        call('twice', 'b', n=path('a'))
+    ],
+    'try': [
+        block({'method': 'try'}, [
+            assign('a', value(1)),
+            keyword('throw', {'$OBJECT': 'string', 'string': 'oops'}),
+            assign('b', value(1))
+        ]),
+        block({'method': 'catch'}, [assign('c', value(1))]),
+        block({'method': 'finally'}, [assign('d', value(1))]),
+        assign('e', value(1))
+    ],
+    'error': [
+        assign('a', value(1)),
+        for_('i', {'$OBJECT': 'list', 'items': [value(1)]}, [
+            assign('b', path('missing'))
+        ])
+    ],
+    'invalid_break': [
+        assign('a', value(1)),
+        keyword('break')
+    ],
+    'recursion': [
+        function('fact', ['n'], [
+            if_('if', expression('less_equal', path('n'), value(1)),
+                [keyword('return', value(1))]),
+            call('fact', 'm', n=expression('subtraction', path('n'),
+                                           value(1))),
+            keyword('return', expression('multiplication', path('n'),
+                                         path('m')))
+        ]),
+        call('fact', 'a', n=value(10))
+    ],
+    'nested': [
+        function('count', ['n'], [
+            assign('total', value(0)),
+            assign('i', value(0)),
+            while_(expression('less', path('i'), path('n')), [
+                assign('i', expression('sum', path('i'), value(1))),
+                for_('j', {'$OBJECT': 'list',
+                           'items': [value(1), value(2), value(3)]}, [
+                    if_('if', expression('equals', path('j'), value(2)),
+                        [keyword('continue')]),
+                    if_('if', expression('equals', path('i'), value(4)),
+                        [keyword('return', path('total'))]),
+                    assign('total', expression('sum', path('total'),
+                                               path('j')))
+                ]),
+                if_('if', expression('equals', path('i'), value(2)),
+                    [keyword('continue')])
+            ]),
+            keyword('return', path('total'))
+        ]),
+        for_('k', {'$OBJECT': 'list', 'items': [value(2), value(9)]}, [
+            call('count', 'c', n=path('k')),
+            assign('last', path('c'))
+        ])
+    ],
+    'nested_error': [
+        function('fail', ['n'], [
+            for_('i', {'$OBJECT': 'list', 'items': [value(1)]}, [
+                assign('b', path('missing'))
+            ])
+        ]),
+        function('outer', ['n'], [
+            call('fail', 'r', n=path('n'))
+        ]),
+        assign('a', value(1)),
+        while_(expression('less', path('a'), value(2)), [
+            call('outer', 'b', n=path('a'))
+        ])
+    ],
+    'empty_for': [
+        assign('a', value(1)),
+        while_(expression('less', path('a'), value(2)), [
+            assign('a', value(2)),
+            for_('i', {'$OBJECT': 'list', 'items': []}, [
+                assign('b', value(1))
+            ])
+        ])
+    ]
+}
+
+
+@mark.parametrize('name', stories.keys())
+@mark.asyncio
+async def test_generate_same_as_lexicon(name):
+    expected = await run(story_for(*stories[name]), codegen=False)
+    actual = await run(story_for(*stories[name]), codegen=True)
+    assert actual == expected
+
+
+def test_generate():
+    story = story_for(*stories['for'])
+    tree = StoryCompiler.compile(story['tree'])
+    program = CodeGenerator.generate(tree, '1', {})
+    assert program.tree is tree
+    assert 'async def main(logger, story):' in program.source
+    assert 'for item_1 in items_1:' in program.source
+
+
+@mark.parametrize('lines', [
+    [{'method': 'unknown'}],
+    [block({'method': 'try'}, [assign('a', value(1))]),
+     assign('b', value(1))]
+])
+def test_generate_unsupported(lines):
+    tree = StoryCompiler.compile(story_for(*lines)['tree'])
+    with pytest.raises(CodeGenerationError):
+        CodeGenerator.generate(tree, '1', {})
+
+
+@mark.parametrize('body,generated', [
+    ([assign('a', path('i'))], True),
+    ([keyword('return')], False)
+])
+def test_generate_concurrent_loop(body, generated):
+    story = story_for(for_('i', path('items'), body))
+    tree = StoryCompiler.compile(story['tree'])
+    app_config = AppConfig({'runtime': {'for': {'concurrency': 2}}})
+    programs = CodeGenerator.generate_stories({'story': story},
+                                              {'story': tree}, app_config)
+    if generated:
+        assert 'await Lexicon.for_loop(logger, story, C' in \
+            programs['story'].source
+    else:
+        assert programs == {}
+
+
+def execute(service, output, *reads):
+    return {'method': 'execute', 'service': service, 'command': 'get',
+            'name': [output],
+            'args': [{'$OBJECT': 'arg', 'name': r, 'arg': path(r)}
+                     for r in reads]}
+
+
+@mark.asyncio
+async def test_generate_parallel(patch):
+    async def execute_(logger, story, line):
+        # Lines which start later end first.
+        await asyncio.sleep(0.001 * (5 - int(line['ln'])))
+        output = [story.resolve(arg['arg']) for arg in line['args']]
+        story.end_line(line['ln'], output=output,
+                       assign={'paths': line['name']})
+        return Lexicon.line_number_or_none(story.line(line.get('next')))
+
+    patch.object(Lexicon, 'execute', side_effect=execute_)
+    lines = [
+        assign('a', value(1)),
+        execute('x', 'b', 'a'),
+        execute('y', 'c', 'a'),
+        execute('z', 'd', 'c'),
+        assign('e', path('d'))
+    ]
+    app_config = AppConfig({'runtime': {'execute': {'concurrent': True}}})
+    expected = await run(story_for(*lines), False, app_config)
+    actual = await run(story_for(*lines), True, app_config)
+    assert actual == expected
+    assert expected['context']['e'] == [[1]]
+    assert expected['log'] == [mock.call('story-execution', ln)
+                               for ln in ('2', '4', '5', None)]
+
+    story = story_for(*lines)
+    programs = CodeGenerator.generate_stories(
+        {'story': story}, StoryCompiler.compile_stories({'story': story}),
+        app_config)
+    assert 'await Lexicon.execute_parallel(logger, story, C' in \
+        programs['story'].source
+
+
+@mark.asyncio
+async def test_generate_memoized(patch):
+    hits = []
+    lookup = FunctionCache.lookup
+
+    def lookup_(story, function_line, context):
+        key, hit, returned = lookup(story, function_line, context)
+        hits.append(hit)
+        return key, hit, returned
+
+    patch.object(FunctionCache, 'lookup', side_effect=lookup_)
+    lines = [
+        function('twice', ['n'], [
+            assign('r', expression('multiplication', path('n'), value(2))),
+            keyword('return', path('r'))
+        ]),
+        assign('total', value(0)),
+        for_('i', {'$OBJECT': 'list',
+                   'items': [value(1), value(2), value(1), value(2)]}, [
+            call('twice', 'a', n=path('i')),
+            assign('total', expression('sum', path('total'), path('a')))
+        ])
+    ]
+    app_config = AppConfig({'runtime': {'functions': {'memoize': True}}})
+    expected = await run(story_for(*lines), False, app_config)
+    actual = await run(story_for(*lines), True, app_config)
+    assert actual == expected
+    assert expected['context']['total'] == 12
+    assert hits == [False, False, True, True] * 2
+
+    unmemoized = await run(story_for(*lines), False)
+    assert unmemoized['context'] == expected['context']
+
+    story = story_for(*lines)
+    programs = CodeGenerator.generate_stories(
+        {'story': story}, StoryCompiler.compile_stories({'story': story}),
+        app_config)
+    assert 'FunctionCache.lookup(story, C' in programs['story'].source
+
+
+def test_generate_too_deep():
+    lines = [assign('a', value(1))]
+    for _ in range(30):
+        lines = [for_('i', path('a'), lines)]
+
+    tree = StoryCompiler.compile(story_for(*lines)['tree'])
+    with pytest.raises(CodeGenerationError):
+        CodeGenerator.generate(tree, '1', {})
+
+
+def test_generate_stories():
+    raw = {
+        'a': story_for(*stories['for']),
+        'b': story_for({'method': 'unknown'}),
+        'c': story_for(*stories['if'])
+    }
+    compiled = StoryCompiler.compile_stories(raw)
+    compiled['c'] = raw['c']['tree']
+
+    programs = CodeGenerator.generate_stories(raw, compiled)
+    assert list(programs.keys()) == ['a']
+    assert programs['a'].tree is compiled['a']
+
+
+def test_program_for():
+    story = story_for(*stories['for'])
+    app = app_for(story)
+    s = Story(app, 'story', MagicMock())
+    assert CodeGenerator.program_for(s) is None
+
+    app.programs = CodeGenerator.generate_stories(
+        app.stories, app.compiled_stories)
+    assert CodeGenerator.program_for(s) is app.programs['story']
+
+    s.tree = StoryCompiler.compile(story['tree'])
+    assert CodeGenerator.program_for(s) is None
+
+    app.programs = MagicMock()
+    assert CodeGenerator.program_for(s) is None
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import collections
+import inspect
 from unittest import mock
 from unittest.mock import MagicMock, Mock
 
@@ -7,10 +9,13 @@ import pytest
 from pytest import fixture, mark
 
 from storyruntime import Metrics
+from storyruntime.AppConfig import AppConfig
+from storyruntime.Context import Context
 from storyruntime.Exceptions import InvalidKeywordUsage, \
-    StoryscriptError, StoryscriptRuntimeError
+    StackOverflowException, StoryscriptError, StoryscriptRuntimeError
 from storyruntime.Story import Story
 from storyruntime.Types import StreamingService
+from storyruntime.compiler import StoryCompiler
 from storyruntime.constants import ContextConstants
 from storyruntime.constants.LineConstants import LineConstants
 from storyruntime.constants.LineSentinels import LineSentinels
@@ -382,10 +387,150 @@ async def test_lexicon_for_loop(patch, logger, story, line,
     assert story.context.get('element') is None
 
 
+@mark.parametrize('stop_at,sentinel', [
+    (None, None),
+    (1, LineSentinels.BREAK),
+    (1, LineSentinels.CONTINUE),
+    (1, LineSentinels.RETURN),
+    (1, 'error')
+])
 @mark.asyncio
-async def test_lexicon_while(patch, magic, logger, line):
+async def test_lexicon_for_loop_concurrent(patch, logger, story, line,
+                                           stop_at, sentinel):
+    running = []
+    max_running = 0
+
+    async def execute_block(our_logger, our_story, our_line):
+        nonlocal max_running
+        index = our_story.context['element']
+        assert our_story is not story
+        assert our_line == line
+        running.append(index)
+        max_running = max(max_running, len(running))
+        # Later iterations end first.
+        await asyncio.sleep(0.001 * (4 - index))
+        running.remove(index)
+
+        our_story.context[f'x{index}'] = index
+        our_story.context['last'] = index
+        if index == stop_at:
+            if sentinel == 'error':
+                raise StoryscriptError(message='error')
+
+            return sentinel
+
+    patch.object(Lexicon, 'execute_block', side_effect=execute_block)
+    line['output'] = ['element']
+    story.context = Context({'element': 'outer'}, {})
+
+    if sentinel == 'error':
+        with pytest.raises(StoryscriptError):
+            await Lexicon.for_loop_concurrent(logger, story, line,
+                                              range(4), 2)
+    else:
+        result = await Lexicon.for_loop_concurrent(logger, story, line,
+                                                   range(4), 2)
+        if sentinel == LineSentinels.RETURN:
+            assert result == LineSentinels.RETURN
+        else:
+            assert result is None
+
+    assert max_running == 2
+    if sentinel is None or sentinel == LineSentinels.CONTINUE:
+        assert story.context.maps[0] == {
+            'x0': 0, 'x1': 1, 'x2': 2, 'x3': 3, 'last': 3
+        }
+    else:
+        # Iterations after the one which stopped the loop don't count.
+        assert story.context.maps[0] == {'x0': 0, 'x1': 1, 'last': 1}
+
+
+@mark.asyncio
+async def test_lexicon_for_loop_concurrent_modified_in_place(patch, logger,
+                                                             story, line):
+    items = ['outer']
+
+    async def execute_block(our_logger, our_story, our_line):
+        index = our_story.context['element']
+        # Later iterations end first.
+        await asyncio.sleep(0.001 * (4 - index))
+        our_story.context['items'].append(index)
+        assert items == ['outer']
+        if index == 1:
+            return LineSentinels.BREAK
+
+    patch.object(Lexicon, 'execute_block', side_effect=execute_block)
+    line['output'] = ['element']
+    story.context = Context({'items': items}, {})
+
+    assert await Lexicon.for_loop_concurrent(logger, story, line,
+                                             range(4), 4) is None
+    # The iterations after the break don't count, and the others are merged
+    # in order.
+    assert story.context.maps[0] == {'items': ['outer', 1]}
+    assert items == ['outer']
 
-    story = Story(magic(), 'foo', logger)
+
+@mark.asyncio
+async def test_lexicon_for_loop_concurrent_empty(patch, logger, story, line):
+    patch.object(Lexicon, 'execute_block')
+    line['output'] = ['element']
+    story.context = Context({}, {})
+    assert await Lexicon.for_loop_concurrent(logger, story, line,
+                                             [], 2) is None
+    assert Lexicon.execute_block.call_count == 0
+
+
+@mark.parametrize('result', [LineSentinels.RETURN, None])
+@mark.asyncio
+async def test_lexicon_for_loop_dispatch_concurrent(patch, logger, story,
+                                                    line, async_mock, result):
+    story.app.app_config = AppConfig({'runtime': {'for': {'concurrency': 5}}})
+    patch.object(Lexicon, 'for_loop_concurrent',
+                 new=async_mock(return_value=result))
+    patch.object(Lexicon, 'line_number_or_none')
+    line['output'] = ['element']
+    story.resolve.return_value = ['one']
+
+    assert await Lexicon.for_loop(logger, story, line) == \
+        (result or Lexicon.line_number_or_none(story.next_block(line)))
+    Lexicon.for_loop_concurrent.mock.assert_called_with(
+        logger, story, line, ['one'], 5)
+
+
+@mark.parametrize('method', ['for_loop', 'while_'])
+@mark.asyncio
+async def test_lexicon_loop_yields(patch, logger, story, line, async_mock,
+                                   method):
+    patch.object(Lexicon, 'execute_block', new=async_mock())
+    patch.object(Lexicon, 'line_number_or_none')
+    patch.object(story, 'evaluate', side_effect=[True, True, True, False])
+    patch.object(story.scheduler, 'due', side_effect=[False, True, False])
+    patch.object(story.scheduler, 'yield_', new=async_mock())
+    line['output'] = ['element']
+    story.resolve.return_value = ['one', 'two', 'three']
+
+    await getattr(Lexicon, method)(logger, story, line)
+    assert Lexicon.execute_block.mock.call_count == 3
+    assert story.scheduler.due.call_count == 3
+    story.scheduler.yield_.mock.assert_called_once_with()
+
+
+def test_lexicon_for_loop_concurrency(magic):
+    line = {'ln': '2'}
+    app_config = AppConfig({'runtime': {'for': {
+        'concurrency': 3,
+        'loops': [{'story': 'a.story', 'line': 2, 'concurrency': 10}]
+    }}})
+    assert Lexicon.for_loop_concurrency(magic(), 'a.story', line) == 1
+    assert Lexicon.for_loop_concurrency(app_config, 'a.story', line) == 10
+    assert Lexicon.for_loop_concurrency(app_config, 'b.story', line) == 3
+
+
+@mark.asyncio
+async def test_lexicon_while(patch, app, logger, line):
+
+    story = Story(app, 'foo', logger)
 
     story.tree = {
         '1': {
@@ -597,6 +742,80 @@ async def test_lexicon_execute_line_generic(patch, logger, story,
     story.start_line.assert_called_with('1')
 
 
+@mark.asyncio
+async def test_lexicon_execute_line_compiled(patch, logger, story,
+                                             async_mock):
+    tree = StoryCompiler.compile({'1': {'ln': '1', 'method': 'elif'}})
+    patch.object(Lexicon, 'if_condition', new=async_mock())
+    patch.object(story, 'line', return_value=tree['1'])
+    patch.many(story, ['start_line', 'new_frame'])
+    result = await Lexicon.execute_line(logger, story, '1')
+
+    Lexicon.if_condition.mock.assert_called_with(logger, story, tree['1'])
+    assert result == Lexicon.if_condition.mock.return_value
+
+
+@mark.parametrize('handler', sorted(set(
+    StoryCompiler.sync_handlers.values())))
+def test_lexicon_sync_handlers(handler):
+    assert not inspect.iscoroutinefunction(getattr(Lexicon, handler))
+
+
+def test_lexicon_execute_line_sync(patch, logger, story):
+    tree = StoryCompiler.compile({'1': {'ln': '1', 'method': 'set'}})
+    patch.object(Lexicon, 'set_sync')
+    patch.many(story, ['start_line', 'new_frame'])
+    assert Lexicon.is_sync(tree['1'])
+    result = Lexicon.execute_line_sync(logger, story, tree['1'])
+
+    story.new_frame.assert_called_with('1')
+    story.start_line.assert_called_with('1')
+    Lexicon.set_sync.assert_called_with(logger, story, tree['1'])
+    assert result == Lexicon.set_sync.return_value
+
+
+def test_lexicon_execute_line_sync_error(patch, logger, story):
+    tree = StoryCompiler.compile({'1': {'ln': '1', 'method': 'set'}})
+    patch.object(Lexicon, 'set_sync', side_effect=KeyError('foo'))
+    with pytest.raises(StoryscriptRuntimeError) as e:
+        Lexicon.execute_line_sync(logger, story, tree['1'])
+
+    assert e.value.line == tree['1']
+    assert isinstance(e.value.root, KeyError)
+
+
+def test_lexicon_is_sync():
+    tree = StoryCompiler.compile({
+        '1': {'ln': '1', 'method': 'if'},
+        '2': {'ln': '2', 'method': 'execute'}
+    })
+    assert Lexicon.is_sync(tree['1'])
+    assert not Lexicon.is_sync(tree['2'])
+    assert not Lexicon.is_sync({'ln': '1', 'method': 'if'})
+    assert not Lexicon.is_sync(None)
+
+
+@mark.asyncio
+async def test_lexicon_execute_block_sync(patch, logger, story, async_mock):
+    story.tree = StoryCompiler.compile({
+        '1': {'ln': '1', 'method': 'for', 'next': '2', 'enter': '2'},
+        '2': {'ln': '2', 'method': 'set', 'next': '3', 'parent': '1'},
+        '3': {'ln': '3', 'method': 'execute', 'next': '4', 'parent': '1'},
+        '4': {'ln': '4', 'method': 'set', 'parent': '1'}
+    })
+    patch.object(Lexicon, 'execute_line_sync', side_effect=['3', None])
+    patch.object(Lexicon, 'execute_line', new=async_mock(return_value='4'))
+
+    assert await Lexicon.execute_block(logger, story, story.tree['1']) \
+        is None
+
+    assert Lexicon.execute_line_sync.mock_calls == [
+        mock.call(logger, story, story.tree['2']),
+        mock.call(logger, story, story.tree['4'])
+    ]
+    Lexicon.execute_line.mock.assert_called_once_with(logger, story, '3')
+
+
 @mark.asyncio
 @mark.parametrize('line_4_result', ['5', LineSentinels.RETURN,
                                     LineSentinels.BREAK])
@@ -745,8 +964,8 @@ async def test_lexicon_execute_block(patch, logger, story,
             'command': 'info'
         }
     }])
-async def test_lexicon_try_catch(patch, magic, logger, tree):
-    story = Story(magic(), 'foo', logger)
+async def test_lexicon_try_catch(patch, app, logger, tree):
+    story = Story(app, 'foo', logger)
     story.context = {}
 
     story.tree = tree
@@ -903,3 +1122,172 @@ async def test_lexicon_when_invalid(story):
     line = {'service': 'foo', 'command': 'bar'}
     with pytest.raises(StoryscriptError):
         await Lexicon.when(story.logger, story, line)
+
+
+def parallel_tree():
+    def execute(ln, service):
+        return {'ln': ln, 'method': 'execute', 'service': service,
+                'command': 'get', 'next': str(int(ln) + 1)}
+
+    return StoryCompiler.compile({
+        '1': execute('1', 'a'),
+        '2': execute('2', 'd'),
+        '3': execute('3', 'b'),
+        '4': execute('4', 'c'),
+        '5': {'ln': '5', 'method': 'set', 'name': ['x']}
+    })
+
+
+def test_lexicon_parallel_group(magic):
+    tree = parallel_tree()
+    app_config = AppConfig({'runtime': {'execute': {
+        'concurrent': True, 'unsafe': ['d']
+    }}})
+    assert Lexicon.parallel_group(app_config, tree, tree['1']) is None
+    assert Lexicon.parallel_group(app_config, tree, tree['3']) == ('3', '4')
+    assert Lexicon.parallel_group(app_config, tree, tree['5']) is None
+    assert Lexicon.parallel_group(app_config, tree, {'ln': '3'}) is None
+    assert Lexicon.parallel_group(magic(), tree, tree['3']) is None
+
+    app_config = AppConfig({'runtime': {'execute': {'concurrent': True}}})
+    assert Lexicon.parallel_group(app_config, tree, tree['1']) == \
+        ('1', '2', '3', '4')
+    assert Lexicon.parallel_group(AppConfig({}), tree, tree['1']) is None
+
+
+@mark.parametrize('failing', [[], ['3'], ['2', '3']])
+@mark.asyncio
+async def test_lexicon_execute_parallel(patch, logger, story, failing):
+    story.tree = parallel_tree()
+    story.context = Context({}, {})
+    running = []
+    max_running = 0
+
+    async def execute_line(our_logger, our_story, line_number):
+        nonlocal max_running
+        assert our_story is not story
+        assert our_story.context is story.context
+        running.append(line_number)
+        max_running = max(max_running, len(running))
+        # Later lines end first.
+        await asyncio.sleep(0.001 * (4 - int(line_number)))
+        running.remove(line_number)
+
+        if line_number in failing:
+            raise StoryscriptError(message=line_number, story=our_story)
+
+        our_story.context[line_number] = True
+
+    patch.object(Lexicon, 'execute_line', side_effect=execute_line)
+
+    if failing:
+        with pytest.raises(StoryscriptError) as e:
+            await Lexicon.execute_parallel(logger, story, ('1', '2', '3'))
+
+        assert e.value.message == failing[0]
+        assert e.value.story is story
+    else:
+        assert await Lexicon.execute_parallel(
+            logger, story, ('1', '2', '3')) == '4'
+
+    assert max_running == 3
+    # Every line executes to completion.
+    assert set(story.context.maps[0]) == {'1', '2', '3'} - set(failing)
+
+
+@mark.asyncio
+async def test_lexicon_execute_block_parallel(patch, logger, story,
+                                              async_mock):
+    tree = parallel_tree()
+    for line in tree.lines:
+        line['parent'] = '0'
+    tree['0'] = {'ln': '0', 'method': 'for', 'enter': '1'}
+    story.tree = tree
+    story.app.app_config = AppConfig({'runtime': {'execute': {
+        'concurrent': True, 'unsafe': ['d']
+    }}})
+    patch.object(Lexicon, 'execute_parallel', new=async_mock(
+        return_value='5'))
+    executed = []
+
+    async def execute_line(our_logger, our_story, line_number):
+        executed.append(line_number)
+        return our_story.line(line_number)['next']
+
+    patch.object(Lexicon, 'execute_line', side_effect=execute_line)
+    patch.object(Lexicon, 'execute_line_sync', return_value=None)
+    patch.object(story, 'line_has_parent', return_value=True)
+
+    assert await Lexicon.execute_block(logger, story, tree['0']) is None
+    Lexicon.execute_parallel.mock.assert_called_once_with(
+        logger, story, ('3', '4'))
+    assert executed == ['1', '2']
+    Lexicon.execute_line_sync.assert_called_once_with(logger, story,
+                                                      tree['5'])
+
+
+def recursive_story(app, logger, depth, max_frames):
+    """
+    A story with a function which calls itself depth times, from within
+    a while loop in a for loop.
+    """
+    def n_minus(value):
+        return {'$OBJECT': 'expression', 'expression': 'subtraction',
+                'values': [{'$OBJECT': 'path', 'paths': ['n']},
+                           {'$OBJECT': 'int', 'int': value}]}
+
+    tree = {
+        '1': {'ln': '1', 'method': 'function', 'function': 'down',
+              'args': [{'$OBJECT': 'arg', 'name': 'n'}],
+              'enter': '2', 'next': '2'},
+        '2': {'ln': '2', 'method': 'for', 'parent': '1', 'output': ['i'],
+              'args': [{'$OBJECT': 'list',
+                        'items': [{'$OBJECT': 'int', 'int': 1}]}],
+              'enter': '3', 'next': '3'},
+        '3': {'ln': '3', 'method': 'while', 'parent': '2',
+              'args': [{'$OBJECT': 'expression', 'expression': 'greater',
+                        'values': [{'$OBJECT': 'path', 'paths': ['n']},
+                                   {'$OBJECT': 'int', 'int': 0}]}],
+              'enter': '4', 'next': '4'},
+        '4': {'ln': '4', 'method': 'call', 'function': 'down',
+              'parent': '3', 'name': ['r'],
+              'args': [{'$OBJECT': 'arg', 'name': 'n',
+                        'arg': n_minus(1)}],
+              'next': '5'},
+        '5': {'ln': '5', 'method': 'return', 'parent': '3',
+              'args': [n_minus(0)], 'next': '6'},
+        '6': {'ln': '6', 'method': 'call', 'function': 'down',
+              'name': ['a'], 'args': [{'$OBJECT': 'arg', 'name': 'n',
+                                       'arg': {'$OBJECT': 'int',
+                                               'int': depth}}]}
+    }
+    app.config.MAX_FRAMES_IN_STACK = max_frames
+    app.stories = {'foo': {'tree': tree, 'entrypoint': '6',
+                           'functions': {'down': '1'}}}
+    app.compiled_stories = StoryCompiler.compile_stories(app.stories)
+    story = Story(app, 'foo', logger)
+    story.prepare({})
+    return story
+
+
+@mark.asyncio
+async def test_lexicon_execute_block_deep(app, logger):
+    # Every level of recursion nests 3 lines, which is more than the
+    # stack of the interpreter could take if each one nested coroutines.
+    story = recursive_story(app, logger, 2000, 10000)
+    assert await Lexicon.execute_line(logger, story, '6') is None
+    assert story.context['a'] == 2000
+    assert story.get_stack() == []
+
+
+@mark.asyncio
+async def test_lexicon_execute_block_overflow(app, logger):
+    story = recursive_story(app, logger, 2000, 40)
+    with pytest.raises(StackOverflowException) as e:
+        await Lexicon.execute_line(logger, story, '6')
+
+    # The line which called the function first claims the error, and the
+    # stack is left as it was when it overflowed.
+    assert e.value.line['ln'] == '6'
+    assert story.get_stack() == ['6'] + ['2', '3', '4'] * 13
+    assert 'i' not in story.context
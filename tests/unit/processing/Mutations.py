@@ -3,7 +3,9 @@ import pytest
 
 from storyruntime.Exceptions import StoryscriptError
 from storyruntime.processing.Mutations import Mutations
-from storyruntime.processing.mutations.StringMutations import StringMutations
+from storyruntime.processing.mutations.IntegerMutations import \
+    IntegerMutations
+from storyruntime.processing.mutations.MapMutations import MapMutations
 
 
 # Note: All mutations are tested via integration
@@ -32,10 +34,55 @@ def test_mutations_handler_exception(story, patch):
     def exc(*args):
         raise Exception()
 
-    patch.object(StringMutations, 'replace', side_effect=exc)
+    patch.dict(Mutations.handlers, {(str, 'replace'): exc})
     mutation = {
         'mutation': 'replace'
     }
 
     with pytest.raises(StoryscriptError):
         Mutations.mutate(mutation, 'string', story, None)
+
+
+def test_mutations_handler_for():
+    assert Mutations.handler_for(int, 'increment') == \
+        IntegerMutations.increment
+    assert Mutations.handler_for(int, 'length') is None
+    assert Mutations.handler_for(dict, 'keys') == MapMutations.keys
+
+
+def test_mutations_handler_for_subclass(story):
+    class Map(dict):
+        pass
+
+    assert Mutations.handler_for(bool, 'isOdd') == IntegerMutations.isOdd
+    assert Mutations.handler_for(Map, 'keys') == MapMutations.keys
+    assert Mutations.mutate({'mutation': 'keys'}, Map(a=1), story,
+                            None) == ['a']
+    assert Mutations.handler_for(Mutations, 'keys') is None
+    assert Mutations in Mutations.known
+
+
+def test_mutations_add_handlers(patch):
+    class Fake(int):
+        pass
+
+    class FakeMutations:
+        THRESHOLD = 10
+        # Such as a helper which the module of the mutations imports.
+        helper = len
+
+        @classmethod
+        def double(cls, mutation, value, story, line, operator):
+            return value * 2
+
+        @staticmethod
+        def _private(value):
+            return value
+
+    patch.dict(Mutations.handlers)
+    patch.object(Mutations, 'known', set())
+    Mutations.add_handlers(Fake, FakeMutations)
+    assert Mutations.handler_for(Fake, 'double') == FakeMutations.double
+    assert Mutations.handler_for(Fake, 'THRESHOLD') is None
+    assert Mutations.handler_for(Fake, 'helper') is None
+    assert Mutations.handler_for(Fake, '_private') is None
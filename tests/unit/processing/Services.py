@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import base64
 import json
 import re
@@ -12,10 +13,17 @@ from pytest import fixture, mark
 
 from requests.structures import CaseInsensitiveDict
 
+from storyruntime.AppConfig import AppConfig
 from storyruntime.Containers import Containers
 from storyruntime.Exceptions import ArgumentTypeMismatchError, \
     StoryscriptError, StoryscriptRuntimeError
+from storyruntime.HttpTransport import HttpTransport
+from storyruntime.ResponseCache import ResponseCache
+from storyruntime.ServiceLimiter import ServiceLimiter
+from storyruntime.SingleFlight import SingleFlight
+from storyruntime.Synapse import PendingSubscription, SubscriptionBatch
 from storyruntime.Types import StreamingService
+from storyruntime.compiler import StoryCompiler
 from storyruntime.constants import ContextConstants
 from storyruntime.constants.LineConstants import \
     LineConstants as Line, LineConstants
@@ -23,11 +31,11 @@ from storyruntime.constants.ServiceConstants import ServiceConstants
 from storyruntime.entities.Multipart import FileFormField, FormField
 from storyruntime.omg.ServiceOutputValidator import ServiceOutputValidator
 from storyruntime.processing.Services import Command, Event, HttpDataEncoder, \
-    Service, Services
+    HttpPlan, Service, Services
 from storyruntime.utils.HttpUtils import HttpUtils
 
 from tornado.gen import coroutine
-from tornado.httpclient import AsyncHTTPClient, HTTPRequest, HTTPResponse
+from tornado.httpclient import HTTPRequest, HTTPResponse
 
 
 @mark.asyncio
@@ -46,6 +54,23 @@ async def test_services_execute_execute_internal(story, async_mock):
     assert await Services.execute(story, line) == 'output'
 
 
+@mark.asyncio
+async def test_services_execute_internal_sanitizes(patch, story,
+                                                   async_mock):
+    patch.object(Services, 'internal_services', new={})
+    handler = async_mock(return_value={'a': [object()]})
+    Services.register_internal('my_service', 'my_command', {}, 'any',
+                               handler)
+    line = {
+        Line.service: 'my_service',
+        Line.command: 'my_command',
+        Line.method: 'execute'
+    }
+
+    with pytest.raises(StoryscriptRuntimeError):
+        await Services.execute(story, line)
+
+
 @mark.asyncio
 async def test_services_execute_execute_external(patch, story, async_mock):
     patch.object(Services, 'execute_external', new=async_mock())
@@ -356,8 +381,9 @@ async def test_services_execute_http(patch, story, async_mock, absolute_url,
         'ln': '1'
     }
 
-    patch.init(AsyncHTTPClient)
-    client = AsyncHTTPClient()
+    # Services with a url of their own get a pool for every app.
+    app_id = story.app.app_id if absolute_url else None
+    client = HttpTransport.services(expected_url, app_id)
     response = HTTPResponse(HTTPRequest(url=expected_url), 200,
                             buffer=StringIO('{"foo": "\U0001f44d"}'),
                             headers={'Content-Type': 'application/json'})
@@ -389,7 +415,8 @@ async def test_services_execute_http(patch, story, async_mock, absolute_url,
         assert actual_body_producer.func == Services._multipart_producer
     else:
         HttpUtils.fetch_with_retry.mock.assert_called_with(
-            3, story.logger, expected_url, client, expected_kwargs)
+            3, story.logger, expected_url, client, expected_kwargs,
+            idempotent=method == 'GET')
 
     if service_output is not None:
         ServiceOutputValidator.raise_if_invalid.assert_called_with(
@@ -850,7 +877,6 @@ async def test_when(patch, story, async_mock, service_name):
         'request_timeout': 120
     }
 
-    patch.init(AsyncHTTPClient)
     patch.object(story, 'next_block')
     patch.object(story.app, 'add_subscription')
     patch.object(story, 'argument_by_name', return_value='bar')
@@ -860,10 +886,11 @@ async def test_when(patch, story, async_mock, service_name):
                  new=async_mock(return_value=http_res))
     ret = await Services.when(streaming_service, story, line)
 
-    client = AsyncHTTPClient()
+    client = HttpTransport.control(expected_url)
 
     HttpUtils.fetch_with_retry.mock.assert_called_with(
-        100, story.logger, expected_url, client, expected_kwargs)
+        10, story.logger, expected_url, client, expected_kwargs,
+        idempotent=True)
 
     story.app.add_subscription.assert_called_with(
         'my_guid_here', story.context[service_name],
@@ -875,6 +902,16 @@ async def test_when(patch, story, async_mock, service_name):
     with pytest.raises(StoryscriptError):
         await Services.when(streaming_service, story, line)
 
+    story.app.subscription_batch = SubscriptionBatch()
+    story.app.add_subscription.reset_mock()
+    HttpUtils.fetch_with_retry.mock.reset_mock()
+    await Services.when(streaming_service, story, line)
+    assert story.app.subscription_batch.pending == [PendingSubscription(
+        story=story, line=line, streaming_service=streaming_service,
+        event='updates', body=expected_body)]
+    HttpUtils.fetch_with_retry.mock.assert_not_called()
+    story.app.add_subscription.assert_not_called()
+
 
 def test_service_get_command_conf_events(story):
     chain = deque(
@@ -977,3 +1014,216 @@ def test_http_data_encoder_exc(patch, type_exc):
     }
     with pytest.raises(StoryscriptRuntimeError):
         json.dumps(obj, cls=HttpDataEncoder)
+
+
+def test_services_plan_for(patch, story):
+    story.app.services = {
+        'alpine': {
+            ServiceConstants.config: {
+                'actions': {
+                    'echo': {
+                        'arguments': {
+                            'a': {'in': 'query'},
+                            'b': {},
+                            'c': {'in': 'header'}
+                        },
+                        'http': {'method': 'get', 'path': '/echo/{a}'}
+                    }
+                }
+            }
+        }
+    }
+    story.tree = StoryCompiler.compile({
+        '1': {'ln': '1', Line.method: 'execute', Line.service: 'alpine',
+              Line.command: 'echo'}
+    })
+    line = story.line('1')
+    patch.object(Services, 'walk_chain', wraps=Services.walk_chain)
+
+    chain = deque([Service(name='alpine'), Command(name='echo')])
+    assert Services.resolve_chain(story, line) == chain
+    assert Services.resolve_chain(story, line) is \
+        Services.resolve_chain(story, line)
+    command_conf = Services.command_conf_for(story, line, chain)
+    assert command_conf is story.app.services['alpine'][
+        ServiceConstants.config]['actions']['echo']
+    assert Services.walk_chain.call_count == 1
+
+    assert Services.http_plan_for(story, line, command_conf) == HttpPlan(
+        arguments=(('a', 'query'), ('b', 'requestBody'), ('c', 'header')),
+        body_fields=1, form_fields=0, method='get',
+        content_type='application/json', url=None, port=5000,
+        path='/echo/{a}', idempotent=True, hedge=True, coalesce=False,
+        cache_ttl=None)
+    assert Services.http_plan_for(story, line, command_conf) is \
+        Services.plan_for(story, line).http
+    assert Services.http_plan_for(story, line, {'http': {'url': 'u'}}) \
+        .url == 'u'
+
+
+@mark.parametrize('http,idempotent,hedge', [
+    ({'method': 'get'}, True, True),
+    ({'method': 'put'}, True, False),
+    ({'method': 'post'}, False, False),
+    ({'method': 'post', 'idempotent': True}, True, True)
+])
+def test_services_http_plan_idempotent(http, idempotent, hedge):
+    plan = Services.http_plan({'http': http})
+    assert plan.idempotent is idempotent
+    assert plan.hedge is hedge
+
+
+@mark.asyncio
+async def test_services_execute_http_hedged(patch, story, async_mock):
+    chain = deque([Service(name='alpine'), Command(name='echo')])
+    command_conf = {'http': {'method': 'get',
+                             'url': 'https://alpine.com/echo'}}
+    story.app.hedges = {}
+    response = HTTPResponse(HTTPRequest(url='https://alpine.com/echo'), 200,
+                            buffer=StringIO('foo'), headers={})
+    patch.object(HttpUtils, 'fetch_hedged',
+                 new=async_mock(return_value=response))
+
+    ret = await Services.execute_http(story, {'ln': '1'}, chain,
+                                      command_conf)
+    assert ret == 'foo'
+    hedge = story.app.hedges[('alpine', 'echo')]
+    HttpUtils.fetch_hedged.mock.assert_called_with(
+        3, story.logger, 'https://alpine.com/echo',
+        HttpTransport.services('https://alpine.com/echo', story.app.app_id),
+        {'method': 'GET', 'headers': {}}, hedge)
+
+
+@mark.asyncio
+async def test_services_execute_http_limited(patch, story, async_mock):
+    chain = deque([Service(name='alpine'), Command(name='echo')])
+    command_conf = {'http': {'method': 'get',
+                             'url': 'https://alpine.com/echo'}}
+    story.app.hedges = {}
+    story.app.limiter = ServiceLimiter('app_id', AppConfig({'runtime': {
+        'http': {'limits': [{'service': 'alpine', 'concurrency': 1}]}
+    }}))
+    response = HTTPResponse(HTTPRequest(url='https://alpine.com/echo'), 200,
+                            buffer=StringIO('foo'), headers={})
+    patch.object(HttpUtils, 'fetch_hedged')
+    patch.object(HttpUtils, 'fetch_with_retry',
+                 new=async_mock(return_value=response))
+
+    ret = await Services.execute_http(story, {'ln': '1'}, chain,
+                                      command_conf)
+    assert ret == 'foo'
+    # A backup request wouldn't have a turn of its own.
+    HttpUtils.fetch_hedged.assert_not_called()
+    assert story.app.hedges == {}
+    assert HttpUtils.fetch_with_retry.mock.call_count == 1
+
+
+@mark.asyncio
+async def test_services_execute_http_coalesced(patch, story, async_mock):
+    chain = deque([Service(name='alpine'), Command(name='echo')])
+    command_conf = {'http': {'method': 'get', 'coalesce': True,
+                             'url': 'https://alpine.com/echo'}}
+    story.app.flights = SingleFlight('app_id')
+    story.app.hedges = None
+    response = HTTPResponse(HTTPRequest(url='https://alpine.com/echo'), 200,
+                            buffer=StringIO('foo'), headers={})
+    patch.object(HttpUtils, 'fetch_with_retry',
+                 new=async_mock(return_value=response))
+
+    rets = await asyncio.gather(*[
+        Services.execute_http(story, {'ln': '1'}, chain, command_conf)
+        for _ in range(3)
+    ])
+    assert rets == ['foo'] * 3
+    assert HttpUtils.fetch_with_retry.mock.call_count == 1
+    assert story.app.flights.flights == {}
+
+
+@mark.parametrize('ttl,expected', [
+    (60, 60), (0.5, 0.5), (0, None), ('60', None), (True, None), (None, None)
+])
+def test_services_http_plan_cache_ttl(ttl, expected):
+    assert Services.http_plan({'http': {'cacheTtl': ttl}}).cache_ttl == \
+        expected
+
+
+@mark.asyncio
+async def test_services_execute_http_cached(patch, story, async_mock):
+    chain = deque([Service(name='alpine'), Command(name='echo')])
+    command_conf = {'http': {'method': 'get', 'cacheTtl': 60,
+                             'url': 'https://alpine.com/echo'},
+                    'output': {'type': 'any'}}
+    story.app.response_cache = ResponseCache('app_id', 1000)
+    story.app.app_config = None
+    story.app.hedges = None
+    response = HTTPResponse(HTTPRequest(url='https://alpine.com/echo'), 200,
+                            buffer=StringIO('{"a": [1]}'),
+                            headers={'Content-Type': 'application/json'})
+    patch.object(HttpUtils, 'fetch_with_retry',
+                 new=async_mock(return_value=response))
+    patch.object(ServiceOutputValidator, 'raise_if_invalid')
+
+    for _ in range(3):
+        ret = await Services.execute_http(story, {'ln': '1'}, chain,
+                                          command_conf)
+        assert ret == {'a': [1]}
+        ret['a'].append(2)
+
+    assert HttpUtils.fetch_with_retry.mock.call_count == 1
+    assert ServiceOutputValidator.raise_if_invalid.call_count == 1
+
+
+def test_services_plan_for_raw_line(story):
+    assert Services.plan_for(story, {Line.service: 'alpine'}) is None
+
+
+def test_services_plan_for_unknown_command(story):
+    story.app.services = {
+        'alpine': {ServiceConstants.config: {'actions': {}}}
+    }
+    story.tree = StoryCompiler.compile({
+        '1': {'ln': '1', Line.method: 'execute', Line.service: 'alpine',
+              Line.command: 'echo'}
+    })
+    line = story.line('1')
+
+    plan = Services.plan_for(story, line)
+    assert plan.command_conf is None and plan.http is None
+    with pytest.raises(KeyError):
+        Services.command_conf_for(story, line, plan.chain)
+
+
+def test_services_subscription_plan_for(story):
+    story.app.services = {
+        'alpine': {
+            ServiceConstants.config: {
+                'actions': {
+                    'listen': {
+                        'events': {
+                            'message': {
+                                'http': {'port': 2000,
+                                         'subscribe': {'path': '/sub'}},
+                                'arguments': {'topic': {}}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+    story.tree = StoryCompiler.compile({
+        '2': {'ln': '2', Line.method: 'when', Line.service: 'client',
+              Line.command: 'message'}
+    })
+    line = story.line('2')
+    s = StreamingService('alpine', 'listen', 'container', 'hostname')
+
+    plan = Services.subscription_plan_for(s, story, line)
+    assert (plan.port, plan.path, plan.method, plan.arguments) == \
+        (2000, '/sub', 'post', ('topic',))
+    assert Services.subscription_plan_for(s, story, line) is plan
+
+    other = Services.subscription_plan_for(s._replace(command='other'),
+                                           story, line)
+    assert (other.port, other.path, other.arguments) == (80, None, ())
+    assert line.service_plan is other
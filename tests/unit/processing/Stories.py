@@ -5,9 +5,13 @@ import pytest
 from pytest import mark
 
 from storyruntime import Metrics
+from storyruntime.AppConfig import AppConfig
 from storyruntime.Exceptions import StoryscriptError
 from storyruntime.Story import Story
+from storyruntime.compiler import StoryCompiler
+from storyruntime.enums.ExecutionEngine import ExecutionEngine
 from storyruntime.processing import Lexicon, Stories
+from storyruntime.processing.CodeGenerator import CodeGenerator, Program
 
 
 def test_stories_story(patch, app, logger):
@@ -29,6 +33,57 @@ async def test_stories_execute(patch, app, logger, story, async_mock):
                                                  story, Story.first_line())
 
 
+@mark.asyncio
+async def test_stories_execute_sync(patch, app, logger, story, async_mock):
+    story.tree = StoryCompiler.compile({
+        '1': {'ln': '1', 'method': 'set', 'next': '2'},
+        '2': {'ln': '2', 'method': 'execute'}
+    })
+    patch.object(Lexicon, 'execute_line_sync', return_value='2')
+    patch.object(Lexicon, 'execute_line', new=async_mock(return_value=None))
+    patch.object(Story, 'first_line', return_value='1')
+    story.prepare()
+    await Stories.execute(logger, story)
+    Lexicon.execute_line_sync.assert_called_once_with(logger, story,
+                                                      story.tree['1'])
+    Lexicon.execute_line.mock.assert_called_once_with(logger, story, '2')
+
+
+@mark.asyncio
+async def test_stories_execute_parallel(patch, app, logger, story,
+                                        async_mock):
+    story.tree = StoryCompiler.compile({
+        '1': {'ln': '1', 'method': 'execute', 'service': 'a', 'next': '2'},
+        '2': {'ln': '2', 'method': 'execute', 'service': 'b', 'next': '3'},
+        '3': {'ln': '3', 'method': 'execute', 'service': 'c'}
+    })
+    app.app_config = AppConfig({'runtime': {'execute': {'concurrent': True}}})
+    patch.object(Lexicon, 'execute_parallel',
+                 new=async_mock(return_value=None))
+    patch.object(Lexicon, 'execute_line', new=async_mock())
+    patch.object(Story, 'first_line', return_value='1')
+    story.prepare()
+    await Stories.execute(logger, story)
+    Lexicon.execute_parallel.mock.assert_called_once_with(
+        logger, story, ('1', '2', '3'))
+    assert Lexicon.execute_line.mock.call_count == 0
+    logger.log.assert_called_once_with('story-execution', None)
+
+
+@mark.asyncio
+async def test_stories_execute_program(patch, logger, story, async_mock):
+    program = Program(tree=story.tree, source='', execute=async_mock())
+    patch.object(CodeGenerator, 'program_for', return_value=program)
+    patch.object(Lexicon, 'execute_line', new=async_mock())
+    patch.object(story.scheduler, 'use')
+    story.prepare()
+    await Stories.execute(logger, story)
+    CodeGenerator.program_for.assert_called_with(story)
+    program.execute.mock.assert_called_once_with(logger, story)
+    story.scheduler.use.assert_called_once_with(ExecutionEngine.CODEGEN)
+    assert Lexicon.execute_line.mock.call_count == 0
+
+
 @mark.asyncio
 async def test_stories_run(patch, app, logger, async_mock, magic):
     patch.object(time, 'time')
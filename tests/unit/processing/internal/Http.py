@@ -7,12 +7,11 @@ import pytest
 from pytest import fixture, mark
 
 from storyruntime.Exceptions import StoryscriptError
+from storyruntime.HttpTransport import HttpTransport
 from storyruntime.processing.Services import Services
 from storyruntime.processing.internal import Http
 from storyruntime.utils.HttpUtils import HttpUtils
 
-from tornado.httpclient import AsyncHTTPClient
-
 
 @fixture
 def service_patch(patch):
@@ -38,7 +37,6 @@ async def test_service_http_fetch(patch, story, line, json_response,
     fetch_mock = MagicMock()
     patch.object(HttpUtils, 'fetch_with_retry',
                  new=async_mock(return_value=fetch_mock))
-    patch.object(AsyncHTTPClient, '__init__', return_value=None)
     patch.object(certifi, 'where', return_value='ca_certs.pem')
     resolved_args = {
         'url': 'https://asyncy.com',
@@ -92,7 +90,8 @@ async def test_service_http_fetch(patch, story, line, json_response,
         result = await Http.http_post(story, line, resolved_args)
         HttpUtils.fetch_with_retry.mock.assert_called_with(
             3, story.logger, resolved_args['url'],
-            AsyncHTTPClient(), client_kwargs
+            HttpTransport.services(resolved_args['url'], story.app.app_id),
+            client_kwargs
         )
         if charset == 'utf-16':
             assert result == '汉字'
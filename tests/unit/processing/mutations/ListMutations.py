@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import math
+from unittest.mock import MagicMock
+
+import pytest
+from pytest import mark
+
+from storyruntime.processing.mutations.ListMutations import ListMutations
+
+
+def mutate(operator, value, **arguments):
+    story = MagicMock()
+    story.argument_by_name = lambda mutation, name: arguments.get(name)
+    return getattr(ListMutations, operator)({}, value, story, None, operator)
+
+
+def test_unique():
+    value = [3, 1, 3, 'a', 2, 1, 'a']
+    assert mutate('unique', value) is None
+    assert value == [3, 1, 'a', 2]
+
+
+def test_unique_unhashable():
+    with pytest.raises(TypeError):
+        mutate('unique', [[1], [1]])
+
+
+def test_replace():
+    value = [1, 2, 1, 3]
+    assert mutate('replace', value, item=1, by=42) is None
+    assert value == [42, 2, 42, 3]
+
+
+@mark.parametrize('items,numpy', [
+    ([(i * 7919) % 101 - 2 ** 40 for i in range(100)], True),
+    ([((i * 7919) % 101) / 7 for i in range(100)], True),
+    ([2 ** 70, 1, 0], False),
+    ([1, 2.5, 0], False),
+    ([True, False], False),
+    ([1.0, math.nan, 0.5], False),
+    ([0.0, -0.0, 1.0], False),
+    (['b', 'a'], False)
+])
+def test_sort(patch, items, numpy):
+    patch('storyruntime.processing.mutations.ListMutations.'
+          'NUMPY_SORT_THRESHOLD', 2)
+    expected = list(items)
+    expected.sort()
+
+    value = list(items)
+    mutate('sort', value)
+    assert [(type(i), repr(i)) for i in value] == \
+        [(type(i), repr(i)) for i in expected]
+    assert (ListMutations._numeric_array(items) is not None) == numpy
+
+
+def test_sort_short(patch):
+    patch.object(ListMutations, '_numeric_array')
+    value = [3, 1, 2]
+    mutate('sort', value)
+    assert value == [1, 2, 3]
+    ListMutations._numeric_array.assert_not_called()
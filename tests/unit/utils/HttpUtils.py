@@ -5,9 +5,12 @@ from unittest.mock import MagicMock
 import pytest
 from pytest import mark
 
+from storyruntime.Hedge import Hedge
+from storyruntime.HttpTransport import CircuitOpenError, HttpPool
 from storyruntime.utils.HttpUtils import HttpUtils
 
 from tornado.httpclient import HTTPError
+from tornado.iostream import StreamClosedError
 
 
 def test_read_response_body_quietly(magic):
@@ -60,6 +63,190 @@ async def test_fetch_with_retry_fail(patch, logger, async_mock):
     assert len(fetch.mock_calls) == 10
 
 
+def client_with(*codes, error=None):
+    """
+    :return: A client, whose fetch responds with the codes, in order
+    """
+    client = MagicMock()
+    responses = iter(codes)
+
+    async def fetch(url, **kwargs):
+        res = MagicMock()
+        res.code = next(responses)
+        res.error = error
+        return res
+
+    client.fetch = MagicMock(side_effect=fetch)
+    return client
+
+
+@mark.parametrize('attempt', [1, 2, 5, 20])
+def test_backoff(attempt):
+    for _ in range(20):
+        backoff = HttpUtils.backoff(attempt)
+        assert 0 <= backoff <= min(HttpUtils.BACKOFF_CAP,
+                                   HttpUtils.BACKOFF_BASE * 2 ** attempt)
+
+
+class CurlError(HTTPError):
+    """
+    Shaped like tornado.curl_httpclient.CurlError, which can't be imported
+    without pycurl.
+    """
+
+    def __init__(self, errno, message):
+        super().__init__(599, message)
+        self.errno = errno
+
+
+@mark.parametrize('method,error,calls', [
+    ('POST', None, 1),
+    ('POST', ConnectionRefusedError(), 3),
+    ('POST', StreamClosedError(real_error=ConnectionRefusedError()), 3),
+    ('POST', StreamClosedError(), 1),
+    ('POST', CurlError(7, 'Failed to connect to alpine port 80'), 3),
+    ('POST', CurlError(28, 'Operation timed out'), 1),
+    ('PUT', None, 3),
+    ('GET', None, 3),
+])
+@mark.asyncio
+async def test_fetch_with_retry_idempotent(patch, logger, async_mock,
+                                           method, error, calls):
+    patch.object(asyncio, 'sleep', new=async_mock())
+    client = client_with(599, 599, 599, error=error)
+
+    with pytest.raises(HTTPError):
+        await HttpUtils.fetch_with_retry(3, logger, 'asyncy.com', client,
+                                         {'method': method})
+
+    assert client.fetch.call_count == calls
+
+
+@mark.asyncio
+async def test_fetch_with_retry_codes(patch, logger, async_mock):
+    patch.object(asyncio, 'sleep', new=async_mock())
+    client = client_with(503, 502, 200)
+    res = await HttpUtils.fetch_with_retry(3, logger, 'asyncy.com', client,
+                                           {})
+    assert res.code == 200
+
+    client = client_with(503, 503)
+    res = await HttpUtils.fetch_with_retry(2, logger, 'asyncy.com', client,
+                                           {})
+    assert res.code == 503
+
+    client = client_with(503)
+    res = await HttpUtils.fetch_with_retry(
+        3, logger, 'asyncy.com', client, {'method': 'POST'})
+    assert res.code == 503
+    assert client.fetch.call_count == 1
+
+
+@mark.asyncio
+async def test_fetch_with_retry_circuit_breaker(patch, logger, async_mock):
+    patch.object(asyncio, 'sleep', new=async_mock())
+    client = client_with(*[599] * 100)
+    pool = HttpPool('services', 'http://alpine', client, 10)
+    pool.budget.minimum = 1000
+
+    for _ in range(pool.breaker.min_requests // 2):
+        with pytest.raises(HTTPError):
+            await HttpUtils.fetch_with_retry(2, logger, 'http://alpine',
+                                             pool, {})
+
+    with pytest.raises(CircuitOpenError):
+        await HttpUtils.fetch_with_retry(2, logger, 'http://alpine',
+                                         pool, {})
+
+    assert client.fetch.call_count == pool.breaker.min_requests
+
+
+@mark.asyncio
+async def test_fetch_with_retry_circuit_breaker_500(logger):
+    client = client_with(*[500] * 100)
+    pool = HttpPool('services', 'http://alpine', client, 10)
+
+    # Not retried, but failures of the destination all the same.
+    for _ in range(pool.breaker.min_requests):
+        res = await HttpUtils.fetch_with_retry(2, logger, 'http://alpine',
+                                               pool, {})
+        assert res.code == 500
+
+    with pytest.raises(CircuitOpenError):
+        await HttpUtils.fetch_with_retry(2, logger, 'http://alpine',
+                                         pool, {})
+
+    assert client.fetch.call_count == pool.breaker.min_requests
+
+
+@mark.asyncio
+async def test_fetch_with_retry_budget(patch, logger, async_mock):
+    patch.object(asyncio, 'sleep', new=async_mock())
+    client = client_with(*[599] * 100)
+    pool = HttpPool('services', 'http://alpine', client, 10)
+    pool.budget.minimum = 2
+    pool.budget.ratio = 0
+
+    with pytest.raises(HTTPError):
+        await HttpUtils.fetch_with_retry(10, logger, 'http://alpine',
+                                         pool, {})
+
+    assert client.fetch.call_count == 3
+
+
+def hedge_with(delay):
+    hedge = Hedge('app_id', 'alpine', 1)
+    for _ in range(hedge.min_samples):
+        hedge.record(delay)
+        hedge.called(False)
+    return hedge
+
+
+def slow_client(*delays):
+    delays = list(delays)
+
+    async def fetch(url, **kwargs):
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return MagicMock(code=200, delay=delay)
+
+    return MagicMock(fetch=MagicMock(side_effect=fetch))
+
+
+@mark.asyncio
+async def test_fetch_hedged(logger):
+    hedge = hedge_with(0.01)
+    client = slow_client(1, 0.01)
+    res = await HttpUtils.fetch_hedged(3, logger, 'asyncy.com', client,
+                                       {}, hedge)
+    assert res.delay == 0.01
+    assert client.fetch.call_count == 2
+    assert hedge.hedged == 1
+
+
+@mark.asyncio
+async def test_fetch_hedged_fast(logger):
+    hedge = hedge_with(0.1)
+    client = slow_client(0)
+    res = await HttpUtils.fetch_hedged(3, logger, 'asyncy.com', client,
+                                       {}, hedge)
+    assert res.delay == 0
+    assert client.fetch.call_count == 1
+    assert hedge.hedged == 0
+    assert len(hedge.latencies) == hedge.min_samples + 1
+
+
+@mark.asyncio
+async def test_fetch_hedged_rate(logger):
+    hedge = hedge_with(0.01)
+    hedge.max_rate = 0
+    client = slow_client(0.05)
+    res = await HttpUtils.fetch_hedged(3, logger, 'asyncy.com', client,
+                                       {}, hedge)
+    assert res.delay == 0.05
+    assert client.fetch.call_count == 1
+
+
 def test_add_params_to_url():
     assert HttpUtils.add_params_to_url('asyncy.com', {}) == 'asyncy.com'
     assert HttpUtils.add_params_to_url('asyncy.com',
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from pytest import mark
+
+from storyruntime.utils.StringUtils import StringUtils, Truncated
+
+
+@mark.parametrize('value', [
+    'hello', 1, None, [], (), {}, ('a',), [1, 'a', None, 2.5],
+    {'a': [1, (2, 3)], 'b': {'c': 'ü'}}, {1, 2}, b'bytes'
+])
+def test_string_utils_truncate_incrementally_short(value):
+    assert StringUtils.truncate_incrementally(value, 1000) == str(value)
+
+
+@mark.parametrize('value', [
+    'a' * 1000,
+    list(range(1000)),
+    {str(i): ['x' * 10] for i in range(1000)},
+    ('é' * 1000,)
+])
+def test_string_utils_truncate_incrementally_long(value):
+    expected = str(value).encode('utf-8')[:100].decode('utf-8', 'ignore')
+    assert StringUtils.truncate_incrementally(value, 100) == \
+        f'{expected} ... (truncated)'
+
+
+def test_string_utils_truncate_incrementally_recursive():
+    value = []
+    value.append(value)
+    assert StringUtils.truncate_incrementally(value, 10) == \
+        '[[[[[[[[[[ ... (truncated)'
+
+
+def test_string_utils_truncate_incrementally_lazily():
+    class Item:
+        rendered = 0
+
+        def __repr__(self):
+            Item.rendered += 1
+            return 'item'
+
+    StringUtils.truncate_incrementally([Item() for _ in range(1000)], 20)
+    assert Item.rendered == 4
+
+
+def test_truncated():
+    truncated = Truncated(list(range(100)), 10)
+    assert str(truncated) == '[0, 1, 2,  ... (truncated)'
+    assert f'{truncated}' == str(truncated)
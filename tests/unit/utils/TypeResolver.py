@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import OrderedDict
+
+import pytest
+from pytest import mark
+
+from storyruntime.Exceptions import StoryscriptRuntimeError, \
+    TypeAssertionRuntimeError, TypeValueRuntimeError
+from storyruntime.utils.TypeResolver import CastPlan, RE_PATTERN, \
+    TypeAssertionError, TypeResolver
+from storyruntime.utils.TypeUtils import TypeUtils
+
+from storyscript.compiler.semantics.types.Types import AnyType, \
+    BooleanType, FloatType, IntType, ListType, MapType, StringType
+
+
+def type_(name, *values):
+    t = {'$OBJECT': 'type', 'type': name}
+    if values:
+        t['values'] = list(values)
+    return t
+
+
+def list_(inner):
+    return type_('List', inner)
+
+
+def map_(key, value):
+    return type_('Map', key, value)
+
+
+casts = [
+    (list_(type_('int')), [1, 2, 3]),
+    (list_(type_('int')), [1.5, '2', True]),
+    (list_(type_('int')), ['a']),
+    (list_(type_('int')), [1, None, 2]),
+    (list_(type_('int')), [[1]]),
+    (list_(type_('int')), 'not a list'),
+    (list_(type_('float')), [1, 2.5, '3']),
+    (list_(type_('boolean')), [0, 1, '']),
+    (list_(type_('string')), [True, b'bytes', 1, 'a']),
+    (list_(type_('regex')), ['a+', 1]),
+    (list_(type_('any')), [1, 'a', None, [1]]),
+    (list_(type_('any')), [1, object()]),
+    (list_(list_(type_('int'))), [[1, '2'], [], None]),
+    (map_(type_('string'), type_('int')), {'a': '1', 1: 2.5}),
+    (map_(type_('string'), list_(type_('float'))), {'a': [1, 2]}),
+    (map_(type_('int'), type_('int')), {'a': 1}),
+    (type_('int'), '12'),
+    (type_('int'), None),
+    (type_('string'), False),
+    (type_('regex'), 'a+'),
+    (type_('regex'), 12),
+    (type_('any'), {'a': 1})
+]
+
+
+def check_type_cast(type_exp, item):
+    """
+    Casts item to type_exp element by element, the way TypeResolver did
+    before it compiled casts.
+    """
+    item = TypeUtils.safe_type(item)
+
+    if item is None:
+        return None
+    elif isinstance(type_exp, ListType):
+        TypeResolver.assert_type([list], item)
+        return [check_type_cast(type_exp.inner, el) for el in item]
+    elif isinstance(type_exp, MapType):
+        TypeResolver.assert_type([dict], item)
+        obj = {}
+        for k, v in item.items():
+            key = check_type_cast(type_exp.key, k)
+            obj[key] = check_type_cast(type_exp.value, v)
+        return obj
+    elif isinstance(type_exp, BooleanType):
+        return bool(item)
+    elif isinstance(type_exp, IntType):
+        return int(item)
+    elif isinstance(type_exp, FloatType):
+        return float(item)
+    elif isinstance(type_exp, StringType):
+        if isinstance(item, bool):
+            return str(item).lower()
+        elif isinstance(item, bytes):
+            return item.decode()
+        return str(item)
+    elif isinstance(type_exp, AnyType):
+        return item
+
+    TypeResolver.assert_type([str, RE_PATTERN], item)
+    if isinstance(item, str):
+        return re.compile(item)
+    return item
+
+
+def cast_by_check(type_exp, item):
+    """
+    Casts item the way check_type_cast does, element by element.
+    """
+    t = TypeResolver.resolve_type(type_exp)
+    try:
+        return check_type_cast(t, item)
+    except (TypeError, TypeAssertionError):
+        return TypeAssertionRuntimeError
+    except (ValueError, re.error):
+        return TypeValueRuntimeError
+    except StoryscriptRuntimeError:
+        return StoryscriptRuntimeError
+
+
+@mark.parametrize('type_exp,item', casts)
+def test_type_resolver_type_cast_same_as_check_type_cast(type_exp, item):
+    expected = cast_by_check(type_exp, item)
+    if isinstance(expected, type) and issubclass(expected, Exception):
+        with pytest.raises(expected) as e:
+            TypeResolver.type_cast(item, type_exp, {})
+        assert e.type is expected
+    else:
+        actual = TypeResolver.type_cast(item, type_exp, {})
+        assert repr(actual) == repr(expected)
+
+
+def test_type_resolver_type_cast_errors():
+    with pytest.raises(TypeAssertionRuntimeError) as e:
+        TypeResolver.type_cast('not a list', list_(type_('int')), {})
+    assert 'Received not a list (str)' in e.value.message
+
+    with pytest.raises(TypeValueRuntimeError) as e:
+        TypeResolver.type_cast(['a'], list_(type_('int')), {})
+    assert 'from List[str]' in e.value.message
+    assert "`['a']`" in e.value.message
+
+
+def test_type_resolver_plan_for():
+    plan = TypeResolver.plan_for(list_(type_('int')))
+    assert isinstance(plan, CastPlan)
+    assert isinstance(plan.type, ListType)
+    assert TypeResolver.plan_for(list_(type_('int'))) is plan
+    assert TypeResolver.plan_for(list_(type_('float'))) is not plan
+
+
+def test_type_resolver_plan_for_evicts(patch):
+    patch.object(TypeResolver, '_plans', OrderedDict())
+    patch.object(TypeResolver, 'max_plans', 2)
+    plan = TypeResolver.plan_for(type_('int'))
+    TypeResolver.plan_for(type_('float'))
+    assert TypeResolver.plan_for(type_('int')) is plan
+    TypeResolver.plan_for(type_('string'))
+    assert list(TypeResolver._plans) == ['int', 'string']
+
+
+def test_type_resolver_key():
+    assert TypeResolver.key(type_('int')) == 'int'
+    assert TypeResolver.key(map_(type_('string'), list_(type_('int')))) == \
+        ('Map', 'string', ('List', 'int'))
+
+
+def test_type_resolver_cast_bulk(patch):
+    patch.object(TypeUtils, 'safe_type', side_effect=lambda item: item)
+    items = list(range(1000))
+    result = TypeResolver.type_cast(items, list_(type_('float')), {})
+    assert result == [float(i) for i in items]
+    assert all(type(i) is float for i in result)
+    # Only the list itself, and none of its items.
+    assert TypeUtils.safe_type.call_count == 1
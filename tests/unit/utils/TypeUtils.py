@@ -1,5 +1,10 @@
 from collections import namedtuple
 
+import pytest
+
+from requests.structures import CaseInsensitiveDict
+
+from storyruntime.Exceptions import StoryscriptRuntimeError
 from storyruntime.Types import InternalCommand, InternalService, \
     SafeInternalCommand, SafeStreamingService, StreamingService
 from storyruntime.utils.TypeUtils import TypeUtils
@@ -67,3 +72,33 @@ def test_safe_type_internal_command(magic):
     safe_type = TypeUtils.safe_type(command)
 
     assert isinstance(safe_type, SafeInternalCommand)
+
+
+def test_safe_type_trusted():
+    for value in ['a', 1, 1.5, True, b'a', [object()], {'a': object()}]:
+        assert TypeUtils.safe_type(value) is value
+
+
+def test_safe_type_incompatible():
+    with pytest.raises(StoryscriptRuntimeError):
+        TypeUtils.safe_type(object())
+
+
+def test_sanitize():
+    headers = CaseInsensitiveDict(data={'Content-Type': 'text/plain'})
+    service = StreamingService(name='name', command='command',
+                               container_name='container_name',
+                               hostname='hostname')
+    value = {'a': [1, {'b': service}], 'headers': headers, 'c': None}
+
+    assert TypeUtils.sanitize(value) is value
+    assert isinstance(value['a'][1]['b'], SafeStreamingService)
+    assert value['headers'] is headers
+    assert value['headers']['content-type'] == 'text/plain'
+    assert value['c'] is None
+    assert TypeUtils.sanitize('a') == 'a'
+
+
+def test_sanitize_incompatible():
+    with pytest.raises(StoryscriptRuntimeError):
+        TypeUtils.sanitize({'a': [1, object()]})